@@ -0,0 +1,136 @@
+"""Async versions of the read-heavy public pages, routed in place of the sync ones when ASYNC_VIEWS is set.
+
+Queries go through the async ORM and independent ones are awaited
+together. Templates still render in the sync thread, because they
+follow relations lazily (authors, speakers, cached fragments). Form posts
+are handed to the sync views, which own the write paths.
+
+webinar_attendance has no sync twin and is always routed.
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.http import Http404, JsonResponse
+from django.shortcuts import render
+
+from . import attendance, registrations, views
+from .cache import agroup_versions, cache_response, comments_group
+from .conditional import conditional_get
+from .decorators import async_login_required, query_budget
+from .images import warm_profile
+from .models import Blog, Webinar
+from .pagination import InvalidCursor, KeysetPaginator, approximate_count
+
+LIST_PAGE_SIZE = 10
+
+arender = sync_to_async(render)
+awarm_profile = sync_to_async(warm_profile)
+
+
+async def _list(queryset):
+    return [obj async for obj in queryset]
+
+
+async def _listing(request, queryset, ordering, template, image_field):
+    """Keyset page plus approximate count, as CursorPaginationMixin gives the sync list views"""
+    paginator = KeysetPaginator(queryset, ordering, per_page=LIST_PAGE_SIZE)
+    try:
+        page, result_count = await asyncio.gather(
+            paginator.apage(request.GET.get('cursor')),
+            sync_to_async(approximate_count)(queryset),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    await awarm_profile(page.object_list, image_field, 'card')
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    return await arender(request, template, {
+        'paginator': paginator,
+        'page_obj': page,
+        'is_paginated': page.has_other_pages,
+        'object_list': page.object_list,
+        'querystring': params.urlencode(),
+        'result_count': result_count,
+    })
+
+
+@query_budget(6)
+@async_login_required(login_url='login')
+@cache_response('home')
+async def index(request):
+    posts, webinars = await asyncio.gather(
+        _list(Blog.objects.for_listing().filter(is_verified=True).order_by('-created_at')[:3]),
+        _list(Webinar.objects.for_listing().order_by('-created_at')[:3]),
+    )
+    webinars = await awarm_profile(webinars, 'featured_image', 'card')
+    return await arender(request, 'core/index.html', {'posts': posts, 'webinars': webinars})
+
+
+@query_budget(6)
+@conditional_get(views.blog_list_modified, 'blogs')
+@cache_response('blogs')
+async def blog_list(request):
+    return await _listing(request, Blog.objects.for_listing(), ('-created_at', '-id'), 'blog/index.html', 'cover')
+
+
+@query_budget(9)
+@conditional_get(views.webinar_list_modified, 'webinars')
+@cache_response('webinars')
+async def webinar_list(request):
+    return await _listing(request, views.webinar_listing(request), ('-start_datetime', '-id'), 'webinar/index.html', 'featured_image')
+
+
+@query_budget(11)
+@async_login_required(login_url='login')
+@conditional_get(views.blogpost_modified, 'blogs')
+async def blogpost(request, pk):
+    if request.method == 'POST':
+        return await sync_to_async(views.blogpost)(request, pk)
+    try:
+        blog = await Blog.objects.aget(pk=pk)
+    except Blog.DoesNotExist:
+        raise Http404('No such post')
+    group = comments_group(blog.id)
+    related_posts, versions = await asyncio.gather(
+        sync_to_async(lambda: list(blog.get_related_blogs()))(),
+        agroup_versions(group),
+    )
+    return await arender(request, 'blog/post.html', views.blogpost_context(blog, related_posts, versions))
+
+
+@query_budget(14)
+@async_login_required(login_url='login')
+@conditional_get(views.webinar_modified, 'webinars')
+async def webinar_detail(request, pk):
+    if request.method == 'POST':
+        return await sync_to_async(views.webinar_detail)(request, pk)
+    try:
+        webinar = await Webinar.objects.aget(pk=pk)
+    except Webinar.DoesNotExist:
+        raise Http404('No such webinar')
+    registered, versions = await asyncio.gather(
+        sync_to_async(registrations.registered_webinars)(request.user),
+        agroup_versions('webinars'),
+    )
+    context = views.webinar_detail_context(webinar, registered.get(webinar.pk), versions)
+    return await arender(request, 'webinar/details.html', context)
+
+
+@query_budget(4)
+@async_login_required(login_url='login')
+async def webinar_attendance(request, pk):
+    """Join, heartbeat and leave pings (POST ``event``) from a live webinar's page; GET reads the live count.
+
+    Pings only touch the cache and an in-process buffer; the database
+    sees one bulk UPDATE per flush interval however large the audience.
+    """
+    if request.method not in ('GET', 'POST'):
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if request.method == 'POST':
+        error = await sync_to_async(attendance.ping)(pk, request.user, request.POST.get('event'))
+        if error:
+            return JsonResponse({'error': error}, status=400)
+    return JsonResponse({
+        'attendees': await sync_to_async(attendance.attendee_count)(pk),
+        'heartbeat': attendance.HEARTBEAT_INTERVAL,
+    })
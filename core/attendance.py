@@ -0,0 +1,218 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .counters import SEAT_STATUSES
+from .lru import LRUCache
+from .models import Webinar, WebinarRegistration
+from .registrations import registered_webinars
+
+logger = logging.getLogger(__name__)
+
+# Seconds between a browser's heartbeats; presence is counted per interval
+HEARTBEAT_INTERVAL = getattr(settings, 'ATTENDANCE_HEARTBEAT_INTERVAL', 30)
+# Seconds buffered events wait before they are written in one bulk UPDATE
+FLUSH_INTERVAL = getattr(settings, 'ATTENDANCE_FLUSH_INTERVAL', 15)
+FLUSH_BATCH_SIZE = 500
+# Seconds a webinar's live state is trusted from the cache
+LIVE_CHECK_TIMEOUT = 30
+
+EVENTS = ('join', 'heartbeat', 'leave')
+
+# (webinar_id, user_id) -> [first seen, last seen], both epoch seconds
+_buffer = {}
+_lock = threading.Lock()
+_timer = None
+# (webinar_id, user_id) -> registration pk, so steady-state flushes skip the lookup
+_registration_ids = LRUCache(50_000)
+
+
+def _slot(now):
+    return int(now // HEARTBEAT_INTERVAL)
+
+
+def _count_key(webinar_id, slot):
+    return f'attendance:{webinar_id}:{slot}:count'
+
+
+def _seen_key(webinar_id, user_id, slot):
+    return f'attendance:{webinar_id}:{slot}:{user_id}'
+
+
+def _live_key(webinar_id):
+    return f'attendance:{webinar_id}:live'
+
+
+def is_live(webinar_id):
+    """Webinar.is_live() for one id, cached briefly so pings don't each read the row"""
+    key = _live_key(webinar_id)
+    live = cache.get(key)
+    if live is None:
+        webinar = Webinar.objects.filter(pk=webinar_id).only('status', 'start_datetime', 'duration').first()
+        live = webinar is not None and webinar.is_live()
+        cache.set(key, live, LIVE_CHECK_TIMEOUT)
+    return live
+
+
+def forget_live(*webinar_ids):
+    """Drop cached live states after a status change that skipped signals"""
+    cache.delete_many([_live_key(webinar_id) for webinar_id in webinar_ids])
+
+
+def can_attend(status):
+    return status in SEAT_STATUSES
+
+
+def _mark_present(webinar_id, user_id, slot):
+    # add() only succeeds once per user and interval, so the counter counts people, not pings
+    if cache.add(_seen_key(webinar_id, user_id, slot), 1, HEARTBEAT_INTERVAL * 3):
+        key = _count_key(webinar_id, slot)
+        cache.add(key, 0, HEARTBEAT_INTERVAL * 3)
+        cache.incr(key)
+
+
+def _mark_absent(webinar_id, user_id, slot):
+    if cache.delete(_seen_key(webinar_id, user_id, slot)):
+        try:
+            cache.decr(_count_key(webinar_id, slot))
+        except ValueError:
+            pass
+
+
+def record(webinar_id, user_id, event, now=None):
+    """Buffer one join/heartbeat/leave and update the live presence count.
+
+    Nothing is written to the database here: events fold into one entry
+    per attendee, and a timer writes the buffer out every FLUSH_INTERVAL.
+    """
+    now = now or time.time()
+    slot = _slot(now)
+    if event == 'leave':
+        _mark_absent(webinar_id, user_id, slot)
+    else:
+        _mark_present(webinar_id, user_id, slot)
+
+    with _lock:
+        seen = _buffer.get((webinar_id, user_id))
+        if seen is None:
+            _buffer[(webinar_id, user_id)] = [now, now]
+        else:
+            seen[1] = now
+        _schedule_flush()
+
+
+def ping(webinar_id, user, event):
+    """Check and record one event from the webinar page; returns an error message or None"""
+    if event not in EVENTS:
+        return 'Unknown event'
+    if not can_attend(registered_webinars(user).get(webinar_id)):
+        return 'You are not registered for this webinar'
+    if not is_live(webinar_id):
+        return 'This webinar is not live'
+    record(webinar_id, user.pk, event)
+    return None
+
+
+def attendee_count(webinar_id, now=None):
+    """People present now, from the shared cache rather than the database.
+
+    A heartbeat lands somewhere in each interval, so the current interval
+    fills up as it goes; the previous one is complete. The larger of the
+    two is at most one interval behind.
+    """
+    slot = _slot(now or time.time())
+    counts = cache.get_many([_count_key(webinar_id, slot), _count_key(webinar_id, slot - 1)])
+    return max(counts.values(), default=0)
+
+
+def _schedule_flush():
+    global _timer
+    if _timer is None:
+        _timer = threading.Timer(FLUSH_INTERVAL, _timed_flush)
+        _timer.daemon = True
+        _timer.start()
+
+
+def _timed_flush():
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        flush()
+    except Exception:
+        logger.exception("Attendance flush failed")
+    finally:
+        # The timer thread opened its own connection; don't leave it behind
+        connections.close_all()
+
+
+# Write out whatever the last interval buffered when the worker shuts down
+atexit.register(_timed_flush)
+
+
+def _registration_pks(pairs):
+    known = {pair: _registration_ids.get(pair) for pair in pairs}
+    missing = [pair for pair, pk in known.items() if pk is None]
+    by_webinar = {}
+    for webinar_id, user_id in missing:
+        by_webinar.setdefault(webinar_id, []).append(user_id)
+    for webinar_id, user_ids in by_webinar.items():
+        rows = WebinarRegistration.objects.filter(webinar_id=webinar_id, user_id__in=user_ids).values_list('user_id', 'pk')
+        for user_id, pk in rows:
+            _registration_ids.set((webinar_id, user_id), pk)
+            known[(webinar_id, user_id)] = pk
+    return known
+
+
+def _restore(pending):
+    # Put a failed interval back so the next flush retries it alongside newer events
+    with _lock:
+        for pair, (first, last) in pending.items():
+            seen = _buffer.setdefault(pair, [first, last])
+            seen[0], seen[1] = min(seen[0], first), max(seen[1], last)
+        _schedule_flush()
+
+
+def _write(pending):
+    pks = _registration_pks(list(pending))
+    registrations = []
+    for pair, (first, last) in pending.items():
+        if pks.get(pair) is None:
+            continue
+        joined = Value(datetime.fromtimestamp(first, dt_timezone.utc))
+        left = Value(datetime.fromtimestamp(last, dt_timezone.utc))
+        registration = WebinarRegistration(pk=pks[pair])
+        registration.joined_at = Least(Coalesce(F('joined_at'), joined), joined)
+        registration.left_at = Greatest(Coalesce(F('left_at'), left), left)
+        registrations.append(registration)
+    WebinarRegistration.objects.bulk_update(registrations, ['joined_at', 'left_at'], batch_size=FLUSH_BATCH_SIZE)
+    return len(registrations)
+
+
+def flush():
+    """Write buffered attendance with one bulk UPDATE per batch.
+
+    ``joined_at`` keeps the earliest time seen and ``left_at`` the latest,
+    merged in SQL, so workers flushing the same attendee never move either
+    one backwards. A failed write goes back into the buffer for the next
+    flush. Returns the number of registrations written.
+    """
+    with _lock:
+        pending = dict(_buffer)
+        _buffer.clear()
+    if not pending:
+        return 0
+
+    try:
+        return _write(pending)
+    except Exception:
+        _restore(pending)
+        raise
@@ -0,0 +1,154 @@
+import hashlib
+from collections import defaultdict
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+from django.utils import timezone
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60 * 15)
+
+# model -> cache groups (names or callables taking the instance) to purge on write
+_registry = defaultdict(list)
+
+
+def _generation_key(group):
+    return f'cache-gen:{group}'
+
+
+def _modified_key(group):
+    return f'cache-modified:{group}'
+
+
+def comments_group(blog_id):
+    return f'blog:{blog_id}:comments'
+
+
+def group_versions(*groups):
+    """Current generation of each cache group; bumping a generation orphans its keys"""
+    keys = {_generation_key(group): group for group in groups}
+    found = cache.get_many(keys)
+    return {group: found.get(key, 1) for key, group in keys.items()}
+
+
+async def agroup_versions(*groups):
+    keys = {_generation_key(group): group for group in groups}
+    found = await cache.aget_many(keys)
+    return {group: found.get(key, 1) for key, group in keys.items()}
+
+
+def group_modified(*groups):
+    """When any of ``groups`` was last bumped, for Last-Modified without scanning the tables behind them"""
+    keys = [_modified_key(group) for group in groups]
+    found = cache.get_many(keys)
+    now = timezone.now()
+    for key in set(keys) - found.keys():
+        # Nothing recorded since the cache was emptied: start from now, so clients revalidate once
+        found[key] = now if cache.add(key, now, None) else cache.get(key, now)
+    return max(found.values())
+
+
+def bump(*groups):
+    if groups:
+        cache.set_many({_modified_key(group): timezone.now() for group in groups}, None)
+    for group in groups:
+        key = _generation_key(group)
+        # add() only succeeds for a fresh key; otherwise incr the existing generation
+        if not cache.add(key, 2, None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, 2, None)
+
+
+def _purge(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    bump(*[group(instance) if callable(group) else group for group in _registry[sender]])
+
+
+def purge(model):
+    """Bump ``model``'s named groups after a write that skips signals, e.g. QuerySet.update()"""
+    bump(*[group for group in _registry[model] if not callable(group)])
+
+
+def register(model, *groups):
+    """Purge the given cache groups whenever an instance of ``model`` is saved or deleted"""
+    _registry[model].extend(groups)
+    post_save.connect(_purge, sender=model, dispatch_uid=f'cache-purge-{model._meta.label}')
+    post_delete.connect(_purge, sender=model, dispatch_uid=f'cache-purge-{model._meta.label}')
+
+
+def cache_key(*parts):
+    return hashlib.md5(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _page_key(request, authenticated, groups, versions):
+    return 'page:' + cache_key(
+        request.get_full_path(),
+        authenticated,
+        *(f'{group}.{versions[group]}' for group in groups),
+    )
+
+
+def _cached_response(cached):
+    content, content_type = cached
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _cacheable(response):
+    return response.status_code == 200 and not response.streaming and not response.cookies
+
+
+def cache_response(*groups, timeout=None):
+    """Cache a whole GET response, keyed on the URL, auth state and group generations.
+
+    Only use on pages whose output doesn't depend on the user beyond
+    being logged in: no forms (CSRF tokens), messages or per-user data.
+    Async views get an async wrapper that uses the cache's async API.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method != 'GET':
+                    return await view_func(request, *args, **kwargs)
+
+                # The lazy user loads the session synchronously
+                authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+                key = _page_key(request, authenticated, groups, await agroup_versions(*groups))
+                cached = await cache.aget(key)
+                if cached is not None:
+                    return _cached_response(cached)
+
+                response = await view_func(request, *args, **kwargs)
+                if hasattr(response, 'render') and callable(response.render):
+                    response = await sync_to_async(response.render)()
+                if _cacheable(response):
+                    await cache.aset(key, (response.content, response['Content-Type']), timeout or PAGE_CACHE_TIMEOUT)
+                return response
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view_func(request, *args, **kwargs)
+
+            key = _page_key(request, request.user.is_authenticated, groups, group_versions(*groups))
+            cached = cache.get(key)
+            if cached is not None:
+                return _cached_response(cached)
+
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            if _cacheable(response):
+                cache.set(key, (response.content, response['Content-Type']), timeout or PAGE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
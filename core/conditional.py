@@ -0,0 +1,88 @@
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.contrib.messages import get_messages
+from django.db.models import Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .cache import group_versions
+
+
+def latest_update(*querysets):
+    """Newest updated_at across the given querysets, or None when they are all empty"""
+    stamps = [queryset.aggregate(latest=Max('updated_at'))['latest'] for queryset in querysets]
+    stamps = [stamp for stamp in stamps if stamp is not None]
+    return max(stamps) if stamps else None
+
+
+def _etag(request, modified, groups):
+    versions = group_versions(*groups)
+    parts = [request.path, modified.isoformat(), str(request.user.pk)]
+    parts += [f'{group}.{versions[group]}' for group in groups]
+    return quote_etag(hashlib.md5(':'.join(parts).encode()).hexdigest())
+
+
+def _set_validators(request, response, etag, modified):
+    response['ETag'] = etag
+    if not request.user.is_authenticated:
+        response['Last-Modified'] = http_date(modified.timestamp())
+    patch_vary_headers(response, ('Cookie',))
+    patch_cache_control(response, no_cache=True, private=request.user.is_authenticated)
+    return response
+
+
+def _not_modified(request, last_modified, groups, args, kwargs):
+    """``(304 response or None, etag, modified)``; no etag when the page must render unconditionally"""
+    # Pending flash messages have to be rendered, so never short-circuit them
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return None, None, None
+
+    modified = last_modified(request, *args, **kwargs)
+    if modified is None:
+        return None, None, None
+
+    etag = _etag(request, modified, groups)
+    timestamp = None if request.user.is_authenticated else int(modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        response = _set_validators(request, response, etag, modified)
+    return response, etag, modified
+
+
+def conditional_get(last_modified, *groups):
+    """Answer GET/HEAD with 304 Not Modified before the view renders anything.
+
+    ``last_modified(request, *args, **kwargs)`` returns the newest
+    ``updated_at`` behind the page, or for listings when its cache groups
+    last changed (cache.group_modified()). The ETag also covers the user and the
+    generations of ``groups``, which catch deletes that don't move
+    ``updated_at``. Logged-in responses carry only the ETag, so a
+    Last-Modified date can never hand one user another user's page.
+    For async views the check runs in one hop to the sync thread.
+    """
+    def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                not_modified, etag, modified = await sync_to_async(_not_modified)(request, last_modified, groups, args, kwargs)
+                if not_modified is not None:
+                    return not_modified
+                response = await view_func(request, *args, **kwargs)
+                if etag and response.status_code == 200:
+                    _set_validators(request, response, etag, modified)
+                return response
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            not_modified, etag, modified = _not_modified(request, last_modified, groups, args, kwargs)
+            if not_modified is not None:
+                return not_modified
+            response = view_func(request, *args, **kwargs)
+            if etag and response.status_code == 200:
+                _set_validators(request, response, etag, modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,59 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Blog, Comment, Webinar, WebinarRegistration
+
+# Per-status counter column on Webinar for each WebinarRegistration status
+STATUS_COUNTERS = {
+    'pending': 'pending_count',
+    'confirmed': 'confirmed_count',
+    'cancelled': 'cancelled_count',
+    'waitlisted': 'waitlist_count',
+}
+# Statuses that hold one of a webinar's seats
+SEAT_STATUSES = ('pending', 'confirmed')
+
+
+def _shift(field, delta):
+    # Never let a counter go negative if it has already drifted
+    return Greatest(F(field) + delta, Value(0))
+
+
+def adjust_comment_count(blog_id, delta):
+    Blog.objects.filter(pk=blog_id).update(comment_count=_shift('comment_count', delta))
+
+
+def adjust_registration_counts(webinar_id, total=0, statuses=None):
+    """Apply deltas to a webinar's counters in a single UPDATE.
+
+    ``statuses`` maps registration statuses to deltas, e.g.
+    ``{'pending': -1, 'confirmed': 1}`` for an approval.
+    """
+    updates = {}
+    if total:
+        updates['registration_count'] = _shift('registration_count', total)
+    for status, delta in (statuses or {}).items():
+        field = STATUS_COUNTERS.get(status)
+        if field and delta:
+            updates[field] = _shift(field, delta)
+    if updates:
+        Webinar.objects.filter(pk=webinar_id).update(**updates)
+
+
+def _count_subquery(queryset, fk):
+    counts = queryset.filter(**{fk: OuterRef('pk')}).order_by().values(fk).annotate(n=Count('pk')).values('n')
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def rebuild_blog_counters(queryset=None):
+    queryset = Blog.objects.all() if queryset is None else queryset
+    return queryset.update(comment_count=_count_subquery(Comment.objects.all(), 'blog'))
+
+
+def rebuild_webinar_counters(queryset=None):
+    queryset = Webinar.objects.all() if queryset is None else queryset
+    registrations = WebinarRegistration.objects.all()
+    updates = {'registration_count': _count_subquery(registrations, 'webinar')}
+    for status, field in STATUS_COUNTERS.items():
+        updates[field] = _count_subquery(registrations.filter(status=status), 'webinar')
+    return queryset.update(**updates)
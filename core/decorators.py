@@ -0,0 +1,29 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import resolve_url
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of queries a view may run per request"""
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+def async_login_required(login_url):
+    """login_required for async views (Django 4.2's only wraps sync ones).
+
+    The lazy ``request.user`` loads the session and user synchronously, so
+    it is resolved once in the sync thread; later reads are plain attributes.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if not await sync_to_async(lambda: request.user.is_authenticated)():
+                return redirect_to_login(request.get_full_path(), resolve_url(login_url))
+            return await view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
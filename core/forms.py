@@ -2,11 +2,39 @@ from django import forms
 from .models import *
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit, Layout, Field, Div
+from cloudinary import CloudinaryResource
+from cloudinary.forms import CloudinaryFileField
+from .images import profile_url
+
+
+class CurrentImage:
+    """A stored image as file inputs show it, linked through core.images rather than the resource's own .url"""
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.name = str(resource)
+
+    @property
+    def url(self):
+        return profile_url(self.resource, 'hero')
+
+    def __str__(self):
+        return self.name
+
+
+class ImageFormField(CloudinaryFileField):
+    """CloudinaryFileField whose current value renders with the local image renderer too"""
+
+    def prepare_value(self, value):
+        if isinstance(value, CloudinaryResource) and value:
+            return CurrentImage(value)
+        return value
 
 class CreateNewPost(forms.ModelForm):
     class Meta:
         model = Blog
         fields = ['title', 'author', 'snippet', 'body', 'cover', 'status', 'is_verified']
+        field_classes = {'cover': ImageFormField}
         widgets = {
             'title': forms.TextInput(attrs={'class':'form-control'}),
             'author': forms.TextInput(attrs={'value':'', 'id':'blogger', 'type':'hidden'}),
@@ -17,6 +45,7 @@ class UpdatePost(forms.ModelForm):
     class Meta:
         model = Blog
         fields = ['title', 'author', 'snippet', 'body', 'cover', 'status', 'is_verified']
+        field_classes = {'cover': ImageFormField}
         widgets = {
             'title': forms.TextInput(attrs={'class':'form-control'}),
             'author': forms.TextInput(attrs={'value':'', 'id':'blogger', 'type':'hidden'}),
@@ -41,12 +70,14 @@ class CreateWebinar(forms.ModelForm):
             'start_datetime',
             'duration',
             'price',
+            'capacity',
             'is_featured',
             'host',
             'speakers',
             'meeting_url',
             'recording_url',
         ]
+        field_classes = {'featured_image': ImageFormField}
 
 class WebinarRegistrationForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,226 @@
+import hashlib
+import json
+from io import BytesIO
+
+import cloudinary
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .lru import LRUCache
+
+IMAGE_URL_CACHE_SIZE = getattr(settings, 'IMAGE_URL_CACHE_SIZE', 4096)
+IMAGE_URL_CACHE_TIMEOUT = getattr(settings, 'IMAGE_URL_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+
+_urls = LRUCache(IMAGE_URL_CACHE_SIZE)
+
+
+def url_key(resource, options):
+    """Cache key for one image variant.
+
+    The key covers the resource's type, version, public_id and format plus
+    the transformation, so replacing an upload changes the key and a stale
+    URL can never be served; old entries simply age out.
+    """
+    identity = resource.get_prep_value()
+    transformation = json.dumps(options, sort_keys=True, default=str)
+    raw = f'{cloudinary.config().cloud_name}:{identity}:{transformation}'
+    return 'image-url:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def _variant(resource, options):
+    # No options means the field's own default transformation, as resource.url does
+    return options if options else resource.url_options
+
+
+def image_url(resource, **options):
+    """Memoized ``resource.build_url(**options)``; '' for an empty field"""
+    if not resource:
+        return ''
+    options = _variant(resource, options)
+    key = url_key(resource, options)
+    url = _urls.get(key)
+    if url is None:
+        url = cache.get(key)
+        if url is None:
+            url = resource.build_url(**options)
+            cache.set(key, url, IMAGE_URL_CACHE_TIMEOUT)
+        _urls.set(key, url)
+    return url
+
+
+def image_urls(requests):
+    """Build many URLs at once from ``(resource, options)`` pairs.
+
+    Misses in the process LRU are fetched from the shared cache with a
+    single get_many, and whatever is still missing is built and stored
+    with a single set_many. Returns URLs in the order given.
+    """
+    keyed = []
+    for resource, options in requests:
+        if resource:
+            options = _variant(resource, options)
+            keyed.append((url_key(resource, options), resource, options))
+        else:
+            keyed.append((None, None, None))
+
+    found = {}
+    missing = set()
+    for key, _, _ in keyed:
+        if key is not None:
+            url = _urls.get(key)
+            if url is None:
+                missing.add(key)
+            else:
+                found[key] = url
+
+    if missing:
+        shared = cache.get_many(list(missing))
+        built = {}
+        for key, resource, options in keyed:
+            if key in missing and key not in shared and key not in built:
+                built[key] = resource.build_url(**options)
+        if built:
+            cache.set_many(built, IMAGE_URL_CACHE_TIMEOUT)
+        for key, url in {**shared, **built}.items():
+            _urls.set(key, url)
+            found[key] = url
+
+    return [found[key] if key is not None else '' for key, _, _ in keyed]
+
+
+def warm_image_urls(objects, field, *variants):
+    """Build every variant of ``field`` for a page of objects in one pass.
+
+    ``variants`` are build_url option dicts; with none given, the field's
+    default URL is warmed. Later image_url() calls in templates then hit
+    the process LRU.
+    """
+    variants = variants or ({},)
+    image_urls([(getattr(obj, field), variant) for obj in objects for variant in variants])
+    return objects
+
+
+class ImageProfile:
+    """A named set of width breakpoints rendered at one aspect ratio"""
+
+    def __init__(self, name, widths, aspect=None, sizes='100vw', crop='fill', gravity='auto'):
+        self.name = name
+        self.widths = tuple(sorted(widths))
+        self.aspect = aspect
+        self.sizes = sizes
+        self.crop = crop
+        self.gravity = gravity
+
+    def height_for(self, width):
+        return round(width / self.aspect) if self.aspect else None
+
+    def options(self, width):
+        """Cloudinary transformation for one breakpoint"""
+        options = {'width': width, 'crop': self.crop, 'quality': 'auto', 'fetch_format': 'auto'}
+        if self.aspect:
+            options['height'] = self.height_for(width)
+        if self.gravity:
+            options['gravity'] = self.gravity
+        return options
+
+    @property
+    def variants(self):
+        return [self.options(width) for width in self.widths]
+
+    @property
+    def default_width(self):
+        # Middle breakpoint for the plain src attribute of browsers without srcset
+        return self.widths[len(self.widths) // 2]
+
+
+PROFILES = {}
+
+
+def register_profile(name, widths, **kwargs):
+    PROFILES[name] = ImageProfile(name, widths, **kwargs)
+    return PROFILES[name]
+
+
+register_profile('card', (320, 480, 640, 800), aspect=16 / 9,
+                 sizes='(max-width: 600px) 100vw, (max-width: 1024px) 50vw, 400px')
+register_profile('hero', (640, 960, 1280, 1600, 1920), aspect=16 / 9, sizes='100vw')
+register_profile('avatar', (64, 128, 256), aspect=1, sizes='128px', gravity='face')
+register_profile('dashboard-table', (80, 160, 320), aspect=16 / 9, sizes='160px')
+
+
+def use_cloudinary():
+    renderer = getattr(settings, 'IMAGE_RENDERER', None)
+    if renderer:
+        return renderer == 'cloudinary'
+    return bool(cloudinary.config().cloud_name)
+
+
+def _local_name(source, width, height):
+    if isinstance(source, cloudinary.CloudinaryResource):
+        identity = source.get_prep_value()
+    else:
+        identity = source.name
+    digest = hashlib.md5(identity.encode()).hexdigest()
+    return f'derivatives/{digest[:2]}/{digest}/{width}x{height or "auto"}.webp'
+
+
+def render_local(source, width, height=None):
+    """Render one derivative with Pillow into MEDIA_ROOT and return its URL.
+
+    Local files (ImageField) are resized; Cloudinary resources can't be
+    fetched offline, so they get a placeholder of the right dimensions.
+    Derivatives are written once and reused.
+    """
+    name = _local_name(source, width, height)
+    key = 'image-local:' + name
+    url = _urls.get(key)
+    if url is not None:
+        return url
+
+    if not default_storage.exists(name):
+        if isinstance(source, cloudinary.CloudinaryResource):
+            image = Image.new('RGB', (width, height or width), (26, 58, 31))
+        else:
+            with source.open('rb') as handle:
+                image = ImageOps.exif_transpose(Image.open(handle))
+                image.load()
+            if height:
+                image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            else:
+                image.thumbnail((width, width * 10), Image.LANCZOS)
+        buffer = BytesIO()
+        image.convert('RGB').save(buffer, 'WEBP', quality=80)
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    url = default_storage.url(name)
+    _urls.set(key, url)
+    return url
+
+
+def srcset(source, profile):
+    """``[(url, width), ...]`` for every breakpoint of ``profile``"""
+    profile = PROFILES[profile] if isinstance(profile, str) else profile
+    if not source:
+        return []
+    if isinstance(source, cloudinary.CloudinaryResource) and use_cloudinary():
+        urls = image_urls([(source, profile.options(width)) for width in profile.widths])
+    else:
+        urls = [render_local(source, width, profile.height_for(width)) for width in profile.widths]
+    return list(zip(urls, profile.widths))
+
+
+def profile_url(source, profile):
+    """One URL of ``profile`` at its default width, for CSS backgrounds and links; '' for an empty field"""
+    profile = PROFILES[profile] if isinstance(profile, str) else profile
+    urls = dict((width, url) for url, width in srcset(source, profile))
+    return urls.get(profile.default_width, '')
+
+
+def warm_profile(objects, field, profile):
+    """Prebuild the srcset of ``field`` for a page of objects in one pass"""
+    if use_cloudinary():
+        warm_image_urls(objects, field, *PROFILES[profile].variants)
+    return objects
@@ -0,0 +1,52 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from core import schedule
+
+
+class Command(BaseCommand):
+    help = "Move webinars from upcoming to live to completed as their start and end times pass"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=schedule.CHUNK_SIZE,
+            help="Rows updated per statement, to keep locks short on large tables",
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help="Keep running, waking at the next start or end time",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=60,
+            help="Longest wait between passes with --loop, so newly scheduled webinars are picked up",
+        )
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            moved = schedule.advance(chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f"{moved['live']} live, {moved['completed']} completed"))
+            return
+
+        stopping = []
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        totals = {'live': 0, 'completed': 0}
+        try:
+            while not stopping:
+                close_old_connections()
+                moved = schedule.advance(chunk_size=options['chunk_size'])
+                for status, count in moved.items():
+                    totals[status] += count
+                if any(moved.values()):
+                    self.stdout.write(f"{timezone.now():%Y-%m-%d %H:%M:%S} {moved['live']} live, {moved['completed']} completed")
+                due = schedule.next_transition()
+                wait = options['interval']
+                if due is not None:
+                    wait = min(wait, max((due - timezone.now()).total_seconds(), 0) + 1)
+                time.sleep(wait)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"{totals['live']} live, {totals['completed']} completed"))
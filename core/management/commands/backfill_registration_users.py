@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef, Subquery
+
+from core.models import User, WebinarRegistration
+from core.registrations import forget_registered_webinars
+
+
+class Command(BaseCommand):
+    help = "Link webinar registrations made before accounts were tracked to the users who own their emails"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help="Rows updated per statement, to keep locks short on large tables",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        owners = User.objects.filter(email=OuterRef('email')).order_by('pk')
+        unlinked = WebinarRegistration.objects.filter(Exists(owners), user__isnull=True)
+        linked = 0
+        last_pk = 0
+        while True:
+            pks = list(unlinked.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            chunk = unlinked.filter(pk__gte=pks[0], pk__lte=pks[-1])
+            linked += chunk.update(user=Subquery(owners.values('pk')[:1]))
+            forget_registered_webinars(*set(
+                WebinarRegistration.objects.filter(pk__in=pks).values_list('user_id', flat=True)
+            ))
+            last_pk = pks[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Linked {linked} registrations to their users"))
@@ -0,0 +1,181 @@
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+
+MODES = ('wsgi', 'asgi')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare throughput of the public pages under concurrent load: sync views on the WSGI "
+        "handler against core.async_views on the ASGI handler, in-process and without a network"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=MODES + ('both',), default='both',
+            help="Handler to load; 'both' runs each in a subprocess with ASYNC_VIEWS set to match",
+        )
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help="Page to request, repeatable (default: /, /blog/, /webinar/)",
+        )
+        parser.add_argument('--requests', type=int, default=600, help="Requests per mode")
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help="Requests in flight at once: threads for WSGI, tasks for ASGI",
+        )
+        parser.add_argument(
+            '--user',
+            help="Username to sign in as (default: the first superuser)",
+        )
+        parser.add_argument(
+            '--page-cache', action='store_true',
+            help="Let the page cache answer repeats instead of busting it with a unique query string",
+        )
+        parser.add_argument('--json', action='store_true', help="Print the results as JSON")
+
+    def handle(self, *args, **options):
+        options['paths'] = options['paths'] or ['/', '/blog/', '/webinar/']
+        if options['mode'] == 'both':
+            results = [self.run_subprocess(mode, options) for mode in MODES]
+        else:
+            results = [self.run(options['mode'], options)]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+        self.stdout.write(f"{'mode':<6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for result in results:
+            self.stdout.write(
+                f"{result['mode']:<6}{result['rps']:>10.1f}{result['p50']:>10.1f}"
+                f"{result['p95']:>10.1f}{result['p99']:>10.1f}{result['errors']:>8}"
+            )
+        if len(results) == 2 and results[0]['rps']:
+            self.stdout.write(self.style.SUCCESS(f"ASGI/WSGI throughput: {results[1]['rps'] / results[0]['rps']:.2f}x"))
+
+    def run_subprocess(self, mode, options):
+        command = [
+            sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'benchmark_views',
+            '--mode', mode, '--requests', str(options['requests']),
+            '--concurrency', str(options['concurrency']), '--json',
+        ]
+        for path in options['paths']:
+            command += ['--path', path]
+        if options['user']:
+            command += ['--user', options['user']]
+        if options['page_cache']:
+            command.append('--page-cache')
+        env = {**os.environ, 'ASYNC_VIEWS': '1' if mode == 'asgi' else '0'}
+        output = subprocess.run(command, env=env, capture_output=True, text=True)
+        if output.returncode:
+            raise CommandError(f"{mode} run failed:\n{output.stderr}")
+        return json.loads(output.stdout.strip().splitlines()[-1])[0]
+
+    def session_cookie(self, username):
+        users = get_user_model().objects
+        user = users.filter(username=username).first() if username else users.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError("No user to sign in as; pass --user")
+        client = Client()
+        client.force_login(user)
+        cookie = SimpleCookie()
+        cookie[settings.SESSION_COOKIE_NAME] = client.cookies[settings.SESSION_COOKIE_NAME].value
+        return cookie.output(header='', sep=';').strip()
+
+    def urls(self, options):
+        paths = options['paths']
+        for n in range(options['requests']):
+            path = paths[n % len(paths)]
+            if not options['page_cache']:
+                path += ('&' if '?' in path else '?') + f'bench={n}'
+            yield path
+
+    def run(self, mode, options):
+        if settings.ASYNC_VIEWS != (mode == 'asgi'):
+            self.stderr.write(f"ASYNC_VIEWS={settings.ASYNC_VIEWS} does not match --mode {mode}")
+        cookie = self.session_cookie(options['user'])
+        urls = list(self.urls(options))
+        started = time.perf_counter()
+        if mode == 'wsgi':
+            timings = self.run_wsgi(urls, cookie, options['concurrency'])
+        else:
+            timings = asyncio.run(self.run_asgi(urls, cookie, options['concurrency']))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for latency, _ in timings)
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'mode': mode,
+            'requests': len(timings),
+            'errors': sum(1 for _, status in timings if status != 200),
+            'seconds': round(elapsed, 3),
+            'rps': len(timings) / elapsed,
+            'p50': quantiles[49] * 1000,
+            'p95': quantiles[94] * 1000,
+            'p99': quantiles[98] * 1000,
+        }
+
+    def run_wsgi(self, urls, cookie, concurrency):
+        application = get_wsgi_application()
+
+        def request(url):
+            path, _, query = url.partition('?')
+            environ = {
+                'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+                'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': 'localhost', 'HTTP_COOKIE': cookie, 'REMOTE_ADDR': '127.0.0.1',
+                'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(),
+                'wsgi.errors': sys.stderr, 'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            }
+            status = []
+            started = time.perf_counter()
+            body = application(environ, lambda code, headers, exc_info=None: status.append(int(code.split()[0])))
+            b''.join(body)
+            body.close()
+            return time.perf_counter() - started, status[0]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(request, urls))
+
+    async def run_asgi(self, urls, cookie, concurrency):
+        application = get_asgi_application()
+        slots = asyncio.Semaphore(concurrency)
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def request(url):
+            path, _, query = url.partition('?')
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+                'root_path': '', 'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+                'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            }
+            status = []
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+
+            async with slots:
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                return time.perf_counter() - started, status[0]
+
+        return await asyncio.gather(*(request(url) for url in urls))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from core.counters import rebuild_blog_counters, rebuild_webinar_counters
+from core.models import Blog, Webinar
+
+
+class Command(BaseCommand):
+    help = "Recompute stored comment and registration counters from the source tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=5000,
+            help="Rows updated per statement, to keep locks short on large tables",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        blogs = self.rebuild(Blog, rebuild_blog_counters, chunk_size)
+        webinars = self.rebuild(Webinar, rebuild_webinar_counters, chunk_size)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt counters for {blogs} blog posts and {webinars} webinars"
+        ))
+
+    def rebuild(self, model, rebuild, chunk_size):
+        updated = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size]
+            )
+            if not pks:
+                return updated
+            updated += rebuild(model.objects.filter(pk__gte=pks[0], pk__lte=pks[-1]))
+            last_pk = pks[-1]
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core import related
+
+
+class Command(BaseCommand):
+    help = "Recompute post terms and the top related posts for every published post"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Rows loaded or inserted per query",
+        )
+
+    def handle(self, *args, **options):
+        total = related.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt related posts for {total} published posts"))
@@ -0,0 +1,91 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from core import taskqueue
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks, optionally across several worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help="Worker processes to fork",
+        )
+        parser.add_argument(
+            '--batch', type=int, default=10,
+            help="Tasks claimed per query",
+        )
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help="Seconds to wait when the queue is empty",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Drain the queue once and exit",
+        )
+        parser.add_argument(
+            '--stats', action='store_true',
+            help="Print per-task counts and timings and exit",
+        )
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            for row in taskqueue.stats():
+                self.stdout.write(
+                    f"{row['name']}: {row['queued']} queued, {row['running']} running, "
+                    f"{row['done']} done, {row['failed']} failed, "
+                    f"avg {row['avg_ms'] or 0:.0f}ms, max {row['max_ms'] or 0}ms"
+                )
+            return
+
+        if options['processes'] <= 1:
+            processed = work(options['batch'], options['sleep'], options['once'])
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} tasks"))
+            return
+
+        # Children must not inherit the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        pool = [
+            context.Process(target=work, args=(options['batch'], options['sleep'], options['once']))
+            for _ in range(options['processes'])
+        ]
+        for process in pool:
+            process.start()
+
+        def stop(signum, frame):
+            for process in pool:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        try:
+            for process in pool:
+                process.join()
+        except KeyboardInterrupt:
+            stop(None, None)
+            for process in pool:
+                process.join()
+        self.stdout.write(self.style.SUCCESS(f"Stopped {len(pool)} workers"))
+
+
+def work(batch, sleep, once):
+    """Claim and run tasks until the queue is empty (``once``) or SIGTERM arrives"""
+    stopping = []
+    # Finish the task in hand before exiting
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+    worker = taskqueue.worker_id()
+    processed = 0
+    while not stopping:
+        close_old_connections()
+        count = taskqueue.run_pending(batch, worker)
+        processed += count
+        if not count:
+            if once:
+                break
+            time.sleep(sleep)
+    return processed
@@ -0,0 +1,25 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from core import notifications
+
+
+class Command(BaseCommand):
+    help = "Queue reminder emails for confirmed registrations of webinars starting soon"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=float, default=notifications.REMINDER_LEAD.total_seconds() / 3600,
+            help="Remind about webinars starting within this many hours",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help="Rows loaded and inserted per query",
+        )
+
+    def handle(self, *args, **options):
+        queued = notifications.queue_reminders(
+            lead=timedelta(hours=options['hours']), chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} reminders"))
@@ -0,0 +1,105 @@
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core import registrations
+from core.models import Webinar, WebinarRegistration
+
+
+class Command(BaseCommand):
+    help = "Fire concurrent registrations at one webinar and check that seats and counters stay consistent"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--webinar', type=int,
+            help="Existing webinar to register against (default: a temporary one)",
+        )
+        parser.add_argument(
+            '--capacity', type=int, default=50,
+            help="Capacity of the temporary webinar",
+        )
+        parser.add_argument(
+            '--attempts', type=int, default=500,
+            help="Registrations to submit",
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help="Threads submitting at once, each with its own connection",
+        )
+        parser.add_argument(
+            '--duplicates', type=float, default=0.2,
+            help="Share of attempts that reuse an email already submitted",
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help="Keep the temporary webinar and its registrations",
+        )
+
+    def handle(self, *args, **options):
+        if options['webinar']:
+            webinar = Webinar.objects.get(pk=options['webinar'])
+        else:
+            webinar = Webinar.objects.create(
+                title=f'Load test {uuid.uuid4().hex[:8]}', description='Temporary webinar for stress_registrations',
+                start_datetime=timezone.now() + timedelta(days=30), duration=60, capacity=options['capacity'],
+            )
+
+        run = uuid.uuid4().hex[:8]
+        attempts = options['attempts']
+        unique = max(1, round(attempts * (1 - options['duplicates'])))
+        emails = [f'load-{run}-{n % unique}@example.com' for n in range(attempts)]
+
+        def attempt(email):
+            try:
+                registration = WebinarRegistration(webinar_id=webinar.pk, full_name='Load Test', email=email)
+                return registrations.register(registration)[1]
+            except Exception as exc:
+                return f'error: {type(exc).__name__}: {exc}'
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            outcomes = Counter(pool.map(attempt, emails))
+        elapsed = time.perf_counter() - started
+
+        for outcome, n in sorted(outcomes.items()):
+            self.stdout.write(f"{outcome}: {n}")
+        self.stdout.write(f"{attempts} attempts in {elapsed:.2f}s ({attempts / elapsed:.0f}/s)")
+
+        problems = self.check_consistency(webinar, outcomes, unique)
+        if not options['webinar'] and not options['keep']:
+            webinar.delete()
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS("Seats, waitlist and counters are consistent"))
+
+    def check_consistency(self, webinar, outcomes, unique):
+        webinar.refresh_from_db()
+        actual = WebinarRegistration.objects.filter(webinar=webinar).aggregate(
+            total=Count('pk'),
+            seats=Count('pk', filter=Q(status__in=['pending', 'confirmed'])),
+            pending=Count('pk', filter=Q(status='pending')),
+            waitlisted=Count('pk', filter=Q(status='waitlisted')),
+        )
+        problems = []
+        if webinar.capacity is not None and actual['seats'] > webinar.capacity:
+            problems.append(f"Oversold: {actual['seats']} seats taken of {webinar.capacity}")
+        created = outcomes[registrations.REGISTERED] + outcomes[registrations.WAITLISTED]
+        if created != unique:
+            problems.append(f"{created} registrations created for {unique} distinct emails")
+        for counter, value in [
+            ('registration_count', actual['total']),
+            ('pending_count', actual['pending']),
+            ('waitlist_count', actual['waitlisted']),
+        ]:
+            if getattr(webinar, counter) != value:
+                problems.append(f"{counter} is {getattr(webinar, counter)} but {value} rows exist")
+        return problems
@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class BlogQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(status='Published', is_verified=True)
+
+    def for_listing(self):
+        """Posts with author and category joined; comment_count is stored on the row"""
+        return self.select_related('author', 'category')
+
+
+class WebinarQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Webinars with host and speakers loaded up front; counts are stored on the row"""
+        return self.select_related('host').prefetch_related('speakers')
+
+
+class WebinarRegistrationQuerySet(models.QuerySet):
+    def for_listing(self):
+        """Registrations with their webinar and its host joined in"""
+        return self.select_related('webinar', 'webinar__host')
+
+
+BlogManager = models.Manager.from_queryset(BlogQuerySet)
+WebinarManager = models.Manager.from_queryset(WebinarQuerySet)
+WebinarRegistrationManager = models.Manager.from_queryset(WebinarRegistrationQuerySet)
@@ -0,0 +1,75 @@
+import logging
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+
+from .querybudget import (
+    QueryBudgetExceeded, get_budget_setting, get_view_budget, get_view_name, record_queries,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetMiddleware:
+    """Record the queries each request runs and check them against the view's budget.
+
+    Views declare a budget with ``@query_budget(n)`` or a ``query_budget``
+    class attribute. Repeated statement shapes are reported as N+1 suspects
+    together with the template line that triggered them. Over-budget views
+    log a warning, or raise when ``QUERY_BUDGET_RAISE`` is set (tests).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not get_budget_setting('ENABLED', True):
+            return self.get_response(request)
+
+        request._query_budget = None
+        with record_queries(track_templates=get_budget_setting('TRACK_TEMPLATES', True)) as recorder:
+            response = self.get_response(request)
+
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        if not get_budget_setting('ENABLED', True):
+            return await self.get_response(request)
+
+        # Connections are per thread: hook the one the async ORM runs this request's queries on
+        request._query_budget = None
+        stack = ExitStack()
+        recorder = await sync_to_async(stack.enter_context)(
+            record_queries(track_templates=get_budget_setting('TRACK_TEMPLATES', True))
+        )
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+
+        self.check(request, recorder)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = (get_view_name(view_func), get_view_budget(view_func))
+
+    def check(self, request, recorder):
+        view_name, budget = getattr(request, '_query_budget', None) or (request.path, None)
+        request.query_recorder = recorder
+
+        if budget is not None and len(recorder) > budget:
+            message = recorder.report(view_name, budget)
+            if get_budget_setting('RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning("Query budget exceeded\n%s", message)
+        elif recorder.n_plus_one():
+            logger.warning("Possible N+1 queries\n%s", recorder.report(view_name, budget))
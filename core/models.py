@@ -8,17 +8,39 @@ from django.core.exceptions import ValidationError
 from datetime import timedelta
 from django.utils import timezone
 from cloudinary.models import CloudinaryField
+from .managers import BlogManager, WebinarManager, WebinarRegistrationManager
+from .images import image_url
+from .uploads import UploadValidator
 
 # Create your models here.
 
 class TimestampModel(models.Model):
     """Abstract base model with created and updated timestamps"""
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # Indexed so conditional GETs can read MAX(updated_at) cheaply
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     class Meta:
         abstract = True
 
+class StoredCountersMixin:
+    """Leaves the denormalised counters out of every save that updates a row.
+
+    The counters only move through F() updates (core.counters,
+    core.registrations). Writing back the copy an instance loaded would
+    undo whatever those did since, so a full save() skips them.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if not args and not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
 class Category(models.Model):
     name = models.CharField(max_length=255)
 
@@ -28,7 +50,7 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
-class Blog(TimestampModel):
+class Blog(StoredCountersMixin, TimestampModel):
     STATUS_CHOICES = [
         ('Draft', 'Draft'),
         ('Published', 'Published'),
@@ -56,6 +78,11 @@ class Blog(TimestampModel):
     body = RichTextUploadingField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     is_verified = models.BooleanField(default=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('comment_count',)
+
+    objects = BlogManager()
 
     class Meta:
         verbose_name = 'Blog Post'
@@ -64,6 +91,7 @@ class Blog(TimestampModel):
         indexes = [
             models.Index(fields=['status', 'created_at']),
             models.Index(fields=['is_verified', 'status']),
+            models.Index(fields=['created_at', 'id']),
         ]
 
     def __str__(self):
@@ -75,28 +103,29 @@ class Blog(TimestampModel):
     @property
     def cover_thumbnail(self):
         """Generate thumbnail URL for the cover image"""
-        if self.cover:
-            return self.cover.build_url(width=300, height=200, crop='fill', quality='auto')
-        return None
+        return image_url(self.cover, width=300, height=200, crop='fill', quality='auto') or None
     
     @property
     def cover_optimized(self):
         """Generate optimized URL for web display"""
-        if self.cover:
-            return self.cover.build_url(width=800, height=450, crop='fill', quality='auto', format='webp')
-        return None
+        return image_url(self.cover, width=800, height=450, crop='fill', quality='auto', format='webp') or None
     
     @property
     def is_published(self):
         return self.status == 'Published' and self.is_verified
     
     def get_related_blogs(self, limit=3):
-        """Get related blogs by category"""
-        return Blog.objects.filter(
-            category=self.category,
-            status='Published',
-            is_verified=True
-        ).exclude(id=self.id)[:limit]
+        """Get related blogs from the precomputed neighbour table, falling back to category"""
+        related = list(
+            Blog.objects.filter(neighbour_of__blog=self)
+            .select_related('category')
+            .order_by('neighbour_of__rank')[:limit]
+        )
+        if related:
+            return related
+        return Blog.objects.published().filter(
+            category=self.category
+        ).exclude(id=self.id).select_related('category')[:limit]
 
 class Comment(TimestampModel):
     blog = models.ForeignKey(Blog, related_name="comments", on_delete=models.CASCADE)
@@ -117,10 +146,44 @@ class Comment(TimestampModel):
         ordering = ['-created_at']
         verbose_name = 'Blog Comment'
         verbose_name_plural = 'Blog Comments'
+        indexes = [
+            models.Index(fields=['blog', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Comment by {self.name} on {self.blog.title}"
 
+class BlogTerm(models.Model):
+    """A weighted TF-IDF term from a published post, used to find similar posts"""
+    blog = models.ForeignKey(Blog, related_name='terms', on_delete=models.CASCADE)
+    term = models.CharField(max_length=64)
+    weight = models.FloatField()
+
+    class Meta:
+        unique_together = ('blog', 'term')
+        indexes = [
+            models.Index(fields=['term', 'blog']),
+        ]
+
+    def __str__(self):
+        return f"{self.term} ({self.weight:.3f})"
+
+
+class RelatedBlog(models.Model):
+    """Precomputed top-K most similar published posts for each post"""
+    blog = models.ForeignKey(Blog, related_name='neighbours', on_delete=models.CASCADE)
+    related = models.ForeignKey(Blog, related_name='neighbour_of', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ['blog', 'rank']
+        unique_together = ('blog', 'rank')
+
+    def __str__(self):
+        return f"{self.blog_id} -> {self.related_id} ({self.score:.3f})"
+
+
 class Speaker(TimestampModel):
     name = models.CharField(max_length=100)
     bio = models.TextField(help_text="Brief biography of the speaker")
@@ -158,11 +221,9 @@ class Speaker(TimestampModel):
     @property
     def photo_thumbnail(self):
         """Generate thumbnail URL for speaker photo"""
-        if self.photo:
-            return self.photo.build_url(width=100, height=100, crop='fill', gravity='face')
-        return None
+        return image_url(self.photo, width=100, height=100, crop='fill', gravity='face') or None
 
-class Webinar(TimestampModel):
+class Webinar(StoredCountersMixin, TimestampModel):
     STATUS_CHOICES = [
         ('upcoming', 'Upcoming'),
         ('live', 'Live'),
@@ -203,12 +264,23 @@ class Webinar(TimestampModel):
     speakers = models.ManyToManyField(Speaker, related_name='webinars')
     meeting_url = models.URLField(blank=True, help_text="Zoom/Google Meet link")
     recording_url = models.URLField(blank=True, help_text="Link to webinar recording")
+    capacity = models.PositiveIntegerField(null=True, blank=True, help_text="Seats available; leave empty for unlimited")
+    registration_count = models.PositiveIntegerField(default=0, editable=False)
+    pending_count = models.PositiveIntegerField(default=0, editable=False)
+    confirmed_count = models.PositiveIntegerField(default=0, editable=False)
+    cancelled_count = models.PositiveIntegerField(default=0, editable=False)
+    waitlist_count = models.PositiveIntegerField(default=0, editable=False)
+
+    counter_fields = ('registration_count', 'pending_count', 'confirmed_count', 'cancelled_count', 'waitlist_count')
+
+    objects = WebinarManager()
     
     class Meta:
         ordering = ['-start_datetime']
         indexes = [
             models.Index(fields=['status', 'start_datetime']),
             models.Index(fields=['is_featured', 'status']),
+            models.Index(fields=['start_datetime', 'id']),
         ]
         verbose_name = 'Webinar'
         verbose_name_plural = 'Webinars'
@@ -222,6 +294,20 @@ class Webinar(TimestampModel):
     @property
     def is_free(self):
         return self.price == 0
+
+    @property
+    def seats_taken(self):
+        return self.pending_count + self.confirmed_count
+
+    @property
+    def seats_left(self):
+        if self.capacity is None:
+            return None
+        return max(self.capacity - self.seats_taken, 0)
+
+    @property
+    def is_sold_out(self):
+        return self.capacity is not None and self.seats_taken >= self.capacity
     
     @property
     def end_datetime(self):
@@ -239,29 +325,117 @@ class Webinar(TimestampModel):
     @property
     def featured_image_thumbnail(self):
         """Generate thumbnail URL for featured image"""
-        if self.featured_image:
-            return self.featured_image.build_url(width=400, height=225, crop='fill', quality='auto')
-        return None
+        return image_url(self.featured_image, width=400, height=225, crop='fill', quality='auto') or None
 
 class WebinarRegistration(TimestampModel):
     status_choices = (
         ("pending", "Pending"),
         ("confirmed", "Confirmed"),
         ("cancelled", "cancelled"),
+        ("waitlisted", "Waitlisted"),
     )
 
     webinar = models.ForeignKey(Webinar, related_name='registrations', on_delete=models.CASCADE)
+    # Set for registrations made while logged in, or matched on email by backfill_registration_users.
+    # The (user, webinar) index below serves user lookups, so the FK needs no index of its own.
+    user = models.ForeignKey(User, related_name='webinar_registrations', on_delete=models.SET_NULL, null=True, blank=True, db_index=False)
     full_name = models.CharField(max_length=255)
     email = models.EmailField()
     status = models.CharField(max_length=255, choices=status_choices)
     question = models.TextField(verbose_name="Any questions for the speaker", blank=True, null=True)
     joined_at = models.DateTimeField(null=True, blank=True)
     left_at = models.DateTimeField(null=True, blank=True)
-    payment_reference = models.FileField(upload_to="payment", verbose_name="Proof of Payment", blank=True, null=True)
+    payment_reference = models.FileField(upload_to="payment", verbose_name="Proof of Payment", blank=True, null=True, validators=[UploadValidator(allow_documents=True)])
+
+    objects = WebinarRegistrationManager()
     
     class Meta:
         unique_together = ('webinar', 'email')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['webinar', 'created_at']),
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['user', 'webinar']),
+        ]
+
+    def __str__(self):
+        return f"{self.email} - {self.webinar.title}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so counters can follow status changes
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+class Task(TimestampModel):
+    """A unit of background work, claimed and run by ``manage.py runworker``"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    idempotency_key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    run_after = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after']
+        indexes = [
+            models.Index(fields=['status', 'run_after']),
+            models.Index(fields=['status', 'locked_until']),
+            models.Index(fields=['name', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
+
+class Notification(TimestampModel):
+    """An email about a registration, queued here and sent in batches by core.notifications"""
+    KIND_CHOICES = [
+        ('registration_pending', 'Registration received'),
+        ('registration_confirmed', 'Registration confirmed'),
+        ('registration_cancelled', 'Registration cancelled'),
+        ('registration_waitlisted', 'Added to waitlist'),
+        ('reminder', 'Webinar reminder'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    registration = models.ForeignKey(WebinarRegistration, related_name='notifications', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    to_email = models.EmailField()
+    # One message per registration and kind, however often the status flips
+    dedupe_key = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # Token of the flush that claimed this row for sending
+    locked_by = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
 
     def __str__(self):
-        return f"{self.email} - {self.webinar.title}"
\ No newline at end of file
+        return f"{self.kind} to {self.to_email} ({self.status})"
@@ -0,0 +1,221 @@
+import logging
+import threading
+import time
+import uuid
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import get_template
+from django.utils import timezone
+
+from .models import Notification, WebinarRegistration
+from .taskqueue import enqueue
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+# Messages queued within one window go out together in a single flush
+BATCH_WINDOW = getattr(settings, 'NOTIFICATION_BATCH_WINDOW', 10)
+# Messages per second over one connection; 0 disables pacing
+RATE_LIMIT = getattr(settings, 'EMAIL_RATE_LIMIT', 10)
+MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 3)
+REMINDER_LEAD = timedelta(hours=getattr(settings, 'WEBINAR_REMINDER_HOURS', 24))
+
+SUBJECTS = {
+    'registration_pending': 'We received your registration for {title}',
+    'registration_confirmed': 'You are confirmed for {title}',
+    'registration_cancelled': 'Your registration for {title} was cancelled',
+    'registration_waitlisted': "You're on the waitlist for {title}",
+    'reminder': 'Reminder: {title} starts soon',
+}
+
+
+class RateLimiter:
+    """Space calls at least ``1 / rate`` seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._next > now:
+                time.sleep(self._next - now)
+                now = self._next
+            self._next = now + self.interval
+
+
+def schedule_flush():
+    """Queue one flush per batch window; later notifications in the window join it"""
+    window = int(time.time() // BATCH_WINDOW)
+    delay = (window + 1) * BATCH_WINDOW - time.time()
+    transaction.on_commit(lambda: enqueue(
+        'core.send_notifications', idempotency_key=f'notifications:{window}', delay=delay,
+    ))
+
+
+def notify_status(registration):
+    """Queue the email for a registration's current status"""
+    kind = f'registration_{registration.status}'
+    if kind not in SUBJECTS:
+        return None
+    notification, created = Notification.objects.get_or_create(
+        dedupe_key=f'{kind}:{registration.pk}',
+        defaults={'registration': registration, 'kind': kind, 'to_email': registration.email},
+    )
+    if created:
+        schedule_flush()
+    return notification
+
+
+def notify_status_many(registrations, status):
+    """Queue status emails for ``(pk, email)`` pairs changed together by a bulk UPDATE"""
+    kind = f'registration_{status}'
+    if kind not in SUBJECTS or not registrations:
+        return 0
+    Notification.objects.bulk_create(
+        [
+            Notification(registration_id=pk, kind=kind, to_email=email, dedupe_key=f'{kind}:{pk}')
+            for pk, email in registrations
+        ],
+        ignore_conflicts=True,
+    )
+    schedule_flush()
+    return len(registrations)
+
+
+def reminder_key(registration_id, start_datetime):
+    # Keyed on the start time too, so a rescheduled webinar gets a reminder for its new date
+    return f'reminder:{registration_id}:{int(start_datetime.timestamp())}'
+
+
+def _insert_reminders(reminders):
+    """Insert reminders, skipping dedupe_key conflicts; returns how many were inserted"""
+    started = timezone.now()
+    Notification.objects.bulk_create(reminders, ignore_conflicts=True)
+    # bulk_create can't say which rows a conflict skipped, so count the rows stamped from here on
+    return Notification.objects.filter(
+        dedupe_key__in=[reminder.dedupe_key for reminder in reminders], created_at__gte=started,
+    ).count()
+
+
+def queue_reminders(lead=REMINDER_LEAD, chunk_size=500):
+    """Queue reminders for confirmed registrations of webinars starting within ``lead``.
+
+    Returns the number of reminders this call queued; ones already queued,
+    here or by a concurrent run, are left alone and not counted.
+    """
+    now = timezone.now()
+    registrations = (
+        WebinarRegistration.objects
+        .filter(status='confirmed', webinar__start_datetime__gt=now, webinar__start_datetime__lte=now + lead)
+        .values_list('pk', 'email', 'webinar__start_datetime')
+        .iterator(chunk_size=chunk_size)
+    )
+    queued = 0
+    while chunk := list(islice(registrations, chunk_size)):
+        reminders = {
+            reminder_key(pk, start): Notification(registration_id=pk, kind='reminder', to_email=email)
+            for pk, email, start in chunk
+        }
+        sent = set(Notification.objects.filter(dedupe_key__in=reminders).values_list('dedupe_key', flat=True))
+        missing = [key for key in reminders if key not in sent]
+        if not missing:
+            continue
+        for key in missing:
+            reminders[key].dedupe_key = key
+        queued += _insert_reminders([reminders[key] for key in missing])
+    if queued:
+        schedule_flush()
+    return queued
+
+
+def _queued_ids(limit):
+    return list(Notification.objects.filter(status='queued').values_list('pk', flat=True)[:limit])
+
+
+def claim(limit=BATCH_SIZE):
+    """Mark up to ``limit`` queued notifications as sending and return them.
+
+    Concurrent flushes can read the same ids, but only one UPDATE takes
+    each row; rows are returned by the token this call wrote, so a loser
+    never gets (and sends) the winner's rows.
+    """
+    token = uuid.uuid4().hex
+    Notification.objects.filter(pk__in=_queued_ids(limit), status='queued').update(
+        status='sending', locked_by=token, attempts=F('attempts') + 1, updated_at=timezone.now(),
+    )
+    return list(
+        Notification.objects.filter(locked_by=token, status='sending')
+        .select_related('registration__webinar')
+    )
+
+
+def render(notifications):
+    """Build every message of a batch, loading each template once"""
+    templates = {}
+    messages = []
+    for notification in notifications:
+        if notification.kind not in templates:
+            templates[notification.kind] = (
+                get_template(f'emails/{notification.kind}.txt'),
+                get_template(f'emails/{notification.kind}.html'),
+            )
+        text, html = templates[notification.kind]
+        registration = notification.registration
+        context = {
+            'registration': registration,
+            'webinar': registration.webinar,
+            'webinar_url': settings.SITE_URL + registration.webinar.get_absolute_url(),
+        }
+        message = EmailMultiAlternatives(
+            SUBJECTS[notification.kind].format(title=registration.webinar.title),
+            text.render(context),
+            to=[notification.to_email],
+        )
+        message.attach_alternative(html.render(context), 'text/html')
+        messages.append(message)
+    return messages
+
+
+def deliver(limit=BATCH_SIZE, connection=None):
+    """Send one batch over a single connection and record each message's outcome"""
+    notifications = claim(limit)
+    if not notifications:
+        return 0
+    sent, failed = [], {}
+    limiter = RateLimiter(RATE_LIMIT)
+    connection = connection or get_connection()
+    with connection:
+        for notification, message in zip(notifications, render(notifications)):
+            limiter.wait()
+            try:
+                connection.send_messages([message])
+            except Exception as exc:
+                failed[notification.pk] = (notification, str(exc))
+                logger.warning("Notification %s to %s failed: %s", notification.pk, notification.to_email, exc)
+            else:
+                sent.append(notification.pk)
+
+    Notification.objects.filter(pk__in=sent).update(status='sent', sent_at=timezone.now(), last_error='')
+    for pk, (notification, error) in failed.items():
+        status = 'failed' if notification.attempts >= MAX_ATTEMPTS else 'queued'
+        Notification.objects.filter(pk=pk).update(status=status, last_error=error)
+    if any(notification.attempts < MAX_ATTEMPTS for notification, _ in failed.values()):
+        schedule_flush()
+    return len(sent)
+
+
+def requeue_stale(older_than=timedelta(minutes=15)):
+    """Return notifications left in 'sending' by a worker that died mid-batch"""
+    return Notification.objects.filter(status='sending', updated_at__lt=timezone.now() - older_than).update(
+        status='queued', locked_by='',
+    )
@@ -0,0 +1,173 @@
+import base64
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+
+class KeysetPaginator:
+    """Cursor pagination over a unique, non-null ordering such as ('-created_at', '-id').
+
+    Each page is fetched with a range condition on the ordering columns, so
+    page N costs the same indexed read as page 1 and no COUNT(*) is needed.
+    """
+
+    def __init__(self, queryset, ordering, per_page=25):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [f.lstrip('-') for f in self.ordering]
+        self.model_fields = [queryset.model._meta.get_field(f) for f in self.fields]
+
+    def encode_cursor(self, obj, direction):
+        values = [field.value_to_string(obj) for field in self.model_fields]
+        payload = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = [field.to_python(v) for field, v in zip(self.model_fields, payload['v'])]
+            direction = payload['d']
+        except Exception as exc:
+            raise InvalidCursor('Invalid pagination cursor') from exc
+        if len(values) != len(self.fields) or direction not in ('n', 'p'):
+            raise InvalidCursor('Invalid pagination cursor')
+        return values, direction
+
+    def _seek(self, values, backwards):
+        """Rows strictly after (or before) the given ordering values"""
+        condition = Q()
+        for i, ordering in enumerate(self.ordering):
+            descending = ordering.startswith('-')
+            lookup = 'lt' if descending != backwards else 'gt'
+            clause = Q(**{f'{self.fields[i]}__{lookup}': values[i]})
+            for j in range(i):
+                clause &= Q(**{self.fields[j]: values[j]})
+            condition |= clause
+        return condition
+
+    def _page_query(self, cursor):
+        backwards = False
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            values, direction = self.decode_cursor(cursor)
+            backwards = direction == 'p'
+            queryset = queryset.filter(self._seek(values, backwards))
+            if backwards:
+                queryset = queryset.reverse()
+        return queryset[:self.per_page + 1], backwards
+
+    def _make_page(self, rows, cursor, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        has_next = has_more if not backwards else True
+        has_previous = bool(cursor) if not backwards else has_more
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], 'n') if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'p') if rows and has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        queryset, backwards = self._page_query(cursor)
+        return self._make_page(list(queryset), cursor, backwards)
+
+    async def apage(self, cursor=None):
+        queryset, backwards = self._page_query(cursor)
+        return self._make_page([row async for row in queryset], cursor, backwards)
+
+
+def approximate_count(queryset, cache_timeout=300):
+    """Cheap row count for large tables.
+
+    Unfiltered querysets on PostgreSQL read the planner's estimate from
+    pg_class; anything else falls back to an exact COUNT(*) that is cached
+    for ``cache_timeout`` seconds so repeated page views don't pay for it.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+
+    key = 'approx-count:' + hashlib.md5(str(queryset.query).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, cache_timeout)
+    return count
+
+
+class CursorPaginationMixin:
+    """ListView mixin that swaps OFFSET pagination for keyset pagination.
+
+    Set ``cursor_ordering`` to a unique ordering ending in the primary key.
+    ``count_mode`` is None (no count), 'exact' or 'approximate'.
+    """
+    cursor_ordering = ('-created_at', '-id')
+    cursor_param = 'cursor'
+    count_mode = None
+
+    def get_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.cursor_ordering, per_page=page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_param))
+        except InvalidCursor:
+            raise Http404('Invalid page cursor')
+        return paginator, page, page.object_list, page.has_other_pages
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        params = self.request.GET.copy()
+        params.pop(self.cursor_param, None)
+        context['querystring'] = params.urlencode()
+        if self.count_mode == 'exact':
+            context['result_count'] = self.object_list.count()
+        elif self.count_mode == 'approximate':
+            context['result_count'] = approximate_count(self.object_list)
+        return context
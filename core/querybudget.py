@@ -0,0 +1,143 @@
+import re
+import sys
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+# Collapse literals and IN-lists so repeated lookups share one "shape"
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,?)+\)", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a view runs more queries than its declared budget"""
+
+
+def get_budget_setting(name, default):
+    return getattr(settings, f'QUERY_BUDGET_{name}', default)
+
+
+def normalize_sql(sql):
+    """Reduce a SQL statement to its shape, independent of parameter values"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+def _template_origin():
+    """Find the innermost template node being rendered, if any"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_code.co_name == 'render_annotated':
+            node = frame.f_locals.get('self')
+            token = getattr(node, 'token', None)
+            origin = getattr(node, 'origin', None)
+            if token is not None and origin is not None:
+                return f"{origin.template_name or origin.name}:{token.lineno}"
+        frame = frame.f_back
+    return None
+
+
+class RecordedQuery:
+    __slots__ = ('sql', 'shape', 'duration', 'template')
+
+    def __init__(self, sql, shape, duration, template):
+        self.sql = sql
+        self.shape = shape
+        self.duration = duration
+        self.template = template
+
+
+class QueryRecorder:
+    """Database execute wrapper that records every statement run through it"""
+
+    def __init__(self, track_templates=True):
+        self.track_templates = track_templates
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        template = _template_origin() if self.track_templates else None
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(RecordedQuery(
+                sql, normalize_sql(sql), time.perf_counter() - start, template
+            ))
+
+    def __len__(self):
+        return len(self.queries)
+
+    @property
+    def total_time(self):
+        return sum(q.duration for q in self.queries)
+
+    def grouped(self):
+        """Group recorded queries by shape, most repeated first"""
+        groups = OrderedDict()
+        for query in self.queries:
+            groups.setdefault(query.shape, []).append(query)
+        return sorted(groups.items(), key=lambda item: len(item[1]), reverse=True)
+
+    def n_plus_one(self, threshold=None):
+        """Return (shape, count, template lines) for shapes repeated threshold+ times"""
+        if threshold is None:
+            threshold = get_budget_setting('N_PLUS_ONE_THRESHOLD', 3)
+        suspects = []
+        for shape, queries in self.grouped():
+            if len(queries) < threshold:
+                break
+            templates = sorted({q.template for q in queries if q.template})
+            suspects.append((shape, len(queries), templates))
+        return suspects
+
+    def report(self, view_name=None, budget=None):
+        header = f"{len(self)} queries ({self.total_time * 1000:.1f} ms)"
+        if view_name:
+            header = f"{view_name}: {header}"
+        if budget is not None:
+            header = f"{header}, budget {budget}"
+        lines = [header]
+        for shape, count, templates in self.n_plus_one():
+            where = ', '.join(templates) if templates else 'view code'
+            lines.append(f"  N+1 x{count} at {where}: {shape[:200]}")
+        return '\n'.join(lines)
+
+
+@contextmanager
+def record_queries(using=None, track_templates=True):
+    """Record every query run on the given (or all) connections"""
+    recorder = QueryRecorder(track_templates=track_templates)
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(recorder))
+        yield recorder
+
+
+def get_view_budget(view_func):
+    """Read the budget declared with @query_budget or a class attribute"""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        view_class = getattr(view_func, 'view_class', None)
+        budget = getattr(view_class, 'query_budget', None)
+    return budget
+
+
+def extend_budget(request, extra):
+    """Raise this request's budget by ``extra`` queries, for views whose work grows with their input"""
+    view_name, budget = getattr(request, '_query_budget', None) or (None, None)
+    if budget is not None:
+        request._query_budget = (view_name, budget + extra)
+
+
+def get_view_name(view_func):
+    view_class = getattr(view_func, 'view_class', None)
+    target = view_class or view_func
+    return f"{target.__module__}.{target.__qualname__}"
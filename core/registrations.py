@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.core.cache import cache as shared_cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import cache, notifications
+from .counters import SEAT_STATUSES, STATUS_COUNTERS, adjust_registration_counts
+from .models import Webinar, WebinarRegistration
+
+REGISTERED_WEBINARS_TIMEOUT = getattr(settings, 'REGISTERED_WEBINARS_TIMEOUT', 60 * 60)
+
+REGISTERED = 'registered'
+WAITLISTED = 'waitlisted'
+DUPLICATE = 'duplicate'
+
+
+def _has_seat():
+    return Q(capacity__isnull=True) | Q(capacity__gt=F('pending_count') + F('confirmed_count'))
+
+
+def reserve_seat(webinar_id):
+    """Take a seat, or a waitlist place when sold out, in one conditional UPDATE.
+
+    The capacity check and the counter increment are a single statement,
+    so concurrent registrations can never oversell: the row lock makes
+    each UPDATE see the counts left by the one before it.
+    """
+    taken = Webinar.objects.filter(_has_seat(), pk=webinar_id).update(
+        registration_count=F('registration_count') + 1, pending_count=F('pending_count') + 1,
+    )
+    if taken:
+        return 'pending'
+    Webinar.objects.filter(pk=webinar_id).update(
+        registration_count=F('registration_count') + 1, waitlist_count=F('waitlist_count') + 1,
+    )
+    return 'waitlisted'
+
+
+def take_seats(webinar_id, status, wanted):
+    """Count up to ``wanted`` registrations into ``status``, as far as seats allow.
+
+    For registrations entering a seat from outside one, e.g. an admin
+    confirming from the waitlist. As in reserve_seat(), the capacity check
+    and the increment are one conditional UPDATE; a smaller grant is retried
+    when the full one doesn't fit. Returns the number granted. The caller
+    still moves the counters of the statuses they leave.
+    """
+    field = STATUS_COUNTERS[status]
+    granted = wanted
+    while granted > 0:
+        room = Q(capacity__isnull=True) | Q(capacity__gte=F('pending_count') + F('confirmed_count') + granted)
+        if Webinar.objects.filter(room, pk=webinar_id).update(**{field: F(field) + granted}):
+            return granted
+        webinar = Webinar.objects.only('capacity', 'pending_count', 'confirmed_count').get(pk=webinar_id)
+        granted = min(granted - 1, webinar.seats_left or 0)
+    return 0
+
+
+def hold_seat(registration):
+    """Take the seat an edited registration is about to move into; False if the webinar is full.
+
+    Only a move into a seat status from outside one needs a seat. The
+    post_save receiver sees ``_seat_held`` and leaves that counter alone.
+    """
+    previous = getattr(registration, '_loaded_status', None)
+    if previous in SEAT_STATUSES or registration.status not in SEAT_STATUSES:
+        return True
+    if not take_seats(registration.webinar_id, registration.status, 1):
+        return False
+    registration._seat_held = True
+    return True
+
+
+def register(registration):
+    """Save a new registration, holding a seat or spilling to the waitlist.
+
+    Registering the same email twice returns the existing registration
+    with DUPLICATE instead of raising, whichever request got there first.
+    Returns ``(registration, outcome)``.
+    """
+    existing = WebinarRegistration.objects.filter(webinar_id=registration.webinar_id, email=registration.email).first()
+    if existing is not None:
+        return existing, DUPLICATE
+    try:
+        with transaction.atomic():
+            registration.status = reserve_seat(registration.webinar_id)
+            # Counters already moved with the reservation
+            registration._counted = True
+            registration.save()
+    except IntegrityError:
+        # A concurrent request registered the same email; its seat stands, ours rolled back
+        return WebinarRegistration.objects.get(webinar_id=registration.webinar_id, email=registration.email), DUPLICATE
+    return registration, REGISTERED if registration.status == 'pending' else WAITLISTED
+
+
+def promote_waitlist(webinar_id, limit=None):
+    """Move the longest-waiting registrations into seats freed by cancellations or a larger capacity"""
+    promoted = 0
+    while limit is None or promoted < limit:
+        with transaction.atomic():
+            moved = Webinar.objects.filter(_has_seat(), pk=webinar_id, waitlist_count__gt=0).update(
+                pending_count=F('pending_count') + 1, waitlist_count=F('waitlist_count') - 1,
+            )
+            if not moved:
+                break
+            candidate = (
+                WebinarRegistration.objects.select_for_update(skip_locked=True)
+                .filter(webinar_id=webinar_id, status='waitlisted')
+                .order_by('created_at', 'pk').values_list('pk', 'email', 'user_id').first()
+            )
+            if candidate is None:
+                # The waitlist counter had drifted high; give the seat back and stop
+                adjust_registration_counts(webinar_id, statuses={'pending': -1})
+                break
+            WebinarRegistration.objects.filter(pk=candidate[0]).update(status='pending', updated_at=timezone.now())
+        notifications.notify_status_many([candidate[:2]], 'pending')
+        forget_registered_webinars(candidate[2])
+        promoted += 1
+    if promoted:
+        cache.purge(WebinarRegistration)
+    return promoted
+
+
+def _registered_key(user_id):
+    return f'user:{user_id}:registered-webinars'
+
+
+def registered_webinars(user):
+    """``{webinar_id: status}`` for a user's registrations, cached per user.
+
+    Pages check membership in the dict instead of querying per webinar.
+    Anonymous users get an empty dict.
+    """
+    if not user.is_authenticated:
+        return {}
+    key = _registered_key(user.pk)
+    webinars = shared_cache.get(key)
+    if webinars is None:
+        webinars = dict(WebinarRegistration.objects.filter(user=user).values_list('webinar_id', 'status'))
+        shared_cache.set(key, webinars, REGISTERED_WEBINARS_TIMEOUT)
+    return webinars
+
+
+def forget_registered_webinars(*user_ids):
+    keys = [_registered_key(user_id) for user_id in user_ids if user_id]
+    if keys:
+        shared_cache.delete_many(keys)
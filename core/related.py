@@ -0,0 +1,164 @@
+import math
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, Max, Sum, Value, When
+
+from .models import Blog, BlogTerm, RelatedBlog
+from .search import strip_html
+
+TOP_K = 6
+TERMS_PER_POST = 30
+# Added to the text similarity of posts that share a category
+CATEGORY_BONUS = 0.15
+TITLE_BOOST = 3
+
+STOP_WORDS = frozenset("""
+    about above after again against all also and any are because been before being below between
+    both but can could did does doing down during each few for from further had has have having
+    her here hers herself him himself his how into its itself just more most not now off once
+    only other our ours out over own same she should some such than that the their theirs them
+    then there these they this those through too under until very was were what when where which
+    while who whom why will with would you your yours yourself
+""".split())
+
+
+def tokenize(text):
+    return [word[:64] for word in re.findall(r'[a-z]{3,}', text.lower()) if word not in STOP_WORDS]
+
+
+def term_counts(blog):
+    """Term frequencies for a post, with title words counted several times over"""
+    counts = Counter(tokenize(f'{blog.snippet} {strip_html(blog.body)}'))
+    for word in tokenize(blog.title):
+        counts[word] += TITLE_BOOST
+    return counts
+
+
+def weigh(counts, document_frequency, total):
+    """The post's heaviest terms as an L2-normalised TF-IDF vector"""
+    weights = {
+        term: (1 + math.log(tf)) * math.log((1 + total) / (1 + document_frequency.get(term, 0)))
+        for term, tf in counts.items()
+    }
+    top = [item for item in sorted(weights.items(), key=lambda item: -item[1])[:TERMS_PER_POST] if item[1] > 0]
+    norm = math.sqrt(sum(weight * weight for _, weight in top)) or 1
+    return {term: weight / norm for term, weight in top}
+
+
+def nearest(blog, weights, limit=TOP_K):
+    """Most similar published posts: dot product over shared terms plus the category bonus"""
+    if not weights:
+        return []
+    text_score = Sum(Case(
+        *[When(term=term, then=F('weight') * Value(weight)) for term, weight in weights.items()],
+        default=Value(0.0), output_field=FloatField(),
+    ))
+    score = text_score
+    if blog.category_id:
+        score = text_score + Max(Case(
+            When(blog__category_id=blog.category_id, then=Value(CATEGORY_BONUS)),
+            default=Value(0.0), output_field=FloatField(),
+        ))
+    rows = (
+        BlogTerm.objects
+        .filter(term__in=list(weights))
+        .exclude(blog_id=blog.pk)
+        .values('blog_id')
+        .annotate(score=score)
+        .order_by('-score', 'blog_id')[:limit]
+    )
+    return [(row['blog_id'], row['score']) for row in rows]
+
+
+def _store_terms(blog, weights):
+    BlogTerm.objects.filter(blog=blog).delete()
+    BlogTerm.objects.bulk_create([BlogTerm(blog=blog, term=term, weight=weight) for term, weight in weights.items()])
+
+
+def _store_neighbours(blog, neighbours):
+    RelatedBlog.objects.filter(blog=blog).delete()
+    RelatedBlog.objects.bulk_create([
+        RelatedBlog(blog=blog, related_id=related_id, rank=rank, score=score)
+        for rank, (related_id, score) in enumerate(neighbours)
+    ])
+
+
+def _stored_weights(blog_id):
+    return dict(BlogTerm.objects.filter(blog_id=blog_id).values_list('term', 'weight'))
+
+
+def linking_to(blog):
+    """Posts whose neighbour list currently includes ``blog``"""
+    return set(RelatedBlog.objects.filter(related=blog).values_list('blog_id', flat=True)) - {blog.pk}
+
+
+def refresh_neighbours(blog_ids):
+    """Recompute the neighbour lists of the given posts from their stored terms"""
+    for blog in Blog.objects.published().filter(pk__in=blog_ids).only('pk', 'category_id'):
+        _store_neighbours(blog, nearest(blog, _stored_weights(blog.pk)))
+
+
+@transaction.atomic
+def update_blog(blog):
+    """Re-index one post after it is published, edited or unpublished.
+
+    Document frequencies come from the stored term table, which only holds
+    each post's top terms, so incremental weights are an approximation that
+    the ``rebuild_related_posts`` command periodically corrects. Posts that
+    listed this one, or that it now lists, are refreshed too.
+    """
+    affected = linking_to(blog)
+    if not blog.is_published:
+        BlogTerm.objects.filter(blog=blog).delete()
+        RelatedBlog.objects.filter(blog=blog).delete()
+        refresh_neighbours(affected)
+        return []
+
+    counts = term_counts(blog)
+    document_frequency = dict(
+        BlogTerm.objects.filter(term__in=list(counts)).exclude(blog=blog)
+        .values('term').annotate(n=Count('blog')).values_list('term', 'n')
+    )
+    total = Blog.objects.published().count()
+    weights = weigh(counts, document_frequency, total)
+    _store_terms(blog, weights)
+
+    neighbours = nearest(blog, weights)
+    _store_neighbours(blog, neighbours)
+    refresh_neighbours(affected | {related_id for related_id, _ in neighbours})
+    return neighbours
+
+
+def reindex(blog_id):
+    """update_blog() for a post by id; a post deleted meanwhile is left to the delete's own refresh"""
+    blog = Blog.objects.filter(pk=blog_id).first()
+    return update_blog(blog) if blog is not None else []
+
+
+def rebuild(chunk_size=500):
+    """Recompute exact document frequencies, every post's terms and every neighbour list"""
+    posts = Blog.objects.published().only('pk', 'title', 'snippet', 'body', 'category_id')
+    counts = {}
+    document_frequency = Counter()
+    for blog in posts.iterator(chunk_size=chunk_size):
+        counts[blog.pk] = term_counts(blog)
+        document_frequency.update(counts[blog.pk].keys())
+
+    total = len(counts)
+    vectors = {blog_id: weigh(blog_counts, document_frequency, total) for blog_id, blog_counts in counts.items()}
+    with transaction.atomic():
+        BlogTerm.objects.all().delete()
+        BlogTerm.objects.bulk_create(
+            [
+                BlogTerm(blog_id=blog_id, term=term, weight=weight)
+                for blog_id, weights in vectors.items()
+                for term, weight in weights.items()
+            ],
+            batch_size=chunk_size,
+        )
+        RelatedBlog.objects.all().delete()
+        for blog in posts.only('pk', 'category_id').iterator(chunk_size=chunk_size):
+            _store_neighbours(blog, nearest(blog, vectors[blog.pk]))
+    return total
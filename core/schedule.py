@@ -0,0 +1,71 @@
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import attendance, cache
+from .models import Webinar
+
+# Statuses the scheduler moves on by itself; cancelled webinars are left alone
+ACTIVE_STATUSES = ('upcoming', 'live')
+# Shortest duration Webinar allows, so nothing started later than this ago can have ended
+MIN_DURATION = timedelta(minutes=5)
+CHUNK_SIZE = 500
+
+
+def _ended(now):
+    """Upcoming or live webinars whose end has passed.
+
+    End time is start plus a per-row duration, which no index covers, so
+    one range on (status, start_datetime) per distinct duration instead.
+    Only webinars that have started are read to find the durations.
+    """
+    started = Webinar.objects.filter(status__in=ACTIVE_STATUSES, start_datetime__lte=now - MIN_DURATION)
+    ended = Q()
+    for duration in started.order_by().values_list('duration', flat=True).distinct():
+        ended |= Q(duration=duration, start_datetime__lte=now - timedelta(minutes=duration))
+    return started.filter(ended) if ended else Webinar.objects.none()
+
+
+def _move(queryset, status, now, chunk_size):
+    """Set ``status`` on every row of ``queryset`` in chunks; returns the pks moved"""
+    moved = []
+    while True:
+        pks = list(queryset.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return moved
+        # The UPDATE repeats the filter, so a row edited meanwhile is left as its editor set it.
+        # updated_at moves too, since the listing's Last-Modified is read from it.
+        queryset.filter(pk__in=pks).update(status=status, updated_at=now)
+        moved += pks
+
+
+def advance(now=None, chunk_size=CHUNK_SIZE):
+    """Move webinars that are due from upcoming to live and on to completed.
+
+    Set-based UPDATEs on the (status, start_datetime) index, so the cost
+    follows the number of webinars changing, not the size of the table.
+    Returns ``{'live': n, 'completed': n}``.
+    """
+    now = now or timezone.now()
+    # Ended first, so a webinar missed entirely goes straight to completed
+    completed = _move(_ended(now), 'completed', now, chunk_size)
+    live = _move(Webinar.objects.filter(status='upcoming', start_datetime__lte=now), 'live', now, chunk_size)
+    if completed or live:
+        cache.purge(Webinar)
+        attendance.forget_live(*completed, *live)
+    return {'live': len(live), 'completed': len(completed)}
+
+
+def next_transition(now=None):
+    """When advance() next has something to do, or None if nothing is scheduled"""
+    now = now or timezone.now()
+    starts = (
+        Webinar.objects.filter(status='upcoming', start_datetime__gt=now)
+        .order_by('start_datetime').values_list('start_datetime', flat=True).first()
+    )
+    ends = [
+        start + timedelta(minutes=duration)
+        for start, duration in Webinar.objects.filter(status='live').values_list('start_datetime', 'duration')
+    ]
+    return min(filter(None, [starts, *ends]), default=None)
@@ -0,0 +1,232 @@
+import html
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils.html import escape, strip_tags
+from django.utils.safestring import mark_safe
+
+# Each indexed object gets one document id: pk * len(KINDS) + offset, so
+# updates and deletes hit the index by primary key on both backends
+KINDS = {'blog': 0, 'webinar': 1}
+TABLE = 'core_search_index'
+
+# Control characters can't appear in stripped text, so they make safe
+# highlight markers that are swapped for <mark> after escaping
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+class SearchHit:
+    def __init__(self, doc_id, title, snippet, score):
+        self.kind, self.object_id = decode_doc_id(doc_id)
+        self.title = title
+        self.snippet = highlight(snippet)
+        self.score = score
+
+
+def doc_id(kind, pk):
+    return pk * len(KINDS) + KINDS[kind]
+
+
+def decode_doc_id(value):
+    pk, offset = divmod(value, len(KINDS))
+    kind = next(name for name, o in KINDS.items() if o == offset)
+    return kind, pk
+
+
+def strip_html(value):
+    """Plain text from CKEditor HTML: tags dropped, entities decoded, whitespace collapsed"""
+    text = html.unescape(strip_tags(value or ''))
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet or '').replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def query_terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+class SQLiteBackend:
+    """FTS5 virtual table ranked with its built-in BM25"""
+
+    def setup(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} "
+            f"USING fts5(title, body, tokenize='porter unicode61')"
+        )
+
+    def upsert(self, cursor, doc, title, body):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [doc])
+        cursor.execute(f"INSERT INTO {TABLE} (rowid, title, body) VALUES (%s, %s, %s)", [doc, title, body])
+
+    def delete(self, cursor, doc):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE rowid = %s", [doc])
+
+    def search(self, cursor, query, kinds, limit):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        # Quote every term so user input can't inject FTS5 syntax; prefix-match the last one
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+        where, params = self._kind_filter(kinds)
+        cursor.execute(
+            f"SELECT rowid, title, "
+            f"snippet({TABLE}, 1, %s, %s, '…', 24), "
+            f"bm25({TABLE}, 10.0, 1.0) AS score "
+            f"FROM {TABLE} WHERE {TABLE} MATCH %s{where} "
+            f"ORDER BY score LIMIT %s",
+            [MARK_START, MARK_END, match, *params, limit],
+        )
+        return [SearchHit(row[0], row[1], row[2], -row[3]) for row in cursor.fetchall()]
+
+    def _kind_filter(self, kinds):
+        if not kinds or len(kinds) == len(KINDS):
+            return '', []
+        offsets = [KINDS[kind] for kind in kinds]
+        placeholders = ', '.join(['%s'] * len(offsets))
+        return f" AND rowid %% {len(KINDS)} IN ({placeholders})", offsets
+
+
+class PostgresBackend:
+    """Weighted tsvector column behind a GIN index, ranked with ts_rank_cd"""
+
+    def setup(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {TABLE} ("
+            f"id bigint PRIMARY KEY, title text NOT NULL, body text NOT NULL, "
+            f"document tsvector GENERATED ALWAYS AS ("
+            f"setweight(to_tsvector('english', title), 'A') || "
+            f"setweight(to_tsvector('english', body), 'B')) STORED)"
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {TABLE}_document ON {TABLE} USING GIN (document)")
+
+    def upsert(self, cursor, doc, title, body):
+        cursor.execute(
+            f"INSERT INTO {TABLE} (id, title, body) VALUES (%s, %s, %s) "
+            f"ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, body = EXCLUDED.body",
+            [doc, title, body],
+        )
+
+    def delete(self, cursor, doc):
+        cursor.execute(f"DELETE FROM {TABLE} WHERE id = %s", [doc])
+
+    def search(self, cursor, query, kinds, limit):
+        terms = query_terms(query)
+        if not terms:
+            return []
+        tsquery = ' & '.join(terms) + ':*'
+        where, params = self._kind_filter(kinds)
+        # Rank and LIMIT first so ts_headline only runs on the rows returned
+        cursor.execute(
+            f"SELECT id, title, "
+            f"ts_headline('english', body, q, %s), score FROM ("
+            f"SELECT id, title, body, q, ts_rank_cd(document, q, 32) AS score "
+            f"FROM {TABLE}, to_tsquery('english', %s) q "
+            f"WHERE document @@ q{where} ORDER BY score DESC LIMIT %s) hits "
+            f"ORDER BY score DESC",
+            [f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=30, MinWords=15',
+             tsquery, *params, limit],
+        )
+        return [SearchHit(row[0], row[1], row[2], row[3]) for row in cursor.fetchall()]
+
+    def _kind_filter(self, kinds):
+        if not kinds or len(kinds) == len(KINDS):
+            return '', []
+        offsets = [KINDS[kind] for kind in kinds]
+        placeholders = ', '.join(['%s'] * len(offsets))
+        return f" AND id %% {len(KINDS)} IN ({placeholders})", offsets
+
+
+BACKENDS = {
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgresBackend,
+}
+
+def get_backend():
+    try:
+        return BACKENDS[connection.vendor]()
+    except KeyError:
+        raise NotImplementedError(f'Full-text search is not available on {connection.vendor}')
+
+
+def create_index(using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create the index table if it is missing.
+
+    Connected to post_migrate, so ``migrate`` (and the test runner) sets it
+    up outside any request or test transaction; ``rebuild_search_index``
+    runs it too. Databases without a backend are left alone.
+    """
+    db = connections[using]
+    if db.vendor in BACKENDS:
+        with db.cursor() as cursor:
+            BACKENDS[db.vendor]().setup(cursor)
+
+
+def kind_of(instance):
+    kind = instance._meta.model_name
+    if kind not in KINDS:
+        raise TypeError(f'{type(instance).__name__} is not searchable')
+    return kind
+
+
+def document_for(instance):
+    """(title, body) to index for a Blog or Webinar, or None if it shouldn't be searchable"""
+    if kind_of(instance) == 'blog':
+        if not instance.is_published:
+            return None
+        return instance.title, f'{instance.snippet} {strip_html(instance.body)}'
+    return instance.title, strip_html(instance.description)
+
+
+def index_object(instance):
+    """Add, refresh or drop a single object's entry"""
+    backend = get_backend()
+    doc = doc_id(kind_of(instance), instance.pk)
+    document = document_for(instance)
+    with connection.cursor() as cursor:
+        if document is None:
+            backend.delete(cursor, doc)
+        else:
+            backend.upsert(cursor, doc, *document)
+
+
+def remove_object(kind, pk):
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        backend.delete(cursor, doc_id(kind, pk))
+
+
+def reindex(kind, pk):
+    """Bring one post's or webinar's entry up to date with its row, dropping it if the row is gone"""
+    from .models import Blog, Webinar
+
+    model = {'blog': Blog, 'webinar': Webinar}[kind]
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        remove_object(kind, pk)
+    else:
+        index_object(instance)
+
+
+def rebuild(chunk_size=500):
+    """Re-index every post and webinar; returns the number of documents written"""
+    from .models import Blog, Webinar
+
+    create_index()
+    backend = get_backend()
+    written = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLE}")
+        for queryset in (Blog.objects.published(), Webinar.objects.all()):
+            for instance in queryset.iterator(chunk_size=chunk_size):
+                backend.upsert(cursor, doc_id(kind_of(instance), instance.pk), *document_for(instance))
+                written += 1
+    return written
+
+
+def search(query, kinds=None, limit=20):
+    """Ranked hits for ``query``, optionally restricted to some of KINDS"""
+    backend = get_backend()
+    with connection.cursor() as cursor:
+        return backend.search(cursor, query, kinds, limit)
@@ -0,0 +1,136 @@
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache, notifications, registrations, related, search, tasks, uploads
+from .counters import SEAT_STATUSES, adjust_comment_count, adjust_registration_counts
+from .models import Blog, Category, Comment, Speaker, User, Webinar, WebinarRegistration
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        adjust_comment_count(instance.blog_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    adjust_comment_count(instance.blog_id, -1)
+
+
+@receiver(post_save, sender=WebinarRegistration)
+def registration_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_loaded_status', None)
+    if created:
+        # registrations.register() moves the counters while reserving the seat
+        if not getattr(instance, '_counted', False):
+            adjust_registration_counts(instance.webinar_id, total=1, statuses={instance.status: 1})
+        notifications.notify_status(instance)
+    elif previous != instance.status:
+        statuses = {previous: -1}
+        # registrations.hold_seat() already counted it into its new status
+        if not getattr(instance, '_seat_held', False):
+            statuses[instance.status] = 1
+        adjust_registration_counts(instance.webinar_id, statuses=statuses)
+        notifications.notify_status(instance)
+        if previous in SEAT_STATUSES and instance.status not in SEAT_STATUSES:
+            registrations.promote_waitlist(instance.webinar_id)
+    instance._loaded_status = instance.status
+    instance._seat_held = False
+    registrations.forget_registered_webinars(instance.user_id)
+
+
+@receiver(post_delete, sender=WebinarRegistration)
+def registration_deleted(sender, instance, **kwargs):
+    status = getattr(instance, '_loaded_status', instance.status)
+    adjust_registration_counts(instance.webinar_id, total=-1, statuses={status: -1})
+    registrations.forget_registered_webinars(instance.user_id)
+    if status in SEAT_STATUSES:
+        registrations.promote_waitlist(instance.webinar_id)
+
+
+@receiver(post_save, sender=User)
+def user_registrations_linked(sender, instance, created, raw=False, **kwargs):
+    # Registrations made with this email before the account existed
+    if created and not raw and instance.email:
+        WebinarRegistration.objects.filter(user__isnull=True, email=instance.email).update(user=instance)
+
+
+@receiver(post_save, sender=Webinar)
+def webinar_capacity_saved(sender, instance, created, raw=False, **kwargs):
+    # A raised or removed capacity frees seats for the waitlist
+    if not created and not raw and instance.waitlist_count:
+        registrations.promote_waitlist(instance.pk)
+
+
+# The index is derived data, so the worker updates it rather than the saving request
+@receiver(post_save, sender=Blog)
+@receiver(post_save, sender=Webinar)
+def searchable_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tasks.reindex_search.delay(search.kind_of(instance), instance.pk)
+
+
+@receiver(post_delete, sender=Blog)
+@receiver(post_delete, sender=Webinar)
+def searchable_deleted(sender, instance, **kwargs):
+    tasks.reindex_search.delay(search.kind_of(instance), instance.pk)
+
+
+# Term weights and neighbour lists grow with the corpus, so they are rebuilt off the request too
+@receiver(post_save, sender=Blog)
+def blog_related_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        tasks.update_related_posts.delay(instance.pk)
+
+
+@receiver(pre_delete, sender=Blog)
+def blog_related_deleting(sender, instance, **kwargs):
+    # The cascade removes this post from other lists, so note whose to refill
+    instance._linked_from = related.linking_to(instance)
+
+
+@receiver(post_delete, sender=Blog)
+def blog_related_deleted(sender, instance, **kwargs):
+    linked_from = getattr(instance, '_linked_from', ())
+    if linked_from:
+        tasks.refresh_related_posts.delay(sorted(linked_from))
+
+
+# Uploaded images are re-encoded under a content hash before the row is
+# written, and their derivatives are built off the request once it commits
+UPLOAD_FIELDS = {
+    User: 'profile_picture',
+    WebinarRegistration: 'payment_reference',
+}
+
+
+@receiver(pre_save, sender=User)
+@receiver(pre_save, sender=WebinarRegistration)
+def upload_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        instance._new_upload = uploads.normalize(getattr(instance, UPLOAD_FIELDS[sender]))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=WebinarRegistration)
+def upload_saved(sender, instance, raw=False, **kwargs):
+    if getattr(instance, '_new_upload', False):
+        instance._new_upload = False
+        uploads.schedule_on_commit(getattr(instance, UPLOAD_FIELDS[sender]))
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=WebinarRegistration)
+def upload_deleted(sender, instance, **kwargs):
+    field = UPLOAD_FIELDS[sender]
+    uploads.remove_on_commit(sender, field, [getattr(instance, field).name])
+
+
+cache.register(Blog, 'blogs', 'home')
+cache.register(Category, 'blogs')
+cache.register(Webinar, 'webinars', 'home')
+cache.register(Speaker, 'webinars')
+cache.register(WebinarRegistration, 'webinars', 'home')
+cache.register(Comment, 'blogs', lambda comment: cache.comments_group(comment.blog_id))
@@ -0,0 +1,228 @@
+import logging
+import os
+import random
+import signal
+import socket
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, Count, F, Max, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = getattr(settings, 'TASK_MAX_ATTEMPTS', 5)
+DEFAULT_TIMEOUT = getattr(settings, 'TASK_TIMEOUT', 300)
+# First retry waits this many seconds, doubling on every further attempt
+RETRY_BACKOFF = getattr(settings, 'TASK_RETRY_BACKOFF', 30)
+
+_registry = {}
+
+
+class TaskTimeout(Exception):
+    pass
+
+
+class TaskDefinition:
+    def __init__(self, func, name, max_attempts, timeout, backoff):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.backoff = backoff
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return enqueue(self.name, *args, **kwargs)
+
+
+def task(name=None, max_attempts=DEFAULT_MAX_ATTEMPTS, timeout=DEFAULT_TIMEOUT, backoff=RETRY_BACKOFF):
+    """Register a function as a background task; call ``.delay(...)`` to enqueue it"""
+    def decorator(func):
+        definition = TaskDefinition(func, name or f'{func.__module__}.{func.__name__}', max_attempts, timeout, backoff)
+        _registry[definition.name] = definition
+        return definition
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f'Unknown task {name!r}')
+
+
+def _model():
+    return apps.get_model('core', 'Task')
+
+
+def enqueue(name, *args, idempotency_key=None, delay=0, **kwargs):
+    """Queue a task by registered name. Arguments must be JSON-serialisable.
+
+    Enqueueing inside a transaction only makes the task visible once it
+    commits. With an ``idempotency_key``, enqueueing the same work twice
+    returns the existing task instead of creating a second one.
+    """
+    definition = get_task(name)
+    # Run inline instead, e.g. in tests or a single-process dev server
+    if getattr(settings, 'TASKS_ALWAYS_EAGER', False):
+        definition(*args, **kwargs)
+        return None
+
+    Task = _model()
+    fields = {
+        'name': name,
+        'args': list(args),
+        'kwargs': kwargs,
+        'max_attempts': definition.max_attempts,
+        'run_after': timezone.now() + timedelta(seconds=delay),
+    }
+    if idempotency_key is None:
+        return Task.objects.create(**fields)
+    try:
+        with transaction.atomic():
+            return Task.objects.create(idempotency_key=idempotency_key, **fields)
+    except IntegrityError:
+        return Task.objects.get(idempotency_key=idempotency_key)
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def requeue_expired():
+    """Hand back tasks whose worker died or overran its lease"""
+    return _model().objects.filter(status='running', locked_until__lt=timezone.now()).update(
+        status='queued', locked_by='', locked_until=None,
+    )
+
+
+def claim(limit=10, worker=None):
+    """Atomically take up to ``limit`` due tasks for this worker.
+
+    Each row is claimed with a conditional UPDATE, so concurrent workers
+    on any database never run the same task twice.
+    """
+    Task = _model()
+    worker = worker or worker_id()
+    now = timezone.now()
+    candidates = list(
+        Task.objects.filter(status='queued', run_after__lte=now)
+        .order_by('run_after', 'id').values_list('id', 'name')[:limit]
+    )
+    claimed = []
+    for pk, name in candidates:
+        timeout = _registry[name].timeout if name in _registry else DEFAULT_TIMEOUT
+        taken = Task.objects.filter(pk=pk, status='queued').update(
+            status='running', locked_by=worker,
+            locked_until=now + timedelta(seconds=timeout), attempts=F('attempts') + 1,
+        )
+        if taken:
+            claimed.append(pk)
+    return list(Task.objects.filter(pk__in=claimed).order_by('run_after', 'id'))
+
+
+@contextmanager
+def _time_limit(seconds):
+    # SIGALRM only works in the main thread of a Unix process, which is where runworker runs tasks
+    if not seconds or not hasattr(signal, 'SIGALRM'):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise TaskTimeout(f'Task exceeded {seconds}s')
+
+    try:
+        previous = signal.signal(signal.SIGALRM, expire)
+    except ValueError:
+        yield
+        return
+    signal.alarm(seconds)
+    try:
+        yield
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _start(task_row):
+    """Renew a claimed task's lease as it starts; False if it is no longer ours.
+
+    Tasks in a batch run one after another, so a later one can outwait the
+    lease it got at claim time and be handed to another worker meanwhile.
+    """
+    now = timezone.now()
+    timeout = _registry[task_row.name].timeout if task_row.name in _registry else DEFAULT_TIMEOUT
+    return bool(_model().objects.filter(pk=task_row.pk, status='running', locked_by=task_row.locked_by).update(
+        started_at=now, locked_until=now + timedelta(seconds=timeout),
+    ))
+
+
+def execute(task_row):
+    """Run one claimed task and record its outcome, timing and any retry"""
+    Task = _model()
+    if not _start(task_row):
+        logger.warning("Task %s #%s lost its lease before it started; skipping", task_row.name, task_row.pk)
+        return False
+    started = time.perf_counter()
+    try:
+        definition = get_task(task_row.name)
+        with _time_limit(definition.timeout):
+            definition(*task_row.args, **task_row.kwargs)
+    except Exception as exc:
+        duration = int((time.perf_counter() - started) * 1000)
+        error = ''.join(traceback.format_exception(exc))[-5000:]
+        backoff = _registry[task_row.name].backoff if task_row.name in _registry else RETRY_BACKOFF
+        if task_row.attempts >= task_row.max_attempts:
+            Task.objects.filter(pk=task_row.pk).update(
+                status='failed', last_error=error, duration_ms=duration,
+                finished_at=timezone.now(), locked_by='', locked_until=None,
+            )
+            logger.error("Task %s #%s failed permanently: %s", task_row.name, task_row.pk, exc)
+        else:
+            wait = backoff * 2 ** (task_row.attempts - 1) * random.uniform(0.8, 1.2)
+            Task.objects.filter(pk=task_row.pk).update(
+                status='queued', last_error=error, duration_ms=duration,
+                run_after=timezone.now() + timedelta(seconds=wait), locked_by='', locked_until=None,
+            )
+            logger.warning("Task %s #%s failed (attempt %s), retrying in %.0fs", task_row.name, task_row.pk, task_row.attempts, wait)
+        return False
+
+    Task.objects.filter(pk=task_row.pk).update(
+        status='done', duration_ms=int((time.perf_counter() - started) * 1000),
+        finished_at=timezone.now(), last_error='', locked_by='', locked_until=None,
+    )
+    return True
+
+
+def run_pending(limit=10, worker=None):
+    """Claim and run one batch; returns the number of tasks processed"""
+    requeue_expired()
+    tasks = claim(limit, worker)
+    for task_row in tasks:
+        execute(task_row)
+    return len(tasks)
+
+
+def stats(since=None):
+    """Per-task counts and timings, e.g. for ``runworker --stats``"""
+    queryset = _model().objects.all()
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    return list(
+        queryset.values('name').annotate(
+            queued=Count('id', filter=Q(status='queued')),
+            running=Count('id', filter=Q(status='running')),
+            done=Count('id', filter=Q(status='done')),
+            failed=Count('id', filter=Q(status='failed')),
+            avg_ms=Avg('duration_ms', filter=Q(status='done')),
+            max_ms=Max('duration_ms', filter=Q(status='done')),
+        ).order_by('name')
+    )
@@ -0,0 +1,49 @@
+from django.apps import apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from . import notifications, related, search, uploads
+from .taskqueue import task
+
+
+@task('core.attach_upload')
+def attach_upload(model_label, pk, field, path, filename):
+    """Set a file stashed by uploads.detach_uploads() on its row, running the field's upload"""
+    instance = apps.get_model(model_label).objects.filter(pk=pk).first()
+    if instance is not None:
+        with uploads.stash_storage.open(path, 'rb') as handle:
+            setattr(instance, field, SimpleUploadedFile(filename, handle.read()))
+        instance.save(update_fields=[field])
+    uploads.stash_storage.delete(path)
+
+
+@task('core.generate_derivatives', max_attempts=3)
+def generate_derivatives(name):
+    uploads.generate_derivatives(name)
+
+
+@task('core.remove_uploads')
+def remove_uploads(model_label, field, names):
+    uploads.remove_unreferenced(model_label, field, names)
+
+
+@task('core.reindex_search')
+def reindex_search(kind, pk):
+    search.reindex(kind, pk)
+
+
+@task('core.update_related_posts')
+def update_related_posts(blog_id):
+    related.reindex(blog_id)
+
+
+@task('core.refresh_related_posts')
+def refresh_related_posts(blog_ids):
+    related.refresh_neighbours(blog_ids)
+
+
+@task('core.send_notifications')
+def send_notifications():
+    notifications.requeue_stale()
+    # Keep going while batches come back full
+    while notifications.deliver() == notifications.BATCH_SIZE:
+        pass
@@ -0,0 +1,47 @@
+from django import template
+from django.utils.html import format_html
+
+from core.images import PROFILES, image_url as build_image_url, profile_url, srcset
+from core.uploads import derivative_url
+
+register = template.Library()
+
+
+@register.filter
+def image_url(resource):
+    """Memoized URL of an image field, e.g. ``{{ blog.cover|image_url }}``"""
+    return build_image_url(resource)
+
+
+@register.filter
+def derivative(field_file, size='thumb'):
+    """Small pre-built version of a local upload, e.g. ``{{ registration.payment_reference|derivative:'thumb' }}``"""
+    return derivative_url(field_file, size)
+
+
+@register.simple_tag
+def image_src(source, profile='card'):
+    """Single URL of an image profile, e.g. for a CSS background: ``{% image_src webinar.featured_image 'hero' %}``"""
+    return profile_url(source, profile)
+
+
+@register.simple_tag
+def responsive_image(source, profile='card', alt='', css_class='', sizes=None, loading='lazy'):
+    """``<img>`` with srcset/sizes for an image field, e.g. ``{% responsive_image blog.cover 'card' alt=blog.title %}``"""
+    profile = PROFILES[profile]
+    candidates = srcset(source, profile)
+    if not candidates:
+        return ''
+    src = dict((width, url) for url, width in candidates)[profile.default_width]
+    height = profile.height_for(profile.default_width)
+    return format_html(
+        '<img src="{}" srcset="{}" sizes="{}" width="{}"{} alt="{}"{} loading="{}" decoding="async">',
+        src,
+        ', '.join(f'{url} {width}w' for url, width in candidates),
+        sizes or profile.sizes,
+        profile.default_width,
+        format_html(' height="{}"', height) if height else '',
+        alt,
+        format_html(' class="{}"', css_class) if css_class else '',
+        loading,
+    )
@@ -0,0 +1,28 @@
+from contextlib import contextmanager
+
+from django.urls import resolve
+
+from .querybudget import get_view_budget, get_view_name, record_queries
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin for asserting query counts and catching N+1 patterns"""
+
+    @contextmanager
+    def assertQueryBudget(self, budget, n_plus_one_threshold=None):
+        with record_queries() as recorder:
+            yield recorder
+        if len(recorder) > budget:
+            self.fail(f"Query budget exceeded\n{recorder.report(budget=budget)}")
+        if n_plus_one_threshold is not None and recorder.n_plus_one(n_plus_one_threshold):
+            self.fail(f"N+1 queries detected\n{recorder.report(budget=budget)}")
+
+    def assertViewWithinBudget(self, path, method='get', data=None, **extra):
+        """Request a URL and check it against the budget its view declares"""
+        match = resolve(path.split('?', 1)[0])
+        budget = get_view_budget(match.func)
+        if budget is None:
+            self.fail(f"{get_view_name(match.func)} does not declare a query budget")
+        with self.assertQueryBudget(budget) as recorder:
+            response = getattr(self.client, method)(path, data, **extra)
+        return response, recorder
@@ -1,3 +1,834 @@
-from django.test import TestCase
+import base64
+import builtins
+import io
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from cloudinary import CloudinaryResource
+from django.contrib.auth.models import AnonymousUser
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from . import async_views, attendance, cache as cache_module, images, notifications, registrations, related, schedule, search, taskqueue, throttle, uploads, views
+from .models import Blog, Category, Comment, Notification, RelatedBlog, Task, Webinar, WebinarRegistration
+from .pagination import InvalidCursor, KeysetPaginator, approximate_count
+from .testing import QueryBudgetTestMixin
+from dashboard import bulk
+from user.models import User
+
+
+def make_user(username='host', **fields):
+    return User.objects.create_user(username=username, email=f'{username}@example.com', password='pw', **fields)
+
+
+def make_webinar(host, **fields):
+    fields = {
+        'title': 'Webinar', 'description': 'About it', 'featured_image': 'sample',
+        'start_datetime': timezone.now() + timedelta(days=1), 'duration': 60, **fields,
+    }
+    return Webinar.objects.create(host=host, **fields)
+
+
+def register(webinar, n):
+    return registrations.register(WebinarRegistration(webinar=webinar, full_name='Attendee', email=f'a{n}@example.com'))
+
+
+class StoredCountersTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.webinar = make_webinar(make_user(), capacity=2)
+
+    def test_stale_save_keeps_counters(self):
+        stale = Webinar.objects.get(pk=self.webinar.pk)
+        register(self.webinar, 1)
+        register(self.webinar, 2)
+        stale.title = 'Renamed'
+        stale.save()
+
+        webinar = Webinar.objects.get(pk=self.webinar.pk)
+        self.assertEqual(webinar.title, 'Renamed')
+        self.assertEqual((webinar.registration_count, webinar.pending_count), (2, 2))
+        _, outcome = register(self.webinar, 3)
+        self.assertEqual(outcome, registrations.WAITLISTED)
+
+    def test_explicit_update_fields_are_kept(self):
+        Webinar.objects.filter(pk=self.webinar.pk).update(pending_count=1)
+        self.webinar.pending_count = 0
+        self.webinar.save(update_fields=['pending_count'])
+        self.assertEqual(Webinar.objects.get(pk=self.webinar.pk).pending_count, 0)
+
+
+class NotificationClaimTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        webinar = make_webinar(make_user())
+        for n in range(3):
+            register(webinar, n)
+
+    def test_losing_claim_returns_nothing(self):
+        ids = list(Notification.objects.values_list('pk', flat=True))
+        winner = notifications.claim()
+        # The loser read the same ids before the winner's UPDATE landed
+        with mock.patch.object(notifications, '_queued_ids', return_value=ids):
+            loser = notifications.claim()
+        self.assertEqual(len(winner), 3)
+        self.assertEqual(loser, [])
+
+    def test_deliver_sends_each_message_once(self):
+        self.assertEqual(notifications.deliver(), 3)
+        self.assertEqual(notifications.deliver(), 0)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(Notification.objects.exclude(status='sent').exists())
+
+
+class ReminderTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.webinar = make_webinar(make_user(), start_datetime=timezone.now() + timedelta(hours=2))
+        for n in range(3):
+            registration, _ = register(self.webinar, n)
+            WebinarRegistration.objects.filter(pk=registration.pk).update(status='confirmed')
+
+    def test_counts_only_the_reminders_it_queued(self):
+        self.assertEqual(notifications.queue_reminders(chunk_size=2), 3)
+        self.assertEqual(notifications.queue_reminders(chunk_size=2), 0)
+        self.assertEqual(Notification.objects.filter(kind='reminder').count(), 3)
+
+    def test_rows_a_concurrent_run_queued_are_not_counted(self):
+        insert = notifications._insert_reminders
+
+        def racing_insert(reminders):
+            # Another run queues the first reminder between the lookup and the INSERT
+            Notification.objects.create(
+                registration_id=reminders[0].registration_id, kind='reminder',
+                to_email=reminders[0].to_email, dedupe_key=reminders[0].dedupe_key,
+            )
+            return insert(reminders)
+
+        with mock.patch.object(notifications, '_insert_reminders', racing_insert):
+            self.assertEqual(notifications.queue_reminders(), 2)
+        self.assertEqual(Notification.objects.filter(kind='reminder').count(), 3)
+
+    def test_a_rescheduled_webinar_is_reminded_again(self):
+        notifications.queue_reminders()
+        self.webinar.start_datetime += timedelta(hours=1)
+        self.webinar.save()
+        self.assertEqual(notifications.queue_reminders(), 3)
+        self.assertEqual(Notification.objects.filter(kind='reminder').count(), 6)
+
+
+ran = []
+
+
+@taskqueue.task('core.tests.record')
+def record_task(value):
+    ran.append(value)
+
+
+class TaskLeaseTests(TestCase):
+    def setUp(self):
+        ran.clear()
+        for value in ('first', 'second'):
+            taskqueue.enqueue('core.tests.record', value)
+
+    def test_expired_task_is_not_run_twice(self):
+        first, second = taskqueue.claim(limit=2, worker='a')
+        # While 'a' works on the first task, the second's lease runs out and 'b' takes it over
+        Task.objects.filter(pk=second.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(taskqueue.run_pending(worker='b'), 1)
+        taskqueue.execute(first)
+        self.assertFalse(taskqueue.execute(second))
+        self.assertEqual(sorted(ran), ['first', 'second'])
+
+    def test_lease_starts_when_the_task_does(self):
+        _, second = taskqueue.claim(limit=2, worker='a')
+        Task.objects.filter(pk=second.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        before = timezone.now()
+        with mock.patch.object(record_task, 'func') as func:
+            func.side_effect = lambda value: self.assertGreater(Task.objects.get(pk=second.pk).locked_until, before)
+            self.assertTrue(taskqueue.execute(second))
+        self.assertEqual(Task.objects.get(pk=second.pk).status, 'done')
+
+
+class SeatTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user()
+        self.webinar = make_webinar(self.host, capacity=2)
+
+    def counts(self):
+        webinar = Webinar.objects.get(pk=self.webinar.pk)
+        return webinar.registration_count, webinar.pending_count, webinar.confirmed_count, webinar.waitlist_count
+
+    def test_reserve_seat_spills_to_waitlist_when_full(self):
+        self.assertEqual(registrations.reserve_seat(self.webinar.pk), 'pending')
+        self.assertEqual(registrations.reserve_seat(self.webinar.pk), 'pending')
+        self.assertEqual(registrations.reserve_seat(self.webinar.pk), 'waitlisted')
+        self.assertEqual(self.counts(), (3, 2, 0, 1))
+
+    def test_cancellation_promotes_longest_waiting(self):
+        first, _ = register(self.webinar, 1)
+        register(self.webinar, 2)
+        waiting, _ = register(self.webinar, 3)
+        register(self.webinar, 4)
+        first.status = 'cancelled'
+        first.save()
+        self.assertEqual(WebinarRegistration.objects.get(pk=waiting.pk).status, 'pending')
+        self.assertEqual(self.counts(), (4, 2, 0, 1))
+        self.assertEqual(registrations.promote_waitlist(self.webinar.pk), 0)
+
+    def test_duplicate_registration_keeps_one_seat(self):
+        original, _ = register(self.webinar, 1)
+        registration, outcome = register(self.webinar, 1)
+        self.assertEqual(outcome, registrations.DUPLICATE)
+        self.assertEqual(registration.pk, original.pk)
+        self.assertEqual(self.counts(), (1, 1, 0, 0))
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_duplicate_registration_discards_its_upload(self):
+        attendee = make_user('attendee')
+        WebinarRegistration.objects.create(webinar=self.webinar, user=attendee, full_name='A', email=attendee.email, status='pending')
+        self.client.force_login(attendee)
+        upload = SimpleUploadedFile('receipt.pdf', b'%PDF-1.4 receipt', content_type='application/pdf')
+        response = self.client.post(reverse('webinar_detail', args=[self.webinar.pk]), {'question': 'Hi', 'payment_reference': upload})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(default_storage.listdir('pending-uploads')[1], [])
+
+    def test_take_seats_grants_only_what_is_left(self):
+        register(self.webinar, 1)
+        self.assertEqual(registrations.take_seats(self.webinar.pk, 'confirmed', 3), 1)
+        self.assertEqual(registrations.take_seats(self.webinar.pk, 'confirmed', 1), 0)
+        self.assertEqual(self.counts(), (1, 1, 1, 0))
+
+    def test_bulk_confirm_from_waitlist_respects_capacity(self):
+        seated = [register(self.webinar, n)[0] for n in range(2)]
+        waiting = [register(self.webinar, n)[0] for n in range(2, 4)]
+        results = bulk.apply('confirm', [r.pk for r in seated + waiting])
+        self.assertEqual(sorted(results['updated']), sorted(r.pk for r in seated))
+        self.assertEqual(sorted(results['full']), sorted(r.pk for r in waiting))
+        self.assertEqual(self.counts(), (4, 0, 2, 2))
+
+        bulk.apply('cancel', [seated[0].pk])
+        self.assertEqual(self.counts(), (4, 1, 1, 1))
+        results = bulk.apply('confirm', [waiting[1].pk])
+        self.assertEqual(results['full'], [waiting[1].pk])
+
+    def test_admin_edit_cannot_seat_into_a_full_webinar(self):
+        register(self.webinar, 1)
+        register(self.webinar, 2)
+        waiting, _ = register(self.webinar, 3)
+        self.client.force_login(make_user('admin', is_staff=True, is_superuser=True))
+        data = {'full_name': 'Attendee', 'email': waiting.email, 'status': 'confirmed', 'question': ''}
+        response = self.client.post(reverse('registration_edit', args=[waiting.pk]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(WebinarRegistration.objects.get(pk=waiting.pk).status, 'waitlisted')
+        self.assertEqual(self.counts(), (3, 2, 0, 1))
+
+
+@mock.patch.object(attendance, '_schedule_flush')
+class AttendanceFlushTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        attendance._buffer.clear()
+        self.user = make_user('attendee')
+        self.webinar = make_webinar(make_user(), start_datetime=timezone.now())
+        self.registration = WebinarRegistration.objects.create(
+            webinar=self.webinar, user=self.user, full_name='A', email=self.user.email, status='confirmed',
+        )
+        self.start = timezone.now().timestamp()
+
+    def assertAttended(self, joined, left):
+        registration = WebinarRegistration.objects.get(pk=self.registration.pk)
+        self.assertAlmostEqual(registration.joined_at.timestamp(), joined, places=3)
+        self.assertAlmostEqual(registration.left_at.timestamp(), left, places=3)
+
+    def test_flush_keeps_earliest_join_and_latest_leave(self, schedule_flush):
+        attendance.record(self.webinar.pk, self.user.pk, 'join', now=self.start + 60)
+        attendance.record(self.webinar.pk, self.user.pk, 'heartbeat', now=self.start + 90)
+        self.assertEqual(attendance.flush(), 1)
+        # Another worker buffered an earlier join and a leave before this one's heartbeat
+        attendance.record(self.webinar.pk, self.user.pk, 'join', now=self.start)
+        attendance.record(self.webinar.pk, self.user.pk, 'leave', now=self.start + 30)
+        attendance.flush()
+        self.assertAttended(self.start, self.start + 90)
+
+    def test_failed_flush_is_retried(self, schedule_flush):
+        attendance.record(self.webinar.pk, self.user.pk, 'join', now=self.start)
+        with mock.patch.object(WebinarRegistration.objects, 'bulk_update', side_effect=DatabaseError('down')):
+            with self.assertRaises(DatabaseError):
+                attendance.flush()
+        attendance.record(self.webinar.pk, self.user.pk, 'heartbeat', now=self.start + 30)
+        self.assertEqual(attendance.flush(), 1)
+        self.assertAttended(self.start, self.start + 30)
+
+    def test_heartbeats_count_each_attendee_once(self, schedule_flush):
+        for offset in (0, 1, 2):
+            attendance.record(self.webinar.pk, self.user.pk, 'heartbeat', now=self.start + offset)
+        self.assertEqual(attendance.attendee_count(self.webinar.pk, now=self.start + 2), 1)
+        self.assertEqual(attendance.flush(), 1)
+
+
+@mock.patch.dict(throttle.RATES, {'comment': '2/min'})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def request(self, user, ip):
+        request = self.factory.post('/', REMOTE_ADDR=ip)
+        request.user = user
+        return request
+
+    def test_refused_request_spends_nothing(self):
+        alice, bob = make_user('alice'), make_user('bob')
+        self.assertFalse(throttle.check(self.request(alice, '10.0.0.1'), 'comment'))
+        self.assertFalse(throttle.check(self.request(bob, '10.0.0.1'), 'comment'))
+        # The shared IP is spent; alice's own bucket must still have her second token
+        self.assertTrue(throttle.check(self.request(alice, '10.0.0.1'), 'comment'))
+        self.assertFalse(throttle.check(self.request(alice, '10.0.0.2'), 'comment'))
+        self.assertTrue(throttle.check(self.request(alice, '10.0.0.3'), 'comment'))
+
+    @mock.patch.object(throttle, 'PROXY_COUNT', 1)
+    def test_client_ip_behind_a_proxy(self):
+        request = self.factory.post('/', REMOTE_ADDR='10.0.0.254', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.9')
+        self.assertEqual(throttle.client_ip(request), '203.0.113.9')
+
+    def test_local_fallback_when_cache_is_down(self):
+        user = make_user('carol')
+        with mock.patch.object(throttle.cache, 'get_many', side_effect=ConnectionError('down')):
+            self.assertFalse(throttle.check(self.request(user, '10.0.0.9'), 'comment'))
+            self.assertFalse(throttle.check(self.request(user, '10.0.0.9'), 'comment'))
+            self.assertTrue(throttle.check(self.request(user, '10.0.0.9'), 'comment'))
+
+
+class AsyncViewContextTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.webinar = make_webinar(self.user)
+        register(self.webinar, 1)
+        WebinarRegistration.objects.filter(webinar=self.webinar).update(user=self.user)
+        self.blog = Blog.objects.create(
+            cover='sample', title='Post', author=self.user, category=Category.objects.create(name='Tech'),
+            snippet='s', body='<p>b</p>', status='Published',
+        )
+
+    def contexts(self, name, pk):
+        """The context each twin of a detail view hands to its template"""
+        request = RequestFactory().get(reverse(name, args=[pk]))
+        request.user = self.user
+        with mock.patch.object(views, 'render') as render:
+            getattr(views, name)(request, pk=pk)
+        with mock.patch.object(async_views, 'arender', new_callable=mock.AsyncMock) as arender:
+            async_to_sync(getattr(async_views, name))(request, pk=pk)
+        return render.call_args.args[2], arender.call_args.args[2]
+
+    def test_blogpost(self):
+        sync, async_ = self.contexts('blogpost', self.blog.pk)
+        self.assertEqual(sync.keys(), async_.keys())
+        self.assertEqual(sync['comments_version'], async_['comments_version'])
+
+    def test_webinar_detail(self):
+        sync, async_ = self.contexts('webinar_detail', self.webinar.pk)
+        self.assertEqual(sync.keys(), async_.keys())
+        self.assertEqual((sync['is_registered'], async_['is_registered']), (True, True))
+
+
+class ScheduleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user()
+        self.now = timezone.now()
+
+    def webinar(self, started, status='upcoming', duration=60):
+        return make_webinar(self.host, start_datetime=self.now - started, duration=duration, status=status)
+
+    def status_of(self, webinar):
+        return Webinar.objects.values_list('status', flat=True).get(pk=webinar.pk)
+
+    def test_started_webinars_go_live(self):
+        started = self.webinar(timedelta(minutes=10))
+        later = self.webinar(-timedelta(hours=1))
+        self.assertEqual(schedule.advance(self.now), {'live': 1, 'completed': 0})
+        self.assertEqual((self.status_of(started), self.status_of(later)), ('live', 'upcoming'))
+
+    def test_ended_webinars_complete_even_if_never_live(self):
+        missed = self.webinar(timedelta(hours=2))
+        ended = self.webinar(timedelta(minutes=90), status='live')
+        running = self.webinar(timedelta(minutes=30), status='live')
+        self.assertEqual(schedule.advance(self.now), {'live': 0, 'completed': 2})
+        self.assertEqual([self.status_of(w) for w in (missed, ended, running)], ['completed', 'completed', 'live'])
+
+    def test_cancelled_webinars_are_left_alone(self):
+        cancelled = self.webinar(timedelta(hours=2), status='cancelled')
+        self.assertEqual(schedule.advance(self.now), {'live': 0, 'completed': 0})
+        self.assertEqual(self.status_of(cancelled), 'cancelled')
+
+    def test_a_row_edited_between_select_and_update_keeps_the_edit(self):
+        edited = self.webinar(timedelta(minutes=10))
+        other = self.webinar(timedelta(minutes=20))
+        selected = []
+
+        def select_then_cancel(rows):
+            pks = builtins.list(rows)
+            if edited.pk in pks and not selected:
+                # An admin cancels the webinar after the chunk was read
+                Webinar.objects.filter(pk=edited.pk).update(status='cancelled')
+                selected.append(pks)
+            return pks
+
+        with mock.patch('core.schedule.list', select_then_cancel, create=True):
+            schedule.advance(self.now)
+        self.assertTrue(selected)
+        self.assertEqual((self.status_of(edited), self.status_of(other)), ('cancelled', 'live'))
+
+    def test_next_transition(self):
+        self.assertIsNone(schedule.next_transition(self.now))
+        self.webinar(-timedelta(hours=3))
+        self.webinar(timedelta(minutes=30), status='live')
+        self.webinar(-timedelta(minutes=10), status='cancelled')
+        self.assertEqual(schedule.next_transition(self.now), self.now + timedelta(minutes=30))
+        self.webinar(-timedelta(minutes=20))
+        self.assertEqual(schedule.next_transition(self.now), self.now + timedelta(minutes=20))
+
+
+@override_settings(IMAGE_RENDERER='local', MEDIA_ROOT=tempfile.mkdtemp())
+class PaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.blog = Blog.objects.create(
+            cover='sample', title='Post', author=make_user(), category=Category.objects.create(name='Tech'),
+            snippet='s', body='<p>b</p>', status='Published',
+        )
+        for n in range(5):
+            Comment.objects.create(blog=self.blog, name=f'Reader {n}', body='Nice')
+        # Every row shares one sort key, so only the id orders them
+        Comment.objects.update(created_at=timezone.now())
+        self.ids = list(Comment.objects.order_by('-id').values_list('pk', flat=True))
+        self.paginator = KeysetPaginator(Comment.objects.all(), ('-created_at', '-id'), per_page=2)
+
+    def ids_of(self, page):
+        return [comment.pk for comment in page]
+
+    def test_ties_on_the_sort_key_break_on_the_id(self):
+        seen, cursor = [], None
+        while True:
+            page = self.paginator.page(cursor)
+            seen += self.ids_of(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.ids)
+
+    def test_cursors_walk_forwards_and_back(self):
+        first = self.paginator.page()
+        second = self.paginator.page(first.next_cursor)
+        third = self.paginator.page(second.next_cursor)
+        self.assertEqual(self.ids_of(third), self.ids[4:])
+        self.assertFalse(third.has_next)
+
+        back = self.paginator.page(third.previous_cursor)
+        self.assertEqual(self.ids_of(back), self.ids_of(second))
+        self.assertTrue(back.has_next)
+        start = self.paginator.page(back.previous_cursor)
+        self.assertEqual(self.ids_of(start), self.ids[:2])
+        self.assertFalse(start.has_previous)
+
+    def test_invalid_and_tampered_cursors_are_rejected(self):
+        valid = self.paginator.page().next_cursor
+        payload = json.loads(base64.urlsafe_b64decode(valid + '=' * (-len(valid) % 4)))
+
+        def encode(**changes):
+            return base64.urlsafe_b64encode(json.dumps({**payload, **changes}).encode()).decode()
+
+        for cursor in ('not-a-cursor', valid[:-3], encode(v=['yesterday', '1']), encode(v=payload['v'][:1]), encode(d='x')):
+            with self.subTest(cursor=cursor), self.assertRaises(InvalidCursor):
+                self.paginator.page(cursor)
+
+    def test_invalid_cursors_are_404s(self):
+        response = self.client.get(reverse('blog_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+        request = RequestFactory().get('/blog/', {'cursor': 'not-a-cursor'})
+        request.user = AnonymousUser()
+        with self.assertRaises(Http404):
+            views.blog.as_view()(request)
+
+    def test_approximate_count_falls_back_to_a_cached_count(self):
+        comments = Comment.objects.filter(blog=self.blog)
+        self.assertEqual(approximate_count(comments), 5)
+        Comment.objects.create(blog=self.blog, name='Late', body='Nice')
+        with self.assertNumQueries(0):
+            self.assertEqual(approximate_count(comments), 5)
+        cache.clear()
+        self.assertEqual(approximate_count(comments), 6)
+
+
+@override_settings(IMAGE_RENDERER='local', MEDIA_ROOT=tempfile.mkdtemp())
+class BlogCommentsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user(first_name='Ada', last_name='Lovelace')
+        self.blog = Blog.objects.create(
+            cover='sample', title='Post', author=self.user, category=Category.objects.create(name='Tech'),
+            snippet='s', body='<p>b</p>', status='Published', is_verified=True,
+        )
+        for n in range(views.COMMENTS_PAGE_SIZE + 5):
+            Comment.objects.create(blog=self.blog, name=f'Reader {n}', body=f'Comment {n}')
+        self.client.force_login(self.user)
+        self.url = reverse('blog_comments', args=[self.blog.pk])
+
+    def test_json_pages_follow_the_next_cursor(self):
+        first = self.client.get(self.url, {'format': 'json'}).json()
+        self.assertEqual(len(first['results']), views.COMMENTS_PAGE_SIZE)
+        self.assertEqual(first['results'][0]['body'], f'Comment {views.COMMENTS_PAGE_SIZE + 4}')
+        second = self.client.get(self.url, {'format': 'json', 'cursor': first['next']}).json()
+        self.assertEqual([comment['body'] for comment in second['results']], [f'Comment {n}' for n in range(4, -1, -1)])
+        self.assertIsNone(second['next'])
+
+    def test_fragments_carry_the_next_cursor_in_a_header(self):
+        first = self.client.get(self.url)
+        self.assertContains(first, f'Comment {views.COMMENTS_PAGE_SIZE + 4}')
+        self.assertEqual(first['X-Next-Cursor'], self.client.get(self.url, {'format': 'json'}).json()['next'])
+        last = self.client.get(self.url, {'cursor': first['X-Next-Cursor']})
+        self.assertContains(last, 'Comment 0')
+        self.assertNotContains(last, 'Comment 5')
+        self.assertEqual(last['X-Next-Cursor'], '')
+
+    def test_invalid_cursor_is_a_404(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 404)
+
+    def post(self, body, **headers):
+        return self.client.post(reverse('blogpost', args=[self.blog.pk]), {'body': body}, **headers)
+
+    def test_ajax_comment_returns_the_new_row(self):
+        response = self.post('Fresh thoughts', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 201)
+        self.assertContains(response, 'Fresh thoughts', status_code=201)
+        self.assertContains(response, 'Ada Lovelace', status_code=201)
+        self.assertTrue(Comment.objects.filter(blog=self.blog, body='Fresh thoughts').exists())
+
+    def test_ajax_duplicate_is_a_409(self):
+        self.post('Same again', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        response = self.post('Same  again', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json(), {'duplicate': True})
+        self.assertEqual(Comment.objects.filter(blog=self.blog, body__startswith='Same').count(), 1)
+
+    def test_invalid_comment_is_a_400(self):
+        response = self.post('', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('body', response.json()['errors'])
+        # Without script the page is shown again with the error
+        self.assertEqual(self.post('').status_code, 400)
+
+
+@override_settings(IMAGE_RENDERER='local', MEDIA_ROOT=tempfile.mkdtemp())
+class ConditionalListingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user()
+        self.webinar = make_webinar(self.host)
+
+    def get(self, name, **headers):
+        return self.client.get(reverse(name), **headers)
+
+    def test_unchanged_listing_answers_304_without_aggregates(self):
+        first = self.get('webinar_list')
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(0):
+            again = self.get('webinar_list', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        dated = self.get('webinar_list', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(dated.status_code, 304)
+
+    def test_validators_change_after_a_write(self):
+        first = self.get('webinar_list')
+        register(self.webinar, 1)
+        after = self.get('webinar_list', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], first['ETag'])
+        self.assertGreaterEqual(cache_module.group_modified('webinars'), self.webinar.created_at)
+
+    def test_only_the_written_group_moves(self):
+        blogs = self.get('blog_list')
+        Comment.objects.create(
+            blog=Blog.objects.create(
+                cover='sample', title='Post', author=self.host, category=Category.objects.create(name='Tech'),
+                snippet='s', body='<p>b</p>', status='Published',
+            ),
+            name='Reader', body='Nice',
+        )
+        webinars = self.get('webinar_list')
+        self.assertEqual(self.get('blog_list', HTTP_IF_NONE_MATCH=blogs['ETag']).status_code, 200)
+        self.assertEqual(self.get('webinar_list', HTTP_IF_NONE_MATCH=webinars['ETag']).status_code, 304)
+
+    def test_an_emptied_cache_starts_the_clock_again(self):
+        cache.clear()
+        before = timezone.now()
+        self.assertGreaterEqual(cache_module.group_modified('blogs'), before)
+        self.assertEqual(cache_module.group_modified('blogs'), cache_module.group_modified('blogs'))
+
+
+@override_settings(IMAGE_RENDERER='local', MEDIA_ROOT=tempfile.mkdtemp())
+class ViewBudgetTests(QueryBudgetTestMixin, TestCase):
+    """The public pages stay within their declared budgets with several rows on each"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user(is_staff=True)
+        category = Category.objects.create(name='Tech')
+        self.blogs = [
+            Blog.objects.create(
+                cover='sample', title=f'Post {n}', author=make_user(f'author{n}'), category=category,
+                snippet='s', body='<p>b</p>', status='Published', is_verified=True,
+            )
+            for n in range(3)
+        ]
+        for n in range(3):
+            Comment.objects.create(blog=self.blogs[0], name=f'Reader {n}', body='Nice')
+        self.webinars = [make_webinar(make_user(f'webhost{n}'), title=f'Webinar {n}') for n in range(3)]
+        for n in range(3):
+            register(self.webinars[0], n)
+        self.client.force_login(self.user)
+
+    def assertWithinBudget(self, name, *args, query=''):
+        response, _ = self.assertViewWithinBudget(reverse(name, args=args) + query)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_listings(self):
+        self.assertWithinBudget('index')
+        self.assertWithinBudget('blog_list')
+        self.assertWithinBudget('webinar_list')
+        self.assertWithinBudget('webinar_list', query='?status=upcoming')
+
+    def test_detail_pages(self):
+        self.assertWithinBudget('blogpost', self.blogs[0].pk)
+        self.assertWithinBudget('blog_comments', self.blogs[0].pk)
+        # Heroes come from the local renderer when Cloudinary isn't configured
+        for name in ('webinar_detail', 'webinar_register'):
+            self.assertContains(self.assertWithinBudget(name, self.webinars[0].pk), '1280x720.webp')
+
+    def test_forms(self):
+        self.assertWithinBudget('create')
+        self.assertWithinBudget('update', self.blogs[0].pk)
+        self.assertWithinBudget('webinar_create')
+        self.assertContains(self.assertWithinBudget('webinar_update', self.webinars[0].pk), '1280x720.webp')
+
+    def test_other_pages(self):
+        self.assertWithinBudget('about')
+        self.assertWithinBudget('search', query='?q=post')
+        self.assertWithinBudget('registered_webinars')
+        self.assertWithinBudget('reload')
+
+
+@override_settings(IMAGE_RENDERER='local', MEDIA_ROOT=tempfile.mkdtemp())
+class LocalImageTests(TestCase):
+    def test_profile_url_renders_a_local_placeholder(self):
+        resource = CloudinaryResource('webinars/sample', type='upload', resource_type='image')
+        url = images.profile_url(resource, 'hero')
+        self.assertRegex(url, r'^/media/derivatives/.+/1280x720\.webp$')
+        self.assertTrue(default_storage.exists(url[len('/media/'):]))
+        self.assertEqual(images.profile_url(None, 'hero'), '')
+
+
+def image_upload(name='photo.png', size=(64, 48), image_format='PNG', color='red'):
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, image_format)
+    return SimpleUploadedFile(name, output.getvalue())
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class UploadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def assertRejected(self, upload, validator=uploads.UploadValidator()):
+        with self.assertRaises(ValidationError):
+            validator(upload)
+
+    def test_validator_rejects_bad_files(self):
+        self.assertRejected(SimpleUploadedFile('photo.png', b'not an image'))
+        self.assertRejected(image_upload('photo.bmp', image_format='BMP'))
+        self.assertRejected(SimpleUploadedFile('proof.pdf', b'%PDF-1.4'))
+        self.assertRejected(SimpleUploadedFile('proof.pdf', b'<html>'), uploads.UploadValidator(allow_documents=True))
+        with mock.patch.object(uploads, 'MAX_UPLOAD_BYTES', 10):
+            self.assertRejected(image_upload())
+        with mock.patch.object(uploads, 'MAX_UPLOAD_PIXELS', 100):
+            self.assertRejected(image_upload())
+
+        uploads.UploadValidator()(image_upload())
+        uploads.UploadValidator(allow_documents=True)(SimpleUploadedFile('proof.pdf', b'%PDF-1.4'))
+
+    def test_identical_uploads_share_one_content_hash_name(self):
+        first = make_user('first', profile_picture=image_upload('mine.png'))
+        second = make_user('second', profile_picture=image_upload('theirs.png'))
+        name = first.profile_picture.name
+        self.assertRegex(name, r'^profile_pictures/[0-9a-f]{32}\.(webp|avif)$')
+        self.assertEqual(second.profile_picture.name, name)
+        other = make_user('third', profile_picture=image_upload(color='blue'))
+        self.assertNotEqual(other.profile_picture.name, name)
+
+    def test_derivatives_are_built_once_the_row_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user = make_user(profile_picture=image_upload(size=(1600, 1200)))
+        name = user.profile_picture.name
+        self.assertEqual(uploads.derivative_url(user.profile_picture), user.profile_picture.url)
+        while taskqueue.run_pending():
+            pass
+        for size, (width, height) in uploads.DERIVATIVES.items():
+            with default_storage.open(uploads.derivative_name(name, size)) as handle, Image.open(handle) as image:
+                self.assertEqual(image.format, 'WEBP')
+                self.assertEqual(image.size, (width, height or width * 3 // 4))
+        self.assertTrue(uploads.derivative_url(user.profile_picture, 'card').endswith('/card.webp'))
+
+    def test_stashed_uploads_travel_through_the_stash_storage(self):
+        stash = FileSystemStorage(location=tempfile.mkdtemp())
+        user = make_user()
+        user.profile_picture = image_upload()
+        with mock.patch.object(uploads, 'stash_storage', stash):
+            stashed = uploads.detach_uploads(user, ['profile_picture'])
+            user.save()
+            [(_, path, filename)] = stashed
+            self.assertTrue(stash.exists(path))
+            self.assertFalse(default_storage.exists(path))
+            uploads.attach_later(user, stashed)
+            while taskqueue.run_pending():
+                pass
+            self.assertFalse(stash.exists(path))
+        user.refresh_from_db()
+        self.assertEqual(filename, 'photo.png')
+        self.assertRegex(user.profile_picture.name, r'^profile_pictures/[0-9a-f]{32}\.')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.author = make_user()
+        self.category = Category.objects.create(name='Tech')
+
+    def post(self, title, body, **fields):
+        fields = {'status': 'Published', 'is_verified': True, **fields}
+        return Blog.objects.create(
+            cover='sample', title=title, author=self.author, category=self.category,
+            snippet='', body=body, **fields,
+        )
+
+    def index(self):
+        while taskqueue.run_pending():
+            pass
+
+    def test_title_matches_rank_first(self):
+        body_only = self.post('Gardening notes', '<p>Compost and python scripts for watering.</p>')
+        in_title = self.post('Python for beginners', '<p>An introduction.</p>')
+        self.index()
+        self.assertEqual([hit.object_id for hit in search.search('python')], [in_title.pk, body_only.pk])
+
+    def test_type_filter(self):
+        blog = self.post('Python tips', '<p>Tips.</p>')
+        webinar = make_webinar(self.author, title='Python live', description='<p>Live coding.</p>')
+        self.index()
+        self.assertEqual({(hit.kind, hit.object_id) for hit in search.search('python')},
+                         {('blog', blog.pk), ('webinar', webinar.pk)})
+        self.assertEqual([hit.object_id for hit in search.search('python', kinds=['webinar'])], [webinar.pk])
+        self.assertEqual([hit.object_id for hit in search.search('python', kinds=['blog'])], [blog.pk])
+
+    def test_snippet_is_escaped_and_highlighted(self):
+        self.post('Tags', '<p>Writing &lt;script&gt; tags with python is risky.</p>')
+        self.index()
+        snippet = search.search('python')[0].snippet
+        self.assertIn('<mark>python</mark>', snippet)
+        self.assertIn('&lt;script&gt;', snippet)
+        self.assertNotIn('<script>', snippet)
+
+    def test_saves_reindex_through_the_queue(self):
+        blog = self.post('Django signals', '<p>Receivers.</p>')
+        self.assertEqual(search.search('django'), [])
+        self.index()
+        self.assertEqual(len(search.search('django')), 1)
+
+        blog.title = 'Flask blueprints'
+        blog.save()
+        self.index()
+        self.assertEqual(search.search('django'), [])
+        self.assertEqual(len(search.search('flask')), 1)
+
+        blog.status = 'Draft'
+        blog.save()
+        self.index()
+        self.assertEqual(search.search('flask'), [])
+
+    def test_deletes_drop_the_entry(self):
+        webinar = make_webinar(self.author, title='Rust ownership')
+        self.index()
+        webinar.delete()
+        self.index()
+        self.assertEqual(search.search('rust'), [])
+
+
+class RelatedPostsTests(TestCase):
+    WORDS = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel']
+
+    def setUp(self):
+        self.author = make_user()
+        self.category = Category.objects.create(name='Tech')
+
+    def post(self, title, body):
+        return Blog.objects.create(
+            cover='sample', title=title, author=self.author, category=self.category,
+            snippet='', body=f'<p>{body}</p>', status='Published', is_verified=True,
+        )
+
+    def run_tasks(self):
+        while taskqueue.run_pending():
+            pass
+
+    def neighbours(self, blog):
+        return list(RelatedBlog.objects.filter(blog=blog).order_by('rank').values_list('related_id', flat=True))
+
+    def test_closest_posts_are_listed(self):
+        loops = self.post('Asyncio event loops', 'Coroutines and tasks scheduled on the asyncio event loop.')
+        coroutines = self.post('Asyncio coroutines', 'Awaiting coroutines inside the asyncio loop.')
+        bread = self.post('Sourdough bread', 'Flour, water, salt and a lively starter.')
+        self.run_tasks()
+        self.assertEqual(self.neighbours(loops), [coroutines.pk])
+        self.assertEqual(self.neighbours(bread), [])
+        self.assertEqual(list(loops.get_related_blogs()), [coroutines])
+
+    def test_edit_moves_the_post_out_of_other_lists(self):
+        loops = self.post('Asyncio event loops', 'Coroutines on the asyncio event loop.')
+        coroutines = self.post('Asyncio coroutines', 'Awaiting coroutines inside the asyncio loop.')
+        self.run_tasks()
+        coroutines.title = 'Sourdough bread'
+        coroutines.body = '<p>Flour, water, salt and a lively starter.</p>'
+        coroutines.save()
+        # Stale until the worker picks the edit up
+        self.assertEqual(self.neighbours(loops), [coroutines.pk])
+        self.run_tasks()
+        self.assertEqual(self.neighbours(loops), [])
+
+    def test_delete_refills_the_lists_it_was_on(self):
+        posts = [self.post(f'Asyncio {word}', f'Asyncio coroutines and {word}.') for word in self.WORDS]
+        self.run_tasks()
+        first = posts[0]
+        listed = self.neighbours(first)
+        self.assertEqual(len(listed), related.TOP_K)
+        unlisted = next(post.pk for post in posts[1:] if post.pk not in listed)
+
+        Blog.objects.get(pk=listed[0]).delete()
+        self.assertEqual(len(self.neighbours(first)), related.TOP_K - 1)
+        self.run_tasks()
+        self.assertEqual(len(self.neighbours(first)), related.TOP_K)
+        self.assertIn(unlisted, self.neighbours(first))
+        self.assertNotIn(listed[0], self.neighbours(first))
@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.shortcuts import redirect
+
+from .lru import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# scope -> 'requests/period'; a bucket holds that many tokens and refills evenly over the period
+RATES = {
+    'comment': '5/min',
+    'registration': '10/hour',
+    'login': '10/min',
+    'signup': '5/hour',
+    **getattr(settings, 'THROTTLE_RATES', {}),
+}
+# Identical content from the same sender within this many seconds is dropped
+DUPLICATE_WINDOW = getattr(settings, 'THROTTLE_DUPLICATE_WINDOW', 60)
+# Reverse proxies in front of the app; each appends one X-Forwarded-For entry.
+# Left at 0 behind a proxy, every client shares the proxy's IP bucket (see settings).
+PROXY_COUNT = getattr(settings, 'THROTTLE_PROXY_COUNT', 0)
+
+OUTCOMES = ('allowed', 'throttled', 'duplicate')
+
+_PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+
+# Stands in for the shared cache while it is unreachable; limits become per process
+_local = LRUCache(10_000)
+_lock = threading.Lock()
+
+
+def parse_rate(rate):
+    count, period = rate.split('/')
+    return int(count), _PERIODS[period]
+
+
+def _local_get_many(keys):
+    return {key: value for key in keys if (value := _local.get(key)) is not None}
+
+
+def _local_set_many(values, timeout):
+    for key, value in values.items():
+        _local.set(key, value)
+
+
+def _add(key, timeout):
+    """Mark ``key`` for ``timeout`` seconds; False if it was already marked"""
+    try:
+        return cache.add(key, 1, timeout)
+    except Exception:
+        now = time.time()
+        with _lock:
+            if (_local.get(key) or 0) > now:
+                return False
+            _local.set(key, now + timeout)
+            return True
+
+
+def _count(scope, outcome):
+    key = f'throttle:count:{scope}:{outcome}'
+    try:
+        cache.add(key, 0, None)
+        cache.incr(key)
+    except Exception:
+        pass
+
+
+def counters():
+    """``{scope: {outcome: n}}`` since the cache was last cleared, for monitoring"""
+    keys = {f'throttle:count:{scope}:{outcome}': (scope, outcome) for scope in RATES for outcome in OUTCOMES}
+    try:
+        found = cache.get_many(keys)
+    except Exception:
+        found = {}
+    totals = {scope: dict.fromkeys(OUTCOMES, 0) for scope in RATES}
+    for key, value in found.items():
+        scope, outcome = keys[key]
+        totals[scope][outcome] = value
+    return totals
+
+
+def _spend(scope, keys, get_many, set_many):
+    capacity, period = parse_rate(RATES[scope])
+    refill = capacity / period
+    now = time.time()
+    stored = get_many(keys)
+    levels = {}
+    for key in keys:
+        tokens, stamp = stored.get(key, (capacity, now))
+        levels[key] = min(capacity, tokens + (now - stamp) * refill)
+    wait = max(0 if tokens >= 1 else (1 - tokens) / refill for tokens in levels.values())
+    if not wait:
+        set_many({key: (tokens - 1, now) for key, tokens in levels.items()}, period)
+    return wait
+
+
+def take(scope, idents):
+    """Spend one token from each of ``idents``' buckets for ``scope``.
+
+    Returns 0 when every bucket had a token, otherwise the seconds until
+    they all do; a refused request spends nothing, so being turned away
+    by one bucket never drains another. The read and write are not one
+    atomic step across processes, so a burst can overshoot by a request
+    or two; that is fine for abuse control and needs no locking in the
+    cache backend.
+    """
+    keys = [f'throttle:bucket:{scope}:{ident}' for ident in idents]
+    try:
+        return _spend(scope, keys, cache.get_many, cache.set_many)
+    except Exception as exc:
+        logger.warning("Throttle cache unavailable, using local memory: %s", exc)
+        # Only the in-process fallback needs the read and write kept together
+        with _lock:
+            return _spend(scope, keys, _local_get_many, _local_set_many)
+
+
+def client_ip(request):
+    if PROXY_COUNT:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= PROXY_COUNT:
+            return forwarded[-PROXY_COUNT]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def idents(request):
+    """Buckets a request draws from: its IP, plus its user when signed in"""
+    keys = [f'ip:{client_ip(request)}']
+    if request.user.is_authenticated:
+        keys.append(f'user:{request.user.pk}')
+    return keys
+
+
+def check(request, scope):
+    """Seconds to wait before ``request`` may write in ``scope``, or 0"""
+    wait = take(scope, idents(request))
+    _count(scope, 'throttled' if wait else 'allowed')
+    return wait
+
+
+def is_duplicate(scope, request, content):
+    """True if this sender already sent ``content`` in ``scope`` within DUPLICATE_WINDOW"""
+    digest = hashlib.sha256(' '.join(str(content).split()).lower().encode()).hexdigest()
+    duplicate = not _add(f'throttle:seen:{scope}:{idents(request)[-1]}:{digest}', DUPLICATE_WINDOW)
+    if duplicate:
+        _count(scope, 'duplicate')
+    return duplicate
+
+
+def is_ajax(request):
+    return request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+
+
+def throttled_response(request, wait):
+    retry_after = max(1, round(wait))
+    if is_ajax(request):
+        response = JsonResponse({'error': 'Too many requests', 'retry_after': retry_after}, status=429)
+    else:
+        messages.error(request, f'Too many attempts. Please try again in {retry_after} seconds.')
+        response = redirect(request.get_full_path())
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def throttle(scope, methods=('POST',)):
+    """Turn away ``methods`` requests once the sender's bucket for ``scope`` is empty"""
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method in methods:
+                wait = check(request, scope)
+                if wait:
+                    return throttled_response(request, wait)
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
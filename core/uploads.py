@@ -0,0 +1,275 @@
+import hashlib
+import logging
+import os
+import uuid
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import transaction
+from django.db.models.fields.files import FieldFile
+from django.utils.deconstruct import deconstructible
+from django.utils.functional import LazyObject
+from django.utils.module_loading import import_string
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .lru import LRUCache
+from .taskqueue import enqueue
+
+logger = logging.getLogger(__name__)
+
+MAX_UPLOAD_BYTES = getattr(settings, 'MAX_IMAGE_UPLOAD_BYTES', 10 * 1024 * 1024)
+MAX_UPLOAD_PIXELS = getattr(settings, 'MAX_IMAGE_UPLOAD_PIXELS', 40_000_000)
+# Longest edge kept for the stored original; derivatives are made from it
+MAX_DIMENSION = getattr(settings, 'MAX_IMAGE_DIMENSION', 2560)
+# 'AVIF' needs a Pillow build with an AVIF encoder; otherwise WebP is used
+UPLOAD_FORMAT = getattr(settings, 'IMAGE_UPLOAD_FORMAT', 'WEBP')
+# Dotted path of the storage uploads wait in for the worker; None uses default_storage
+STASH_STORAGE = getattr(settings, 'UPLOAD_STASH_STORAGE', None)
+
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF', 'MPO'}
+DOCUMENT_EXTENSIONS = {'.pdf'}
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.avif'}
+
+# name -> (width, height or None to keep the aspect ratio)
+DERIVATIVES = {
+    'thumb': (160, 160),
+    'card': (480, 270),
+    'preview': (1200, None),
+}
+
+_known = LRUCache(8192)
+# Files this process has already queued derivatives for
+_requested = LRUCache(8192)
+
+
+class StashStorage(LazyObject):
+    def _setup(self):
+        self._wrapped = import_string(STASH_STORAGE)() if STASH_STORAGE else default_storage
+
+
+stash_storage = StashStorage()
+
+
+def _encoder():
+    Image.init()
+    return UPLOAD_FORMAT if UPLOAD_FORMAT in Image.SAVE else 'WEBP'
+
+
+def is_image(name):
+    return os.path.splitext(name or '')[1].lower() in IMAGE_EXTENSIONS
+
+
+@deconstructible
+class UploadValidator:
+    """Reject oversized, unreadable or disallowed uploads before they are stored"""
+
+    def __init__(self, allow_documents=False):
+        self.allow_documents = allow_documents
+
+    def __call__(self, upload):
+        if upload.size > MAX_UPLOAD_BYTES:
+            raise ValidationError(f'Files must be smaller than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.')
+
+        extension = os.path.splitext(upload.name)[1].lower()
+        upload.seek(0)
+        try:
+            if self.allow_documents and extension in DOCUMENT_EXTENSIONS:
+                if upload.read(5) != b'%PDF-':
+                    raise ValidationError('Upload a valid PDF document.')
+                return
+            try:
+                with Image.open(upload) as image:
+                    image_format, (width, height) = image.format, image.size
+                    image.verify()
+            except (UnidentifiedImageError, OSError, SyntaxError, Image.DecompressionBombError):
+                raise ValidationError('Upload a valid image.')
+        finally:
+            upload.seek(0)
+
+        if image_format not in ALLOWED_FORMATS:
+            raise ValidationError(f'{image_format} images are not supported.')
+        if width * height > MAX_UPLOAD_PIXELS:
+            raise ValidationError('This image is too large.')
+
+    def __eq__(self, other):
+        return isinstance(other, UploadValidator) and self.allow_documents == other.allow_documents
+
+
+def reencode(data):
+    """Re-encode image bytes: orientation applied, EXIF and other metadata dropped, size capped"""
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.mode in ('LA', 'P') else 'RGB')
+        output = BytesIO()
+        encoder = _encoder()
+        image.save(output, encoder, quality=85)
+    return output.getvalue(), '.' + encoder.lower()
+
+
+def normalize(field_file):
+    """Store a fresh upload under a content-hash name, re-encoding images.
+
+    Call before the model is saved. Returns True when a new file was
+    stored, so derivatives can be scheduled once the row is committed.
+    Identical uploads share one stored file.
+    """
+    if not field_file or field_file._committed:
+        return False
+    field_file.seek(0)
+    data = field_file.read()
+    extension = os.path.splitext(field_file.name)[1].lower()
+    if extension not in DOCUMENT_EXTENSIONS:
+        data, extension = reencode(data)
+
+    filename = hashlib.sha256(data).hexdigest()[:32] + extension
+    name = field_file.field.generate_filename(field_file.instance, filename)
+    if default_storage.exists(name):
+        field_file.name = name
+        field_file._committed = True
+    else:
+        field_file.save(filename, ContentFile(data), save=False)
+    return True
+
+
+def derivative_name(name, size):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    # New uploads are already named by content hash; older files are keyed by path
+    key = stem if len(stem) == 32 else hashlib.md5(name.encode()).hexdigest()
+    return f'derivatives/{key[:2]}/{key}/{size}.webp'
+
+
+def generate_derivatives(name):
+    """Write every missing derivative of a stored image"""
+    with default_storage.open(name, 'rb') as handle:
+        with Image.open(handle) as source:
+            source = ImageOps.exif_transpose(source)
+            source.load()
+    for size, (width, height) in DERIVATIVES.items():
+        target = derivative_name(name, size)
+        if default_storage.exists(target):
+            continue
+        if height:
+            image = ImageOps.fit(source, (width, height), Image.LANCZOS)
+        else:
+            image = source.copy()
+            image.thumbnail((width, width * 10), Image.LANCZOS)
+        output = BytesIO()
+        image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB').save(output, 'WEBP', quality=80)
+        default_storage.save(target, ContentFile(output.getvalue()))
+
+
+def schedule_derivatives(name):
+    """Queue a derivative build; the idempotency key makes repeats for one file no-ops"""
+    if not is_image(name) or _requested.get(name):
+        return
+    _requested.set(name, True)
+    enqueue('core.generate_derivatives', name, idempotency_key=f'derivatives:{name}')
+
+
+def schedule_on_commit(field_file):
+    if field_file:
+        name = field_file.name
+        transaction.on_commit(lambda: schedule_derivatives(name))
+
+
+def remove_unreferenced(model_label, field, names):
+    """Delete stored files, and their derivatives, that no row of the model refers to any more.
+
+    Identical uploads share one content-hash name, so a file is only
+    removed once the last row using it is gone.
+    """
+    model = apps.get_model(model_label)
+    in_use = set(model._base_manager.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+    for name in set(names) - in_use:
+        default_storage.delete(name)
+        for size in DERIVATIVES:
+            default_storage.delete(derivative_name(name, size))
+
+
+def remove_on_commit(model, field, names):
+    """Queue remove_unreferenced() for ``names`` once the deleting transaction commits"""
+    names = sorted({name for name in names if name})
+    if names:
+        transaction.on_commit(lambda: enqueue('core.remove_uploads', model._meta.label, field, names))
+
+
+def derivative_url(field_file, size='thumb'):
+    """URL of a derivative if it has been built, else the original (and queue the build)"""
+    if not field_file:
+        return ''
+    if not is_image(field_file.name):
+        return field_file.url
+    name = derivative_name(field_file.name, size)
+    url = _known.get(name)
+    if url is None:
+        if not default_storage.exists(name):
+            schedule_derivatives(field_file.name)
+            return field_file.url
+        url = default_storage.url(name)
+        _known.set(name, url)
+    return url
+
+
+def _pending_upload(value):
+    if isinstance(value, UploadedFile):
+        return value
+    if isinstance(value, FieldFile) and value and not value._committed:
+        return value.file
+    return None
+
+
+def detach_uploads(instance, fields):
+    """Move fresh uploads off ``instance`` so saving it doesn't wait on them.
+
+    Each upload is written as-is to the stash storage, which the worker
+    reads too, and the field is put back to its stored value (or left
+    empty on a new row). Call attach_later()
+    with the result once the instance is saved; a task then sets the file,
+    which runs the slow part (Cloudinary upload, re-encoding) off the request.
+    """
+    stashed = []
+    for field in fields:
+        upload = _pending_upload(getattr(instance, field))
+        if upload is None:
+            continue
+        extension = os.path.splitext(upload.name)[1].lower()
+        upload.seek(0)
+        path = stash_storage.save(f'pending-uploads/{uuid.uuid4().hex}{extension}', upload)
+        stored = None
+        if instance.pk:
+            stored = type(instance).objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+        setattr(instance, field, stored or '')
+        stashed.append((field, path, os.path.basename(upload.name)))
+    return stashed
+
+
+def attach_later(instance, stashed):
+    for field, path, filename in stashed:
+        enqueue(
+            'core.attach_upload', instance._meta.label, instance.pk, field, path, filename,
+            idempotency_key=f'upload:{path}',
+        )
+
+
+def discard_uploads(stashed):
+    """Delete what detach_uploads() stashed when the instance is not saved after all"""
+    for _, path, _ in stashed:
+        stash_storage.delete(path)
+
+
+class DeferredUploadMixin:
+    """Create/UpdateView mixin that hands ``deferred_upload_fields`` to the task queue"""
+    deferred_upload_fields = ()
+
+    def form_valid(self, form):
+        stashed = detach_uploads(form.instance, self.deferred_upload_fields)
+        response = super().form_valid(form)
+        attach_later(self.object, stashed)
+        return response
@@ -1,19 +1,31 @@
+from django.conf import settings
 from django.urls import path
 from .views import *
+from .async_views import webinar_attendance
+
+blog_list = blog.as_view()
+webinar_list = webinar.as_view()
+if settings.ASYNC_VIEWS:
+    # Served by an ASGI server, the read-heavy pages await their queries instead of holding a worker
+    from .async_views import index, blog_list, webinar_list, blogpost, webinar_detail
 
 urlpatterns = [
     path('', index, name="index"),
-    path('blog/', blog.as_view(), name="blog_list"),
-    path('webinar/', webinar.as_view(), name="webinar_list"),
+    path('blog/', blog_list, name="blog_list"),
+    path('webinar/', webinar_list, name="webinar_list"),
     path('blog/<int:pk>/', blogpost, name="blogpost"),
+    path('blog/<int:pk>/comments/', blog_comments, name="blog_comments"),
     path('blog/create/', create.as_view(), name="create"),
     path('webinar/create/', webinar_create.as_view(), name="webinar_create"),
+    path('webinar/registered/', registered_webinars, name="registered_webinars"),
     path('blog/edit/<int:pk>/', update.as_view(), name="update"),
     path('webinar/edit/<int:pk>/', webinar_update.as_view(), name="webinar_update"),
     path('blog/<int:pk>/delete/', delete.as_view(), name="delete"),
     path('webinar/<int:pk>/delete/', webinar_delete.as_view(), name="webinar_delete"),
     path('webinar/<int:pk>/', webinar_detail, name="webinar_detail"),
     path('about/', about, name='about'),
+    path('search/', search, name='search'),
     path('webinar/<int:pk>/reg', webinar_register, name='webinar_register'),
+    path('webinar/<int:pk>/attendance/', webinar_attendance, name='webinar_attendance'),
     path('reload/', reload, name='reload'),
 ]
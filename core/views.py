@@ -1,18 +1,87 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from .models import *
-from django.http import HttpResponseRedirect
-from django.urls import reverse_lazy
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.template.loader import render_to_string
+from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, UpdateView, DeleteView, ListView
 from .forms import CreateNewPost, UpdatePost, CommentSection, CreateWebinar, WebinarRegistrationForm
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from .decorators import query_budget
+from .pagination import CursorPaginationMixin, InvalidCursor, KeysetPaginator
+from .cache import PAGE_CACHE_TIMEOUT, cache_response, comments_group, group_modified, group_versions
+from .conditional import conditional_get, latest_update
+from . import registrations, search as fulltext, throttle
+from .images import warm_profile
+from .uploads import DeferredUploadMixin, attach_later, detach_uploads, discard_uploads
+from django.utils.decorators import method_decorator
+from functools import partial
+
+COMMENTS_PAGE_SIZE = 20
 
 # Create your views here.
 
+# Listings span whole tables, so they go by when their cache group was last written instead of MAX(updated_at)
+def blog_list_modified(request, *args, **kwargs):
+    return group_modified('blogs')
+
+def webinar_list_modified(request, *args, **kwargs):
+    return group_modified('webinars')
+
+# ?status= on the webinar listing -> Webinar.status, kept current by the advance_webinar_statuses command
+WEBINAR_STATES = {'upcoming': 'upcoming', 'live': 'live', 'past': 'completed'}
+
+def webinar_listing(request):
+    """Listing queryset, narrowed to one status by ?status= so it reads the (status, start_datetime) index"""
+    queryset = Webinar.objects.for_listing()
+    state = WEBINAR_STATES.get(request.GET.get('status'))
+    return queryset.filter(status=state) if state else queryset
+
+def comment_page(blog_id, cursor=None):
+    """One keyset page of a post's comments, newest first, read off the (blog, created_at) index"""
+    comments = Comment.objects.filter(blog_id=blog_id).only('id', 'name', 'body', 'created_at')
+    return KeysetPaginator(comments, ('-created_at', '-id'), per_page=COMMENTS_PAGE_SIZE).page(cursor)
+
+def blogpost_context(blog, related_posts, versions):
+    """Template context for a post's page; the sync and async views each fetch the inputs their own way"""
+    return {
+        'blog': blog,
+        'form': CommentSection(),
+        # Only evaluated when the cached comments fragment is missing
+        'comments_page': partial(comment_page, blog.id),
+        'related_posts': related_posts,
+        'comments_version': versions[comments_group(blog.id)],
+        'page_cache_timeout': PAGE_CACHE_TIMEOUT,
+    }
+
+def webinar_detail_context(webinar, status, versions):
+    """Template context for a webinar's page, given the viewer's registration status (or None)"""
+    return {
+        'webinar': webinar,
+        'form': WebinarRegistrationForm(),
+        'is_registered': status is not None,
+        'is_waitlisted': status == 'waitlisted',
+        'now': timezone.now(),
+        'webinars_version': versions['webinars'],
+        'page_cache_timeout': PAGE_CACHE_TIMEOUT,
+    }
+
+def blogpost_modified(request, pk):
+    return latest_update(Blog.objects.filter(pk=pk), Comment.objects.filter(blog_id=pk))
+
+def webinar_modified(request, pk):
+    return latest_update(
+        Webinar.objects.filter(pk=pk),
+        Speaker.objects.filter(webinars=pk),
+        WebinarRegistration.objects.filter(webinar_id=pk),
+    )
+
+@query_budget(6)
 @login_required(login_url='login')
+@cache_response('home')
 def index(response):
-    posts = Blog.objects.filter(is_verified=True).order_by('-created_at')[:3]
-    webinars=Webinar.objects.all().order_by('-created_at')[:3]
+    posts = Blog.objects.for_listing().filter(is_verified=True).order_by('-created_at')[:3]
+    webinars = warm_profile(list(Webinar.objects.for_listing().order_by('-created_at')[:3]), 'featured_image', 'card')
 
     context = {
         'posts':posts,
@@ -21,49 +90,82 @@ def index(response):
 
     return render(response, 'core/index.html', context)
 
-class blog(ListView):
+@method_decorator([conditional_get(blog_list_modified, 'blogs'), cache_response('blogs')], name='dispatch')
+class blog(CursorPaginationMixin, ListView):
     model = Blog
+    queryset = Blog.objects.for_listing()
     template_name = 'blog/index.html'
-    ordering = ['-created_at']
+    cursor_ordering = ('-created_at', '-id')
+    count_mode = 'approximate'
     paginate_by = 10
+    query_budget = 6
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        warm_profile(context['object_list'], 'cover', 'card')
+        return context
 
-class webinar(ListView):
+@method_decorator([conditional_get(webinar_list_modified, 'webinars'), cache_response('webinars')], name='dispatch')
+class webinar(CursorPaginationMixin, ListView):
     model = Webinar
     template_name = 'webinar/index.html'
-    ordering = ['-created_at']
+    cursor_ordering = ('-start_datetime', '-id')
+    count_mode = 'approximate'
     paginate_by = 10
+    query_budget = 9
+
+    def get_queryset(self):
+        return webinar_listing(self.request).order_by(*self.get_ordering())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        warm_profile(context['object_list'], 'featured_image', 'card')
+        return context
     
-class create(CreateView):
+class create(DeferredUploadMixin, CreateView):
     model = Blog
+    deferred_upload_fields = ['cover']
     template_name = 'blog/create.html'
     form_class = CreateNewPost
+    query_budget = 8
 
-class webinar_create(CreateView):
+class webinar_create(DeferredUploadMixin, CreateView):
     model = Webinar
+    deferred_upload_fields = ['featured_image']
     template_name = 'webinar/create.html'
     form_class = CreateWebinar
+    query_budget = 8
 
-class update(UpdateView):
+class update(DeferredUploadMixin, UpdateView):
     model = Blog
+    deferred_upload_fields = ['cover']
     template_name = 'blog/update.html'
     form_class = UpdatePost
+    query_budget = 8
 
-class webinar_update(UpdateView):
+class webinar_update(DeferredUploadMixin, UpdateView):
     model = Webinar
+    deferred_upload_fields = ['featured_image']
     template_name = 'webinar/create.html'
     form_class = CreateWebinar
+    query_budget = 8
 
 class delete(DeleteView):
     model = Blog
     template_name = 'blog/delete.html'
     success_url = reverse_lazy('index')
+    query_budget = 4
 
 class webinar_delete(DeleteView):
     model = Blog
     template_name = 'blog/delete.html'
     success_url = reverse_lazy('webinar')
+    query_budget = 4
 
+@query_budget(11)
 @login_required(login_url='login')
+@throttle.throttle('comment')
+@conditional_get(blogpost_modified, 'blogs')
 def blogpost(response, pk):
     blog = Blog.objects.get(id=pk)
     if response.method == "POST":
@@ -71,68 +173,99 @@ def blogpost(response, pk):
         if form.is_valid():
             n = f"{response.user.first_name} {response.user.last_name}"
             c = form.cleaned_data["body"]
-            Comment.objects.create(
+            # A double submit or a bot repeating itself is dropped before it becomes a write
+            if throttle.is_duplicate('comment', response, f'{pk}:{c}'):
+                if throttle.is_ajax(response):
+                    return JsonResponse({'duplicate': True}, status=409)
+                return redirect('blogpost', pk=pk)
+            comment = Comment.objects.create(
                 blog=blog,
                 name=n,
                 body=c
             )
+            # Script posts get just the new comment back instead of a re-rendered page
+            if throttle.is_ajax(response):
+                return render(response, 'blog/partials/comment.html', {'comment': comment}, status=201)
             return redirect('blogpost', pk=pk)
+        if throttle.is_ajax(response):
+            return JsonResponse({'errors': form.errors}, status=400)
+        # Show the page again with the form's errors
+        context = blogpost_context(blog, blog.get_related_blogs(), group_versions(comments_group(blog.id)))
+        return render(response, 'blog/post.html', {**context, 'form': form}, status=400)
 
     else:
-        form = CommentSection()
-        return render(response, 'blog/post.html', {'blog':blog, 'form':form})
+        context = blogpost_context(blog, blog.get_related_blogs(), group_versions(comments_group(blog.id)))
+        return render(response, 'blog/post.html', context)
+
+@query_budget(3)
+@login_required(login_url='login')
+def blog_comments(response, pk):
+    """Later pages of a post's comments: rendered rows by default, or ?format=json"""
+    try:
+        page = comment_page(pk, response.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    if response.GET.get('format') == 'json':
+        return JsonResponse({
+            'results': [
+                {'id': comment.id, 'name': comment.name, 'body': comment.body, 'created_at': comment.created_at}
+                for comment in page
+            ],
+            'next': page.next_cursor,
+        })
+    fragment = HttpResponse(render_to_string('blog/partials/comments.html', {'page': page}, request=response))
+    fragment['X-Next-Cursor'] = page.next_cursor or ''
+    return fragment
 
+@query_budget(3)
 @login_required(login_url='login')
+@cache_response()
 def about(response):
     return render(response, 'core/about.html')
 
+@query_budget(14)
 @login_required(login_url='login')
+@throttle.throttle('registration')
+@conditional_get(webinar_modified, 'webinars')
 def webinar_detail(response, pk):
     webinar = get_object_or_404(Webinar, pk=pk)
     
-    # Check if user is already registered
-    is_registered = False
-    if response.user.is_authenticated:
-        is_registered = WebinarRegistration.objects.filter(
-            webinar=webinar, 
-            email=response.user.email
-        ).exists()
-    
     # Handle registration form submission
     if response.method == 'POST':
         form = WebinarRegistrationForm(response.POST, response.FILES)
         if form.is_valid():
-            # Check if user is already registered (prevent duplicate registrations)
-            if is_registered:
-                messages.error(response, 'You are already registered for this webinar!')
-                return redirect('webinar_detail', pk=webinar.pk)
-            
             # Create registration
             registration = form.save(commit=False)
             registration.webinar = webinar
-            registration.status = "pending"
             
             # Set user information if authenticated
             if response.user.is_authenticated:
+                registration.user = response.user
                 registration.full_name = f"{response.user.first_name} {response.user.last_name}"
                 registration.email = response.user.email
             
-            registration.save()
-            
-            messages.success(response, 'Your registration was successful!')
+            # Duplicates are detected atomically by the service, not by a prior lookup
+            stashed = detach_uploads(registration, ['payment_reference'])
+            registration, outcome = registrations.register(registration)
+            if outcome == registrations.DUPLICATE:
+                discard_uploads(stashed)
+                messages.error(response, 'You are already registered for this webinar!')
+            else:
+                attach_later(registration, stashed)
+                if outcome == registrations.WAITLISTED:
+                    messages.info(response, "This webinar is full, so you're on the waitlist. We'll email you if a seat opens up.")
+                else:
+                    messages.success(response, 'Your registration was successful!')
             return redirect('webinar_detail', pk=webinar.pk)
         
     else:
-        form = WebinarRegistrationForm()
-
-        context = {
-            'webinar': webinar,
-            'form': form,
-            'is_registered': is_registered,
-            'now': timezone.now(),
-        }
+        # Check if user is already registered
+        status = registrations.registered_webinars(response.user).get(webinar.pk)
+        context = webinar_detail_context(webinar, status, group_versions('webinars'))
         return render(response, 'webinar/details.html', context)
     
+@query_budget(13)
+@throttle.throttle('registration')
 def webinar_register(response, pk):
     webinar = Webinar.objects.get(id=pk)
     if response.method == "POST":
@@ -141,21 +274,55 @@ def webinar_register(response, pk):
             n = f"{response.user.first_name} {response.user.last_name}"
             e = f"{response.user.email}"
             c = form.cleaned_data["question"]
-            status = "pending"
             payment_reference = form.cleaned_data.get('payment_reference')
-            WebinarRegistration.objects.create(
+            registration = WebinarRegistration(
                 webinar=webinar,
+                user=response.user if response.user.is_authenticated else None,
                 full_name=n,
                 email=e,
                 question=c,
-                status=status,
                 payment_reference=payment_reference,
             )
+            stashed = detach_uploads(registration, ['payment_reference'])
+            registration, outcome = registrations.register(registration)
+            if outcome == registrations.DUPLICATE:
+                discard_uploads(stashed)
+            else:
+                attach_later(registration, stashed)
             return redirect('webinar_register', pk=pk)
 
     else:
         form = WebinarRegistrationForm()
         return render(response, 'webinar/register.html', {'webinar':webinar, 'form':form})
 
+@query_budget(3)
+@login_required(login_url='login')
+def registered_webinars(response):
+    """The signed-in user's webinar registrations, for badges on cached pages"""
+    webinars = registrations.registered_webinars(response.user)
+    reply = JsonResponse({'webinars': {str(pk): status for pk, status in webinars.items()}})
+    reply['Cache-Control'] = 'private, no-cache'
+    return reply
+
+@query_budget(3)
+def search(response):
+    query = response.GET.get('q', '').strip()
+    kinds = [kind for kind in response.GET.getlist('type') if kind in fulltext.KINDS]
+    hits = fulltext.search(query, kinds=kinds, limit=30) if query else []
+    for hit in hits:
+        hit.url = reverse('blogpost' if hit.kind == 'blog' else 'webinar_detail', args=[hit.object_id])
+
+    if response.GET.get('format') == 'json':
+        return JsonResponse({
+            'query': query,
+            'results': [
+                {'type': hit.kind, 'id': hit.object_id, 'title': hit.title,
+                 'snippet': hit.snippet, 'url': hit.url, 'score': hit.score}
+                for hit in hits
+            ],
+        })
+    return render(response, 'core/search.html', {'query': query, 'kinds': kinds, 'hits': hits})
+
+@query_budget(3)
 def reload(response):
     return render(response, 'core/reload.html')
\ No newline at end of file
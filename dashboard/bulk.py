@@ -0,0 +1,169 @@
+from collections import Counter
+
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from core import cache, notifications, registrations, uploads
+from core.counters import SEAT_STATUSES, adjust_registration_counts
+from core.models import WebinarRegistration
+
+from . import stats
+
+CHUNK_SIZE = 500
+# Queries one chunk runs when it spans a few webinars; callers size query budgets with it
+QUERIES_PER_CHUNK = 12
+
+# Bulk action -> registration status it sets (None deletes)
+ACTIONS = {
+    'approve': 'confirmed',
+    'confirm': 'confirmed',
+    'reject': 'cancelled',
+    'cancel': 'cancelled',
+    'pending': 'pending',
+    'delete': None,
+}
+
+
+def _chunks(ids, size):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _seat_grants(changing, status):
+    """Split rows moving into a seat between those that got one and those turned away.
+
+    Each webinar is asked for all its seats in one conditional UPDATE, as
+    registrations.reserve_seat() does, so admin moves can't oversell either.
+    Longest-registered rows are seated first.
+    """
+    wanting = {}
+    for row in changing:
+        if row[2] not in SEAT_STATUSES:
+            wanting.setdefault(row[1], []).append(row)
+    seated, full = [], []
+    for webinar_id, rows in wanting.items():
+        granted = registrations.take_seats(webinar_id, status, len(rows))
+        seated.extend(rows[:granted])
+        full.extend(rows[granted:])
+    return seated, full
+
+
+def _set_status(ids, status, results):
+    rows = list(
+        WebinarRegistration.objects.select_for_update()
+        .filter(pk__in=ids).order_by('pk').values_list('pk', 'webinar_id', 'status', 'email', 'user_id')
+    )
+    changing = [row for row in rows if row[2] != status]
+    seated, full = _seat_grants(changing, status) if status in SEAT_STATUSES else ([], [])
+    if full:
+        turned_away = {row[0] for row in full}
+        changing = [row for row in changing if row[0] not in turned_away]
+    WebinarRegistration.objects.filter(pk__in=[row[0] for row in changing]).update(
+        status=status, updated_at=timezone.now(),
+    )
+
+    # The UPDATE skips the post_save receivers, so apply their effects per webinar
+    moves = Counter((webinar_id, previous) for _, webinar_id, previous, _, _ in changing)
+    by_webinar = {}
+    for (webinar_id, previous), n in moves.items():
+        deltas = by_webinar.setdefault(webinar_id, Counter())
+        deltas[previous] -= n
+        deltas[status] += n
+    # take_seats() already counted the seated rows into their new status
+    for _, webinar_id, _, _, _ in seated:
+        by_webinar[webinar_id][status] -= 1
+    for webinar_id, deltas in by_webinar.items():
+        adjust_registration_counts(webinar_id, statuses=deltas)
+    confirmed = Counter()
+    for _, webinar_id, previous, _, _ in changing:
+        confirmed[webinar_id] += (status == 'confirmed') - (previous == 'confirmed')
+    stats.add_revenue(confirmed)
+    notifications.notify_status_many([(pk, email) for pk, _, _, email, _ in changing], status)
+    registrations.forget_registered_webinars(*{user_id for *_, user_id in changing})
+
+    results['updated'].extend(row[0] for row in changing)
+    results['unchanged'].extend(row[0] for row in rows if row[2] == status)
+    results['full'].extend(row[0] for row in full)
+    if status not in SEAT_STATUSES:
+        results['freed'].update(webinar_id for _, webinar_id, previous, _, _ in changing if previous in SEAT_STATUSES)
+    return {row[0] for row in rows}
+
+
+def _delete_rows(pks):
+    """DELETE the rows without loading them; the callers apply the post_delete receivers' effects.
+
+    Rows pointing at them are handled first, the way the delete collector
+    would, so a relation added later can't be orphaned or trip the FK.
+    """
+    if not pks:
+        return
+    for relation in WebinarRegistration._meta.related_objects:
+        if relation.on_delete is not models.CASCADE:
+            raise NotImplementedError(f'Bulk delete does not handle {relation.on_delete.__name__} on {relation}')
+        relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': pks}).delete()
+    meta = WebinarRegistration._meta
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {quote(meta.db_table)} WHERE {quote(meta.pk.column)} IN ({', '.join(['%s'] * len(pks))})",
+            pks,
+        )
+
+
+def _delete(ids, results):
+    rows = list(
+        WebinarRegistration.objects.select_for_update()
+        .filter(pk__in=ids).values_list('pk', 'webinar_id', 'status', 'created_at', 'user_id', 'payment_reference')
+    )
+    found = [row[0] for row in rows]
+    # One DELETE for the chunk; the post_delete receivers' effects are applied below
+    _delete_rows(found)
+
+    totals = Counter(row[1] for row in rows)
+    statuses = Counter((row[1], row[2]) for row in rows)
+    for webinar_id, n in totals.items():
+        adjust_registration_counts(
+            webinar_id, total=-n,
+            statuses={status: -count for (webinar, status), count in statuses.items() if webinar == webinar_id},
+        )
+    stats.increment('total_registrations', -len(rows))
+    stats.add_revenue(Counter({
+        webinar_id: -count for (webinar_id, status), count in statuses.items() if status == 'confirmed'
+    }))
+    for day, n in Counter(timezone.localdate(row[3]) for row in rows).items():
+        stats.increment_day(day, -n)
+    registrations.forget_registered_webinars(*{row[4] for row in rows})
+    uploads.remove_on_commit(WebinarRegistration, 'payment_reference', [row[5] for row in rows])
+
+    results['deleted'].extend(found)
+    results['freed'].update(row[1] for row in rows if row[2] in SEAT_STATUSES)
+    return set(found)
+
+
+def apply(action, ids, chunk_size=CHUNK_SIZE):
+    """Run a bulk action over registration ids in chunked transactions.
+
+    Each chunk is one locking SELECT plus one UPDATE or DELETE, followed by
+    a counter UPDATE per affected webinar. Returns the ids grouped by
+    outcome: ``updated``, ``unchanged``, ``full`` (no seat left to move
+    into), ``deleted`` and ``missing``.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f'Unknown bulk action {action!r}')
+    status = ACTIONS[action]
+    ids = sorted(set(ids))
+    results = {'updated': [], 'unchanged': [], 'full': [], 'deleted': [], 'missing': [], 'freed': set()}
+    for chunk in _chunks(ids, chunk_size):
+        with transaction.atomic():
+            if status is None:
+                found = _delete(chunk, results)
+            else:
+                found = _set_status(chunk, status, results)
+        results['missing'].extend(pk for pk in chunk if pk not in found)
+
+    # Seats given up by cancelled or deleted registrations go to the waitlist
+    for webinar_id in results.pop('freed'):
+        registrations.promote_waitlist(webinar_id)
+    if results['updated'] or results['deleted']:
+        cache.purge(WebinarRegistration)
+    return results
@@ -0,0 +1,132 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import Blog
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def filter_date_range(queryset, params, field):
+    """Apply a date preset (today/week/month/future/past) and date_from/date_to"""
+    today = timezone.localdate()
+    preset = params.get('date')
+    if preset == 'today':
+        queryset = queryset.filter(**{f'{field}__gte': _start_of(today)})
+    elif preset == 'week':
+        queryset = queryset.filter(**{f'{field}__gte': _start_of(today - timedelta(days=today.weekday()))})
+    elif preset == 'month':
+        queryset = queryset.filter(**{f'{field}__gte': _start_of(today.replace(day=1))})
+    elif preset == 'future':
+        queryset = queryset.filter(**{f'{field}__gte': timezone.now()})
+    elif preset == 'past':
+        queryset = queryset.filter(**{f'{field}__lt': timezone.now()})
+
+    date_from = _parse_date(params.get('date_from'))
+    if date_from:
+        queryset = queryset.filter(**{f'{field}__gte': _start_of(date_from)})
+    date_to = _parse_date(params.get('date_to'))
+    if date_to:
+        queryset = queryset.filter(**{f'{field}__lt': _start_of(date_to + timedelta(days=1))})
+    return queryset
+
+
+def _search(queryset, params, fields):
+    query = params.get('q', '').strip()
+    if not query:
+        return queryset
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(condition)
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    return int(value) if value and value.isdigit() else None
+
+
+BLOG_STATUSES = {value.lower(): value for value, _ in Blog.STATUS_CHOICES}
+
+
+def filter_blogs(queryset, params):
+    status = BLOG_STATUSES.get(params.get('status', '').lower())
+    if status:
+        queryset = queryset.filter(status=status)
+    category = _int_param(params, 'category')
+    if category:
+        queryset = queryset.filter(category_id=category)
+    author = _int_param(params, 'author')
+    if author:
+        queryset = queryset.filter(author_id=author)
+    queryset = filter_date_range(queryset, params, 'created_at')
+    return _search(queryset, params, ['title', 'snippet'])
+
+
+def filter_webinars(queryset, params):
+    if params.get('status'):
+        queryset = queryset.filter(status=params['status'])
+    host = _int_param(params, 'host')
+    if host:
+        queryset = queryset.filter(host_id=host)
+    if params.get('featured') in ('true', 'false'):
+        queryset = queryset.filter(is_featured=params['featured'] == 'true')
+    queryset = filter_date_range(queryset, params, 'start_datetime')
+    return _search(queryset, params, ['title', 'description'])
+
+
+def filter_users(queryset, params):
+    role = params.get('role')
+    if role == 'admin':
+        queryset = queryset.filter(is_superuser=True)
+    elif role == 'staff':
+        queryset = queryset.filter(is_staff=True)
+    elif role == 'user':
+        queryset = queryset.filter(is_staff=False)
+    if params.get('status') in ('active', 'inactive'):
+        queryset = queryset.filter(is_active=params['status'] == 'active')
+    queryset = filter_date_range(queryset, params, 'date_joined')
+    return _search(queryset, params, ['username', 'email', 'first_name', 'last_name'])
+
+
+def filter_registrations(queryset, params):
+    if params.get('status'):
+        queryset = queryset.filter(status=params['status'])
+    webinar = _int_param(params, 'webinar')
+    if webinar:
+        queryset = queryset.filter(webinar_id=webinar)
+    queryset = filter_date_range(queryset, params, 'created_at')
+    return _search(queryset, params, ['full_name', 'email'])
+
+
+SORT_ORDERINGS = {
+    'blog': {'newest': ('-created_at', '-id'), 'oldest': ('created_at', 'id')},
+    'webinar': {'newest': ('-start_datetime', '-id'), 'oldest': ('start_datetime', 'id')},
+    'user': {
+        'newest': ('-date_joined', '-id'),
+        'oldest': ('date_joined', 'id'),
+        'name_asc': ('username', 'id'),
+        'name_desc': ('-username', '-id'),
+    },
+    'registration': {
+        'newest': ('-created_at', '-id'),
+        'oldest': ('created_at', 'id'),
+        'name_asc': ('full_name', 'id'),
+        'name_desc': ('-full_name', '-id'),
+    },
+}
+
+
+def get_ordering(table, params):
+    orderings = SORT_ORDERINGS[table]
+    return orderings.get(params.get('sort'), orderings['newest'])
@@ -0,0 +1,323 @@
+import csv
+import io
+from collections import Counter
+
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator, validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from core import cache, registrations
+from core.counters import SEAT_STATUSES, STATUS_COUNTERS, adjust_registration_counts
+from core.models import Speaker, User, Webinar, WebinarRegistration
+
+from . import stats
+
+IMPORT_CHUNK_SIZE = 1000
+# Queries one registrations chunk runs for a single webinar; import_table's budget is sized with it
+QUERIES_PER_CHUNK = 14
+# Per-row errors kept in a report; the rest are only counted
+MAX_REPORTED_ERRORS = 500
+
+REGISTRATION_STATUSES = {value for value, _ in WebinarRegistration.status_choices}
+_validate_url = URLValidator()
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.skipped = 0
+        self.waitlisted = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'waitlisted': self.waitlisted,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def read_rows(handle):
+    """Yield ``(line, row)`` from a CSV file object without loading it all"""
+    if isinstance(handle.read(0), bytes):
+        handle = io.TextIOWrapper(handle, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(handle)
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+    for row in reader:
+        yield reader.line_num, {key: (value or '').strip() for key, value in row.items() if key}
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _required(row, field, max_length):
+    value = row.get(field, '')
+    if not value:
+        raise ValidationError(f'{field} is required')
+    if len(value) > max_length:
+        raise ValidationError(f'{field} is longer than {max_length} characters')
+    return value
+
+
+def _clean_registration(row, webinar_id, webinars):
+    if webinar_id is None:
+        value = row.get('webinar', '')
+        if not value.isdigit() or int(value) not in webinars:
+            raise ValidationError(f'Unknown webinar {value!r}')
+        webinar_id = int(value)
+    email = _required(row, 'email', 254)
+    validate_email(email)
+    status = row.get('status', '').lower() or 'pending'
+    if status not in REGISTRATION_STATUSES:
+        raise ValidationError(f'Unknown status {status!r}')
+    return {
+        'webinar_id': webinar_id,
+        'full_name': _required(row, 'full_name', 255),
+        'email': email,
+        'status': status,
+        'question': row.get('question') or None,
+    }
+
+
+def _insert_registrations(rows):
+    """Create rows, leaving (webinar, email) conflicts alone; returns the pairs inserted.
+
+    bulk_create can't report which rows a conflict skipped, so the rows
+    stamped from this call on are read back and matched against the batch.
+    """
+    if not rows:
+        return set()
+    started = timezone.now()
+    WebinarRegistration.objects.bulk_create(
+        [WebinarRegistration(**row) for row in rows], ignore_conflicts=True, batch_size=IMPORT_CHUNK_SIZE,
+    )
+    keys = {(row['webinar_id'], row['email']) for row in rows}
+    return keys & set(
+        WebinarRegistration.objects.filter(
+            webinar_id__in={webinar for webinar, _ in keys},
+            email__in={email for _, email in keys},
+            created_at__gte=started,
+        ).values_list('webinar_id', 'email')
+    )
+
+
+def _take_seats(entering):
+    """Hold seats for rows moving into a seat status; rows that don't fit go to the waitlist.
+
+    ``entering`` lists the rows in file order. Returns a Counter of the
+    seats held per ``(webinar, status)``, which take_seats() has already
+    counted into the webinar's counters, and the rows that were waitlisted.
+    """
+    groups = {}
+    for registration in entering:
+        groups.setdefault((registration['webinar_id'], registration['status']), []).append(registration)
+    held = Counter()
+    waitlisted = []
+    for (webinar, status), group in groups.items():
+        held[webinar, status] = granted = registrations.take_seats(webinar, status, len(group))
+        for registration in group[granted:]:
+            registration['status'] = 'waitlisted'
+            waitlisted.append((webinar, registration['email']))
+    return held, waitlisted
+
+
+def _import_registration_chunk(chunk, webinar_id, update, report):
+    webinars = set()
+    if webinar_id is None:
+        ids = {int(row['webinar']) for _, row in chunk if row.get('webinar', '').isdigit()}
+        webinars = set(Webinar.objects.filter(pk__in=ids).values_list('pk', flat=True))
+
+    cleaned = {}
+    for line, row in chunk:
+        try:
+            registration = _clean_registration(row, webinar_id, webinars)
+        except ValidationError as exc:
+            report.error(line, '; '.join(exc.messages))
+            continue
+        key = (registration['webinar_id'], registration['email'])
+        if key in cleaned:
+            report.error(line, f'Duplicate of line {cleaned[key][0]}')
+            continue
+        cleaned[key] = (line, registration)
+    if not cleaned:
+        return
+
+    existing = {
+        (webinar, email): status
+        for webinar, email, status in WebinarRegistration.objects.filter(
+            webinar_id__in={webinar for webinar, _ in cleaned},
+            email__in={email for _, email in cleaned},
+        ).values_list('webinar_id', 'email', 'status')
+    }
+    new = [registration for key, (_, registration) in cleaned.items() if key not in existing]
+    changed = [registration for key, (_, registration) in cleaned.items() if key in existing] if update else []
+
+    # Link rows to the accounts their emails belong to, as registering on the site does
+    users = dict(User.objects.filter(email__in={email for _, email in cleaned}).values_list('email', 'pk'))
+    for registration in new:
+        registration['user_id'] = users.get(registration['email'])
+
+    with transaction.atomic():
+        # Seats are held before the rows are written, as registrations.register() does,
+        # so an import can't overbook a webinar; what doesn't fit is waitlisted
+        entering = [registration for registration in new if registration['status'] in SEAT_STATUSES]
+        entering += [
+            registration for registration in changed
+            if registration['status'] in SEAT_STATUSES
+            and existing[(registration['webinar_id'], registration['email'])] not in SEAT_STATUSES
+        ]
+        held, waitlisted = _take_seats(entering)
+
+        # Another writer may add the same pair meanwhile; those rows are skipped, not counted
+        inserted = _insert_registrations(new)
+        new = [registration for registration in new if (registration['webinar_id'], registration['email']) in inserted]
+
+        # The writes skip the post_save receivers, so counters are moved per webinar here
+        moves = {}
+        for registration in new:
+            webinar_moves = moves.setdefault(registration['webinar_id'], Counter())
+            webinar_moves['total'] += 1
+            webinar_moves[registration['status']] += 1
+        freed = set()
+        for registration in changed:
+            previous = existing[(registration['webinar_id'], registration['email'])]
+            if previous != registration['status']:
+                webinar_moves = moves.setdefault(registration['webinar_id'], Counter())
+                webinar_moves[previous] -= 1
+                webinar_moves[registration['status']] += 1
+                if previous in SEAT_STATUSES and registration['status'] not in SEAT_STATUSES:
+                    freed.add(registration['webinar_id'])
+
+        if changed:
+            WebinarRegistration.objects.bulk_create(
+                [WebinarRegistration(**registration) for registration in changed],
+                update_conflicts=True,
+                unique_fields=['webinar', 'email'],
+                update_fields=['full_name', 'status', 'question', 'updated_at'],
+            )
+        for webinar in moves.keys() | {webinar for webinar, _ in held}:
+            webinar_moves = moves.get(webinar, Counter())
+            # Held seats are already counted; any a skipped row didn't use are handed back
+            statuses = {status: webinar_moves[status] - held[webinar, status] for status in STATUS_COUNTERS}
+            adjust_registration_counts(webinar, total=webinar_moves['total'], statuses=statuses)
+    stats.add_revenue({webinar: webinar_moves['confirmed'] for webinar, webinar_moves in moves.items()})
+    registrations.forget_registered_webinars(*users.values())
+    for webinar in sorted(freed):
+        registrations.promote_waitlist(webinar)
+
+    report.created += len(new)
+    report.updated += len(changed)
+    report.waitlisted += sum(key in inserted or key in existing for key in waitlisted)
+    report.skipped += len(cleaned) - len(new) - len(changed)
+
+
+def import_registrations(handle, webinar_id=None, update=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import registrations from CSV (webinar, full_name, email, status, question).
+
+    Rows are validated and written one chunk at a time: one lookup of
+    existing (webinar, email) pairs, batched INSERTs, and with
+    ``update`` one upsert for rows that already exist; otherwise those are
+    skipped. Rows that need a seat only get one while the webinar has room;
+    the rest are waitlisted. ``webinar_id`` imports every row into one webinar and makes
+    the column optional. Imported attendees are not emailed.
+    """
+    report = ImportReport()
+    for chunk in _chunks(read_rows(handle), chunk_size):
+        _import_registration_chunk(chunk, webinar_id, update, report)
+
+    if report.created or report.updated:
+        stats.increment('total_registrations', report.created)
+        stats.increment_day(timezone.localdate(), report.created)
+        cache.purge(WebinarRegistration)
+    return report
+
+
+def _clean_speaker(row):
+    speaker = Speaker(
+        name=_required(row, 'name', 100),
+        bio=_required(row, 'bio', 100_000),
+        email=row.get('email', ''),
+        website=row.get('website', ''),
+        twitter=row.get('twitter', '')[:100],
+        linkedin=row.get('linkedin', ''),
+        is_active=row.get('is_active', 'yes').lower() not in ('0', 'no', 'false'),
+    )
+    if speaker.email:
+        validate_email(speaker.email)
+    for url in (speaker.website, speaker.linkedin):
+        if url:
+            _validate_url(url)
+    return speaker
+
+
+SPEAKER_FIELDS = ['name', 'bio', 'website', 'twitter', 'linkedin', 'is_active', 'updated_at']
+
+
+def import_speakers(handle, update=False, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import speakers from CSV (name, bio, email, website, twitter, linkedin, is_active).
+
+    Speakers with an email already on file are matched by it (case
+    insensitively) and updated with ``update`` or skipped; everything else
+    is inserted in one statement per chunk.
+    """
+    report = ImportReport()
+    for chunk in _chunks(read_rows(handle), chunk_size):
+        cleaned = {}
+        new = []
+        for line, row in chunk:
+            try:
+                speaker = _clean_speaker(row)
+            except ValidationError as exc:
+                report.error(line, '; '.join(exc.messages))
+                continue
+            if not speaker.email:
+                new.append(speaker)
+            elif speaker.email.lower() in cleaned:
+                report.error(line, f'Duplicate of line {cleaned[speaker.email.lower()][0]}')
+            else:
+                cleaned[speaker.email.lower()] = (line, speaker)
+
+        existing = dict(
+            Speaker.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower__in=list(cleaned)).values_list('email_lower', 'pk')
+        ) if cleaned else {}
+        changed = []
+        for email, (_, speaker) in cleaned.items():
+            if email not in existing:
+                new.append(speaker)
+            elif update:
+                speaker.pk = existing[email]
+                speaker.updated_at = timezone.now()
+                changed.append(speaker)
+            else:
+                report.skipped += 1
+
+        with transaction.atomic():
+            Speaker.objects.bulk_create(new, batch_size=chunk_size)
+            Speaker.objects.bulk_update(changed, SPEAKER_FIELDS, batch_size=chunk_size)
+        report.created += len(new)
+        report.updated += len(changed)
+
+    if report.created or report.updated:
+        cache.purge(Speaker)
+    return report
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard import imports
+
+
+class Command(BaseCommand):
+    help = "Import webinar registrations or speakers from a CSV file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['registrations', 'speakers'])
+        parser.add_argument('path', help="CSV file with a header row")
+        parser.add_argument(
+            '--webinar', type=int,
+            help="Import every registration into this webinar",
+        )
+        parser.add_argument(
+            '--update', action='store_true',
+            help="Update rows that already exist instead of skipping them",
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=imports.IMPORT_CHUNK_SIZE,
+            help="Rows validated and inserted per batch",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            handle = open(options['path'], newline='', encoding='utf-8-sig')
+        except OSError as exc:
+            raise CommandError(exc)
+        with handle:
+            if options['kind'] == 'registrations':
+                report = imports.import_registrations(
+                    handle, webinar_id=options['webinar'], update=options['update'], chunk_size=options['chunk_size'],
+                )
+            else:
+                report = imports.import_speakers(handle, update=options['update'], chunk_size=options['chunk_size'])
+
+        for error in report.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {report.created}, updated {report.updated}, skipped {report.skipped}, failed {report.failed}"
+        ))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from dashboard import stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the cached dashboard statistics (schedule periodically to correct drift)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=stats.CHART_DAYS, help="Days of registration history to rebuild")
+
+    def handle(self, *args, **options):
+        totals, per_day = stats.recompute_all(options['days'])
+        for name, value in totals.items():
+            self.stdout.write(f"{name}: {value}")
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(totals)} aggregates and {len(per_day)} days of registrations"))
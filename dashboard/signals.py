@@ -0,0 +1,98 @@
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import Blog, Webinar, WebinarRegistration
+from user.models import User
+
+from . import stats
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.increment('total_users')
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    stats.increment('total_users', -1)
+
+
+@receiver(post_init, sender=Blog)
+def blog_loaded(sender, instance, **kwargs):
+    # The stored flag, so a save moves published_blogs by the change alone
+    instance._loaded_verified = instance.__dict__.get('is_verified')
+
+
+@receiver(post_save, sender=Blog)
+def blog_saved(sender, instance, created, **kwargs):
+    previous = False if created else instance._loaded_verified
+    if created:
+        stats.increment('total_blogs')
+    if previous is None:
+        # Saved from a queryset that deferred the flag; recount lazily
+        stats.invalidate('published_blogs')
+    elif previous != instance.is_verified:
+        stats.increment('published_blogs', 1 if instance.is_verified else -1)
+    instance._loaded_verified = instance.is_verified
+
+
+@receiver(post_delete, sender=Blog)
+def blog_deleted(sender, instance, **kwargs):
+    stats.increment('total_blogs', -1)
+    if instance._loaded_verified is None:
+        stats.invalidate('published_blogs')
+    elif instance._loaded_verified:
+        stats.increment('published_blogs', -1)
+
+
+@receiver(post_init, sender=Webinar)
+def webinar_loaded(sender, instance, **kwargs):
+    instance._loaded_price = instance.__dict__.get('price')
+
+
+@receiver(post_save, sender=Webinar)
+def webinar_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.increment('total_webinars')
+    elif instance._loaded_price != instance.price:
+        if instance._loaded_price is None:
+            stats.invalidate('revenue')
+        else:
+            # The instance's own counter may be stale; read the stored one
+            confirmed = Webinar.objects.filter(pk=instance.pk).values_list('confirmed_count', flat=True).first() or 0
+            stats.increment('revenue', int((instance.price - instance._loaded_price) * 100) * confirmed)
+    instance._loaded_price = instance.price
+
+
+@receiver(post_delete, sender=Webinar)
+def webinar_deleted(sender, instance, **kwargs):
+    stats.increment('total_webinars', -1)
+    # Its registrations are gone too, and with them its share of revenue
+    stats.invalidate('revenue')
+
+
+@receiver(pre_save, sender=WebinarRegistration)
+def registration_saving(sender, instance, **kwargs):
+    # core's post_save receiver moves _loaded_status on before ours runs
+    instance._stats_status = None if instance._state.adding else getattr(instance, '_loaded_status', None)
+
+
+@receiver(post_save, sender=WebinarRegistration)
+def registration_saved(sender, instance, created, **kwargs):
+    if created:
+        stats.increment('total_registrations')
+        stats.increment_day(timezone.localdate(instance.created_at))
+    previous = getattr(instance, '_stats_status', None)
+    stats.add_revenue({instance.webinar_id: (instance.status == 'confirmed') - (previous == 'confirmed')})
+
+
+@receiver(post_delete, sender=WebinarRegistration)
+def registration_deleted(sender, instance, **kwargs):
+    stats.increment('total_registrations', -1)
+    stats.increment_day(timezone.localdate(instance.created_at), -1)
+    # Deleting the webinar recounts revenue once instead of once per registration
+    status = getattr(instance, '_loaded_status', instance.status)
+    if status == 'confirmed' and not isinstance(kwargs.get('origin'), Webinar):
+        stats.add_revenue({instance.webinar_id: -1})
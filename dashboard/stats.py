@@ -0,0 +1,121 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models import Blog, Webinar, WebinarRegistration
+from user.models import User
+
+# Bump when the meaning of a cached aggregate changes so stale values are ignored
+STATS_VERSION = 2
+STATS_TIMEOUT = getattr(settings, 'DASHBOARD_STATS_TIMEOUT', 60 * 60 * 24)
+CHART_DAYS = 30
+
+AGGREGATES = {
+    'total_users': lambda: User.objects.count(),
+    'total_webinars': lambda: Webinar.objects.count(),
+    'total_blogs': lambda: Blog.objects.count(),
+    'published_blogs': lambda: Blog.objects.filter(is_verified=True).count(),
+    'total_registrations': lambda: WebinarRegistration.objects.count(),
+    # Whole cents, so it can be moved with cache.incr like the counts
+    'revenue': lambda: int((Webinar.objects.aggregate(
+        total=Sum(F('price') * F('confirmed_count'))
+    )['total'] or 0) * 100),
+}
+
+
+def _key(name):
+    return f'dashboard-stats:{name}'
+
+
+def _day_key(day):
+    return _key(f'registrations:{day.isoformat()}')
+
+
+def get_stats():
+    """Return all dashboard aggregates, computing only the ones missing from cache"""
+    keys = {_key(name): name for name in AGGREGATES}
+    cached = cache.get_many(keys, version=STATS_VERSION)
+    stats = {keys[key]: value for key, value in cached.items()}
+    missing = {}
+    for name, compute in AGGREGATES.items():
+        if name not in stats:
+            stats[name] = missing[_key(name)] = compute()
+    if missing:
+        cache.set_many(missing, STATS_TIMEOUT, version=STATS_VERSION)
+    return _present(stats)
+
+
+def _present(stats):
+    stats['revenue'] = Decimal(stats['revenue']) / 100
+    return stats
+
+
+def registrations_per_day(days=CHART_DAYS):
+    """Registration counts for the last ``days`` days, oldest first"""
+    today = timezone.localdate()
+    dates = [today - timedelta(days=offset) for offset in range(days - 1, -1, -1)]
+    keys = {_day_key(day): day for day in dates}
+    cached = cache.get_many(keys, version=STATS_VERSION)
+    counts = {keys[key]: value for key, value in cached.items()}
+
+    missing_dates = [day for day in dates if day not in counts]
+    if missing_dates:
+        rows = (
+            WebinarRegistration.objects
+            .filter(created_at__date__gte=missing_dates[0], created_at__date__lte=missing_dates[-1])
+            .annotate(day=TruncDate('created_at'))
+            .values('day')
+            .annotate(n=Count('id'))
+            .order_by()
+        )
+        found = {row['day']: row['n'] for row in rows}
+        fresh = {day: found.get(day, 0) for day in missing_dates}
+        counts.update(fresh)
+        cache.set_many({_day_key(day): n for day, n in fresh.items()}, STATS_TIMEOUT, version=STATS_VERSION)
+
+    return [(day, counts[day]) for day in dates]
+
+
+def increment(name, delta=1):
+    """Adjust a cached counter in place; a missing key is simply recomputed on next read"""
+    try:
+        cache.incr(_key(name), delta, version=STATS_VERSION)
+    except ValueError:
+        pass
+
+
+def increment_day(day, delta=1):
+    try:
+        cache.incr(_day_key(day), delta, version=STATS_VERSION)
+    except ValueError:
+        pass
+
+
+def add_revenue(confirmed):
+    """Move revenue by ``{webinar_id: change in confirmed registrations}``, with one price lookup"""
+    confirmed = {webinar_id: n for webinar_id, n in confirmed.items() if n}
+    # Nothing to move if revenue isn't cached; the next read recomputes it
+    if not confirmed or cache.get(_key('revenue'), version=STATS_VERSION) is None:
+        return
+    prices = dict(Webinar.objects.filter(pk__in=confirmed).values_list('pk', 'price'))
+    increment('revenue', sum(int(prices.get(webinar_id, 0) * 100) * n for webinar_id, n in confirmed.items()))
+
+
+def invalidate(*names):
+    cache.delete_many([_key(name) for name in names], version=STATS_VERSION)
+
+
+def recompute_all(days=CHART_DAYS):
+    """Recompute every aggregate from the database, e.g. from a scheduled job"""
+    stats = {name: compute() for name, compute in AGGREGATES.items()}
+    cache.set_many({_key(name): value for name, value in stats.items()}, STATS_TIMEOUT, version=STATS_VERSION)
+    today = timezone.localdate()
+    cache.delete_many(
+        [_day_key(today - timedelta(days=offset)) for offset in range(days)], version=STATS_VERSION
+    )
+    return _present(stats), registrations_per_day(days)
@@ -1,3 +1,339 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
+from xml.etree import ElementTree
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import taskqueue
+from core.models import Blog, Category, Notification, Webinar, WebinarRegistration
+from core.querybudget import record_queries
+from core.testing import QueryBudgetTestMixin
+from core.tests import make_user, make_webinar, register
+
+from . import bulk, imports, stats
+
+
+class IncrementalStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.host = make_user()
+        self.webinar = make_webinar(self.host, price=Decimal('25.50'))
+        self.registration = WebinarRegistration.objects.create(
+            webinar=self.webinar, full_name='A', email='a@example.com', status='pending',
+        )
+        stats.get_stats()
+
+    def cached_stats(self):
+        with self.assertNumQueries(0):
+            return stats.get_stats()
+
+    def test_confirming_moves_revenue_without_a_recount(self):
+        self.registration.status = 'confirmed'
+        self.registration.save()
+        self.assertEqual(self.cached_stats()['revenue'], Decimal('25.50'))
+        self.registration.status = 'cancelled'
+        self.registration.save()
+        self.assertEqual(self.cached_stats()['revenue'], Decimal('0'))
+
+    def test_bulk_actions_move_revenue(self):
+        bulk.apply('confirm', [self.registration.pk])
+        self.assertEqual(self.cached_stats()['revenue'], Decimal('25.50'))
+        bulk.apply('delete', [self.registration.pk])
+        self.assertEqual(self.cached_stats()['revenue'], Decimal('0'))
+
+    def test_price_change_moves_revenue(self):
+        bulk.apply('confirm', [self.registration.pk])
+        self.webinar.price = Decimal('30.00')
+        self.webinar.save()
+        self.assertEqual(self.cached_stats()['revenue'], Decimal('30.00'))
+        self.assertEqual(stats.recompute_all()[0]['revenue'], Decimal('30.00'))
+
+    def test_verifying_a_post_moves_published_blogs(self):
+        blog = Blog.objects.create(
+            cover='sample', title='Post', author=self.host, category=Category.objects.create(name='Tech'),
+            snippet='s', body='<p>b</p>', status='Published',
+        )
+        self.assertEqual(self.cached_stats()['published_blogs'], 0)
+        blog = Blog.objects.get(pk=blog.pk)
+        blog.is_verified = True
+        blog.save()
+        self.assertEqual(self.cached_stats()['published_blogs'], 1)
+        blog.delete()
+        self.assertEqual(self.cached_stats()['published_blogs'], 0)
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class BulkActionBudgetTests(TestCase):
+    def test_budget_grows_with_the_chunks(self):
+        admin = make_user('admin', is_staff=True)
+        rows = 2 * bulk.CHUNK_SIZE + 1
+        webinar = make_webinar(admin, pending_count=rows)
+        WebinarRegistration.objects.bulk_create(
+            WebinarRegistration(webinar=webinar, full_name='A', email=f'a{n}@example.com', status='pending')
+            for n in range(rows)
+        )
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('registration_bulk_action'),
+            json.dumps({'action': 'confirm', 'ids': list(WebinarRegistration.objects.values_list('pk', flat=True))}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json()['counts']['updated'], rows)
+
+
+class ImportConflictTests(TestCase):
+    def test_rows_another_writer_inserted_are_not_counted(self):
+        cache.clear()
+        webinar = make_webinar(make_user(), price=Decimal('10.00'))
+        stats.get_stats()
+        insert = imports._insert_registrations
+
+        def racing_insert(rows):
+            # Lands between the existing-pairs lookup and the INSERT
+            WebinarRegistration.objects.create(webinar=webinar, full_name='B', email='b@example.com', status='confirmed')
+            return insert(rows)
+
+        handle = io.StringIO('full_name,email,status\nA,a@example.com,confirmed\nB,b@example.com,confirmed\n')
+        with mock.patch.object(imports, '_insert_registrations', racing_insert):
+            report = imports.import_registrations(handle, webinar_id=webinar.pk)
+
+        self.assertEqual((report.created, report.skipped), (1, 1))
+        webinar.refresh_from_db()
+        self.assertEqual((webinar.registration_count, webinar.confirmed_count), (2, 2))
+        cached = stats.get_stats()
+        self.assertEqual(cached['total_registrations'], 2)
+        self.assertEqual(cached['revenue'], Decimal('20.00'))
+
+
+class ImportCapacityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.webinar = make_webinar(make_user(), capacity=2)
+        register(self.webinar, 1)
+
+    def test_rows_past_capacity_are_waitlisted(self):
+        handle = io.StringIO('full_name,email,status\n' + ''.join(f'B,b{n}@example.com,confirmed\n' for n in range(3)))
+        report = imports.import_registrations(handle, webinar_id=self.webinar.pk)
+
+        self.assertEqual((report.created, report.waitlisted), (3, 2))
+        self.assertEqual(
+            dict(WebinarRegistration.objects.filter(email__startswith='b').values_list('email', 'status')),
+            {'b0@example.com': 'confirmed', 'b1@example.com': 'waitlisted', 'b2@example.com': 'waitlisted'},
+        )
+        self.webinar.refresh_from_db()
+        self.assertEqual(
+            (self.webinar.registration_count, self.webinar.pending_count,
+             self.webinar.confirmed_count, self.webinar.waitlist_count),
+            (4, 1, 1, 2),
+        )
+
+    def test_updates_into_a_seat_respect_capacity(self):
+        WebinarRegistration.objects.create(webinar=self.webinar, full_name='B', email='b@example.com', status='cancelled')
+        WebinarRegistration.objects.create(webinar=self.webinar, full_name='C', email='c@example.com', status='cancelled')
+        handle = io.StringIO('full_name,email,status\nB,b@example.com,pending\nC,c@example.com,pending\n')
+        report = imports.import_registrations(handle, webinar_id=self.webinar.pk, update=True)
+
+        self.assertEqual((report.updated, report.waitlisted), (2, 1))
+        self.webinar.refresh_from_db()
+        self.assertEqual(
+            (self.webinar.pending_count, self.webinar.cancelled_count, self.webinar.waitlist_count), (2, 0, 1),
+        )
+
+    def test_redirects_to_the_registrations_page(self):
+        self.client.force_login(make_user('admin', is_staff=True))
+        upload = SimpleUploadedFile('registrations.csv', b'full_name,email\nB,b@example.com\n')
+        response = self.client.post(
+            reverse('dashboard_import', args=['registrations']), {'file': upload, 'webinar': self.webinar.pk},
+            HTTP_REFERER='https://evil.example.com/',
+        )
+        self.assertRedirects(response, reverse('webinar_registrations', args=[self.webinar.pk]), fetch_redirect_response=False)
+
+
+class ExportTests(TestCase):
+    NAMES = ['Smith, Jane', 'Say "hi"', 'Line\nbreak', '=SUM(A1:A2)', 'Zoë <&>\x07']
+
+    def setUp(self):
+        cache.clear()
+        self.webinar = make_webinar(make_user(), title='Intro')
+        for n, name in enumerate(self.NAMES):
+            WebinarRegistration.objects.create(webinar=self.webinar, full_name=name, email=f'r{n}@example.com')
+        self.client.force_login(make_user('admin', is_staff=True))
+
+    def export(self, query=''):
+        with record_queries() as recorder:
+            response = self.client.get(reverse('dashboard_export', args=['registrations']) + query)
+            content = b''.join(response.streaming_content)
+        return response, content, len(recorder)
+
+    def names(self, rows):
+        return [row[3] for row in sorted(rows[1:], key=lambda row: int(row[0]))]
+
+    def test_csv_round_trips_awkward_values(self):
+        response, content, _ = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(io.StringIO(content.decode())))
+        self.assertEqual(rows[0][:4], ['ID', 'Webinar', 'Webinar start', 'Full name'])
+        self.assertEqual(
+            self.names(rows), ['Smith, Jane', 'Say "hi"', 'Line\nbreak', "'=SUM(A1:A2)", 'Zoë <&>\x07'],
+        )
+
+    def test_xlsx_is_a_valid_workbook(self):
+        _, content, _ = self.export('?format=xlsx')
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertIn('xl/workbook.xml', archive.namelist())
+            sheet = ElementTree.fromstring(archive.read('xl/worksheets/sheet1.xml'))
+        namespace = {'s': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+        rows = [
+            [
+                cell.findtext('s:v', namespaces=namespace) or cell.findtext('s:is/s:t', namespaces=namespace)
+                for cell in row.findall('s:c', namespace)
+            ]
+            for row in sheet.findall('s:sheetData/s:row', namespace)
+        ]
+        self.assertEqual(len(rows), len(self.NAMES) + 1)
+        self.assertEqual(rows[0][0], 'ID')
+        # Characters XML can't carry are dropped, the rest escaped and restored
+        self.assertEqual(
+            self.names(rows), ['Smith, Jane', 'Say "hi"', 'Line\nbreak', "'=SUM(A1:A2)", 'Zoë <&>'],
+        )
+
+    def test_queries_do_not_grow_with_the_rows(self):
+        for query in ('', '?format=xlsx'):
+            _, _, few = self.export(query)
+            WebinarRegistration.objects.bulk_create([
+                WebinarRegistration(webinar=self.webinar, full_name='A', email=f'{query}{n}@example.com')
+                for n in range(200)
+            ])
+            with self.subTest(query=query):
+                self.assertEqual(self.export(query)[2], few)
+
+
+@override_settings(IMAGE_RENDERER='local', MEDIA_ROOT=tempfile.mkdtemp())
+class DashboardBudgetTests(QueryBudgetTestMixin, TestCase):
+    """The admin pages stay within their declared budgets with several rows on each"""
+
+    def setUp(self):
+        cache.clear()
+        self.admin = make_user('admin', is_staff=True)
+        category = Category.objects.create(name='Tech')
+        for n in range(3):
+            host = make_user(f'host{n}')
+            Blog.objects.create(
+                cover='sample', title=f'Post {n}', author=host, category=category,
+                snippet='s', body='<p>b</p>', status='Published',
+            )
+            webinar = make_webinar(host, title=f'Webinar {n}')
+            WebinarRegistration.objects.create(webinar=webinar, full_name='A', email=f'a{n}@example.com')
+        self.webinar = webinar
+        self.registration = WebinarRegistration.objects.latest('pk')
+        self.client.force_login(self.admin)
+
+    def assertWithinBudget(self, name, *args, query=''):
+        response, _ = self.assertViewWithinBudget(reverse(name, args=args) + query)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_overview(self):
+        # The budget is for the cached aggregates, not the recount after they expire
+        stats.get_stats()
+        stats.registrations_per_day()
+        self.assertWithinBudget('dashboard')
+        self.assertWithinBudget('dashboard_stats')
+
+    def test_tables(self):
+        for name in ('blog_management', 'webinar_management', 'user_management'):
+            for query in ('', '?format=fragment', '?format=json'):
+                self.assertWithinBudget(name, query=query)
+        self.assertWithinBudget('webinar_reg', self.webinar.pk)
+
+    def test_registrations(self):
+        for query in ('', '?format=fragment', '?format=fragment&view=table', '?format=json'):
+            self.assertWithinBudget('registration_management', query=query)
+            self.assertWithinBudget('webinar_registrations', self.webinar.pk, query=query)
+        # The bulk actions, export links and import form live on this page
+        page = self.assertWithinBudget('webinar_registrations', self.webinar.pk)
+        for url in (reverse('registration_bulk_action'), reverse('dashboard_export', args=['registrations']),
+                    reverse('dashboard_import', args=['registrations'])):
+            self.assertContains(page, url)
+
+    def test_registration_edit(self):
+        self.assertWithinBudget('registration_edit', self.registration.pk)
+
+    def test_import(self):
+        stats.get_stats()
+        rows = ''.join(f'A,a{n}@example.com,confirmed\n' for n in range(50))
+        upload = SimpleUploadedFile('registrations.csv', f'full_name,email,status\n{rows}'.encode())
+        response, _ = self.assertViewWithinBudget(
+            reverse('dashboard_import', args=['registrations']) + '?format=json',
+            method='post', data={'file': upload, 'webinar': self.webinar.pk, 'update': 'on'},
+        )
+        self.assertEqual((response.json()['created'], response.json()['updated']), (49, 1))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BulkDeleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.webinar = make_webinar(make_user(), capacity=2)
+        self.rows = [register(self.webinar, n)[0] for n in range(3)]
+
+    def counters(self):
+        self.webinar.refresh_from_db()
+        return {field: getattr(self.webinar, field) for field in Webinar.counter_fields}
+
+    def recount(self):
+        rows = WebinarRegistration.objects.filter(webinar=self.webinar)
+        fields = {'pending_count': 'pending', 'confirmed_count': 'confirmed',
+                  'cancelled_count': 'cancelled', 'waitlist_count': 'waitlisted'}
+        counts = {field: rows.filter(status=status).count() for field, status in fields.items()}
+        return {'registration_count': rows.count(), **counts}
+
+    def test_counters_match_the_rows_after_a_bulk_delete(self):
+        self.assertEqual(Notification.objects.filter(registration=self.rows[0]).count(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            results = bulk.apply('delete', [self.rows[0].pk, self.rows[1].pk])
+        self.assertEqual(len(results['deleted']), 2)
+        self.assertEqual(self.counters(), self.recount())
+        # The freed seat went to the waitlisted registration
+        self.assertEqual(WebinarRegistration.objects.get(pk=self.rows[2].pk).status, 'pending')
+        self.assertFalse(Notification.objects.filter(registration_id__in=[self.rows[0].pk, self.rows[1].pk]).exists())
+
+    def test_payment_files_are_removed_once_unused(self):
+        proof = SimpleUploadedFile('proof.pdf', b'%PDF-1.4 proof')
+        for registration in self.rows[:2]:
+            proof.seek(0)
+            registration.payment_reference = SimpleUploadedFile('proof.pdf', proof.read())
+            registration.save()
+        name = WebinarRegistration.objects.get(pk=self.rows[0].pk).payment_reference.name
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.apply('delete', [self.rows[0].pk])
+        taskqueue.run_pending()
+        # The second registration uploaded the same bytes, so the file is still in use
+        self.assertTrue(default_storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.apply('delete', [self.rows[1].pk])
+        taskqueue.run_pending()
+        self.assertFalse(default_storage.exists(name))
+
+    def test_webinar_must_be_an_integer(self):
+        admin = make_user('admin', is_staff=True)
+        self.client.force_login(admin)
+        response = self.client.post(
+            reverse('registration_bulk_action'), json.dumps({'action': 'delete', 'webinar': 'all'}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(WebinarRegistration.objects.count(), 3)
@@ -4,12 +4,17 @@ from user.views import user_profile
 
 urlpatterns = [
     path('', index, name='dashboard'),
+    path('stats/', dashboard_stats, name='dashboard_stats'),
     path('blog/', admin_blog_management, name='blog_management'),
     path('webinar/', webinar, name='webinar_management'),
     path('user/', user, name='user_management'),
     path('user/<int:pk>', user_profile, name='user_profile'),
-    #path('webinar/registration/', admin_webinar_registrations, name='webinar_registration_management'),
+    path('webinar/registration/', admin_webinar_registrations, name='registration_management'),
+    path('webinar/<int:webinar_id>/registrations/', admin_webinar_registrations, name='webinar_registrations'),
     #path('registration/<int:pk>/', registration_detail, name='registration_detail'),
     path('registration/<int:pk>/edit/', registration_edit, name='registration_edit'),
+    path('registration/bulk/', registration_bulk_action, name='registration_bulk_action'),
+    path('export/<str:table>/', export_table, name='dashboard_export'),
+    path('import/<str:table>/', import_table, name='dashboard_import'),
     path('webinar/<int:pk>', webinar_reg, name='webinar_reg')
 ]
@@ -5,84 +5,216 @@ from django.urls import reverse_lazy
 from django.views.generic import CreateView, UpdateView, DeleteView, ListView
 from core.models import *
 from core.forms import *
+from django.db import transaction
 from django.db.models import Q, Count, Sum
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
+from django.http import HttpResponse, JsonResponse, Http404, StreamingHttpResponse
+from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
+from core.decorators import query_budget
+from core.querybudget import extend_budget
+from core.images import warm_profile
+from core.uploads import derivative_url
+from core.pagination import KeysetPaginator, InvalidCursor
+from core import throttle
+from core.registrations import hold_seat
+from . import bulk, exports, imports, stats
+from .filters import filter_blogs, filter_webinars, filter_users, filter_registrations, get_ordering
 from decimal import Decimal
 from user.models import User
+import json
 import uuid
 import random
 
+TABLE_PAGE_SIZE = 25
+
 # Create your views here.
 def is_admin(user):
     return user.is_staff or user.is_superuser
 
+def paginate_table(response, queryset, ordering):
+    """Fetch one keyset page of a dashboard table and the filters to carry across pages"""
+    paginator = KeysetPaginator(queryset, ordering, per_page=TABLE_PAGE_SIZE)
+    try:
+        page = paginator.page(response.GET.get('cursor'))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    params = response.GET.copy()
+    for key in ('cursor', 'format'):
+        params.pop(key, None)
+    return page, params.urlencode()
+
+def table_response(response, template, fragment_template, context, serialize):
+    """Render the full page, just the rows (?format=fragment) or JSON (?format=json)"""
+    page = context['page']
+    output = response.GET.get('format')
+    if output == 'json':
+        return JsonResponse({
+            'results': [serialize(obj) for obj in page],
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        })
+    if output == 'fragment':
+        fragment = HttpResponse(render_to_string(fragment_template, context, request=response))
+        fragment['X-Next-Cursor'] = page.next_cursor or ''
+        fragment['X-Previous-Cursor'] = page.previous_cursor or ''
+        return fragment
+    return render(response, template, context)
+
+def blog_row(blog):
+    return {
+        'id': blog.id,
+        'title': blog.title,
+        'status': blog.status,
+        'is_verified': blog.is_verified,
+        'author': blog.author.get_full_name() or blog.author.username,
+        'category': blog.category.name if blog.category else None,
+        'comments': blog.comment_count,
+        'created_at': blog.created_at,
+    }
+
+def webinar_row(webinar):
+    return {
+        'id': webinar.id,
+        'title': webinar.title,
+        'status': webinar.status,
+        'start_datetime': webinar.start_datetime,
+        'duration': webinar.duration,
+        'price': str(webinar.price),
+        'is_featured': webinar.is_featured,
+        'host': webinar.host.username if webinar.host else None,
+        'registrations': webinar.registration_count,
+    }
+
+def user_row(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'name': user.get_full_name(),
+        'email': user.email,
+        'is_staff': user.is_staff,
+        'is_superuser': user.is_superuser,
+        'is_active': user.is_active,
+        'date_joined': user.date_joined,
+        'last_login': user.last_login,
+    }
+
+def registration_row(registration):
+    return {
+        'id': registration.id,
+        'full_name': registration.full_name,
+        'email': registration.email,
+        'status': registration.status,
+        'webinar': registration.webinar_id,
+        'webinar_title': registration.webinar.title,
+        'payment_reference': registration.payment_reference.url if registration.payment_reference else None,
+        'payment_thumbnail': derivative_url(registration.payment_reference) or None,
+        'created_at': registration.created_at,
+    }
+
+@query_budget(4)
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def index(response):
-    context = {
-        'total_users': User.objects.count(),
-        'total_webinars': Webinar.objects.count(),
-        'total_blogs': Blog.objects.count(),
-        'published_blogs': Blog.objects.filter(is_verified=True).count(),
-    }
+    context = stats.get_stats()
+    context['registrations_per_day'] = stats.registrations_per_day()
+    context['registrations_peak'] = max([count for _, count in context['registrations_per_day']] + [1])
     return render(response, 'dashboard/admin_dashboard.html', context)
 
+@query_budget(4)
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+def dashboard_stats(response):
+    """Cached dashboard aggregates as JSON for periodic refresh"""
+    data = stats.get_stats()
+    data['revenue'] = str(data['revenue'])
+    data['registrations_per_day'] = [
+        {'date': day.isoformat(), 'count': count} for day, count in stats.registrations_per_day()
+    ]
+    data['throttle'] = throttle.counters()
+    return JsonResponse(data)
+
+@query_budget(6)
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def admin_blog_management(response):
-    blogs = Blog.objects.all().order_by('-created_at')
+    blogs = filter_blogs(Blog.objects.for_listing(), response.GET)
+    page, querystring = paginate_table(response, blogs, get_ordering('blog', response.GET))
+    warm_profile(page.object_list, 'cover', 'dashboard-table')
     categories = Category.objects.all()
     authors = User.objects.filter(blog__isnull=False).distinct()
     
     context = {
-        'blogs': blogs,
+        'blogs': page.object_list,
+        'page': page,
+        'querystring': querystring,
+        'filters': response.GET,
         'categories': categories,
         'authors': authors,
     }
-    return render(response, 'dashboard/admin_blog_management.html', context)
+    return table_response(response, 'dashboard/admin_blog_management.html', 'dashboard/partials/blog_cards.html', context, blog_row)
 
+@query_budget(6)
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def webinar(response):
-    webinars = Webinar.objects.all().order_by('-start_datetime')
+    webinars = filter_webinars(Webinar.objects.for_listing(), response.GET)
+    page, querystring = paginate_table(response, webinars, get_ordering('webinar', response.GET))
+    warm_profile(page.object_list, 'featured_image', 'dashboard-table')
     hosts = User.objects.filter(hosted_webinars__isnull=False).distinct()
     
     context = {
-        'webinars': webinars,
+        'webinars': page.object_list,
+        'page': page,
+        'querystring': querystring,
+        'filters': response.GET,
         'hosts': hosts,
     }
-    return render(response, 'dashboard/webinar_management.html', context)
+    return table_response(response, 'dashboard/webinar_management.html', 'dashboard/partials/webinar_cards.html', context, webinar_row)
 
+@query_budget(4)
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def user(response):
-    users = User.objects.all().order_by('-date_joined')
+    users = filter_users(User.objects.all(), response.GET)
+    page, querystring = paginate_table(response, users, get_ordering('user', response.GET))
     
     context = {
-        'users': users,
+        'users': page.object_list,
+        'page': page,
+        'querystring': querystring,
+        'filters': response.GET,
     }
-    return render(response, 'dashboard/user_management.html', context)
+    return table_response(response, 'dashboard/user_management.html', 'dashboard/partials/user_rows.html', context, user_row)
 
+@query_budget(6)
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def admin_webinar_registrations(response, webinar_id=None):
+    registrations = WebinarRegistration.objects.for_listing()
     if webinar_id:
         webinar = get_object_or_404(Webinar, id=webinar_id)
-        registrations = WebinarRegistration.objects.filter(webinar=webinar)
+        registrations = registrations.filter(webinar=webinar)
     else:
         webinar = None
-        registrations = WebinarRegistration.objects.all()
+    registrations = filter_registrations(registrations, response.GET)
+    page, querystring = paginate_table(response, registrations, get_ordering('registration', response.GET))
     
-    webinars = Webinar.objects.all()
+    webinars = Webinar.objects.only('id', 'title')
     
     context = {
-        'registrations': registrations,
+        'registrations': page.object_list,
+        'page': page,
+        'querystring': querystring,
+        'filters': response.GET,
         'webinars': webinars,
         'webinar': webinar,
     }
-    return render(response, 'dashboard/admin_webinar_registrations.html', context)
+    fragment_template = 'dashboard/partials/registration_rows.html' if response.GET.get('view') == 'table' else 'dashboard/partials/registration_cards.html'
+    return table_response(response, 'dashboard/admin_webinar_registrations.html', fragment_template, context, registration_row)
 
+@query_budget(6)
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def registration_edit(response, pk):
@@ -92,9 +224,14 @@ def registration_edit(response, pk):
     if response.method == 'POST':
         form = RegistrationForm(response.POST, instance=registration)
         if form.is_valid():
-            form.save()
-            messages.success(response, 'Registration updated successfully!')
-            return redirect('webinar_management')
+            with transaction.atomic():
+                seated = hold_seat(registration)
+                if seated:
+                    form.save()
+            if seated:
+                messages.success(response, 'Registration updated successfully!')
+                return redirect('webinar_management')
+            form.add_error('status', 'This webinar is full. Free a seat before moving this registration into one.')
     else:
         form = RegistrationForm(instance=registration)
     
@@ -103,10 +240,127 @@ def registration_edit(response, pk):
         'registration': registration
     })
 
+@query_budget(4 + bulk.QUERIES_PER_CHUNK)
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+@require_POST
+def registration_bulk_action(response):
+    """Confirm, cancel or delete many registrations in one request.
+
+    Takes JSON ``{"action": ..., "ids": [...]}``, or ``{"action": ..., "webinar": id}``
+    (optionally with ``"status"``) to act on every matching registration of a webinar.
+    """
+    try:
+        payload = json.loads(response.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    action = payload.get('action')
+    if action not in bulk.ACTIONS:
+        return JsonResponse({'error': f'Unknown action {action!r}'}, status=400)
+
+    if payload.get('webinar') is not None:
+        try:
+            webinar_id = int(payload['webinar'])
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'webinar must be an integer'}, status=400)
+        registrations = WebinarRegistration.objects.filter(webinar_id=webinar_id)
+        if payload.get('status'):
+            registrations = registrations.filter(status=payload['status'])
+        ids = list(registrations.values_list('pk', flat=True))
+    else:
+        try:
+            ids = [int(pk) for pk in payload.get('ids', [])]
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'ids must be a list of integers'}, status=400)
+
+    results = bulk.apply(action, ids)
+    chunks = -(-len(set(ids)) // bulk.CHUNK_SIZE)
+    extend_budget(response, bulk.QUERIES_PER_CHUNK * max(chunks - 1, 0))
+    return JsonResponse({
+        'action': action,
+        'counts': {outcome: len(pks) for outcome, pks in results.items()},
+        'results': results,
+    })
+
+@query_budget(5)
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def webinar_reg(response, pk):
     webinar = get_object_or_404(Webinar, id=pk)
     registrations = WebinarRegistration.objects.filter(webinar=webinar)
 
-    return render(response, 'dashboard/webinar_details.html', {'webinar':webinar, 'registrations':registrations})
\ No newline at end of file
+    return render(response, 'dashboard/webinar_details.html', {'webinar':webinar, 'registrations':registrations})
+
+# table -> (base queryset, dashboard filter, ordering table, columns)
+EXPORTS = {
+    'registrations': (WebinarRegistration.objects.all, filter_registrations, 'registration', exports.REGISTRATION_COLUMNS),
+    'users': (User.objects.all, filter_users, 'user', exports.USER_COLUMNS),
+    'blogs': (Blog.objects.all, filter_blogs, 'blog', exports.BLOG_COLUMNS),
+}
+
+@query_budget(3)
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+def export_table(response, table):
+    """Stream a dashboard table as CSV or XLSX (?format=xlsx), honouring the table's filters"""
+    if table not in EXPORTS:
+        raise Http404('Unknown export')
+    base, apply_filters, ordering, columns = EXPORTS[table]
+    queryset = apply_filters(base(), response.GET).order_by(*get_ordering(ordering, response.GET))
+    filename = f'{table}-{timezone.localdate().isoformat()}'
+
+    if response.GET.get('format') == 'xlsx':
+        stream = StreamingHttpResponse(
+            exports.stream_xlsx(queryset, columns, sheet_name=table.title()),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+        filename += '.xlsx'
+    else:
+        stream = StreamingHttpResponse(exports.stream_csv(queryset, columns), content_type='text/csv; charset=utf-8')
+        filename += '.csv'
+    stream['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Ask nginx not to buffer, so the download starts with the first rows
+    stream['X-Accel-Buffering'] = 'no'
+    return stream
+
+IMPORTS = {
+    'registrations': imports.import_registrations,
+    'speakers': imports.import_speakers,
+}
+# Where the form posts from; the report is shown there after an import
+IMPORT_PAGES = {
+    'registrations': 'registration_management',
+    'speakers': 'webinar_management',
+}
+
+@query_budget(4 + imports.QUERIES_PER_CHUNK)
+@login_required(login_url='login')
+@user_passes_test(is_admin)
+@require_POST
+def import_table(response, table):
+    """Import an uploaded CSV of registrations or speakers; JSON report with ?format=json"""
+    if table not in IMPORTS:
+        raise Http404('Unknown import')
+    upload = response.FILES.get('file')
+    if upload is None:
+        return JsonResponse({'error': 'Upload a CSV file as "file"'}, status=400)
+
+    options = {'update': response.POST.get('update') == 'on'}
+    if table == 'registrations' and response.POST.get('webinar', '').isdigit():
+        options['webinar_id'] = int(response.POST['webinar'])
+    report = IMPORTS[table](upload, **options)
+    rows = report.created + report.updated + report.skipped + report.failed
+    extend_budget(response, imports.QUERIES_PER_CHUNK * max(-(-rows // imports.IMPORT_CHUNK_SIZE) - 1, 0))
+
+    if response.GET.get('format') == 'json':
+        return JsonResponse(report.as_dict())
+    messages.success(response, f'Imported {report.created} new and {report.updated} updated {table}; {report.skipped} skipped.')
+    if report.waitlisted:
+        messages.warning(response, f'{report.waitlisted} registrations were waitlisted because their webinar is full.')
+    for error in report.errors[:5]:
+        messages.warning(response, f"Line {error['line']}: {error['error']}")
+    if report.failed > 5:
+        messages.warning(response, f'{report.failed - 5} more rows had errors.')
+    if 'webinar_id' in options:
+        return redirect('webinar_registrations', webinar_id=options['webinar_id'])
+    return redirect(IMPORT_PAGES[table])
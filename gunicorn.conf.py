@@ -0,0 +1,39 @@
+"""Gunicorn deployment profiles; gunicorn reads this file from the working directory.
+
+WSGI, sync views (default):
+    gunicorn mysite.wsgi
+
+ASGI, async public pages (core.async_views):
+    ASYNC_VIEWS=1 GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn mysite.asgi
+
+Plain uvicorn for development:
+    ASYNC_VIEWS=1 uvicorn mysite.asgi:application --reload
+
+Under ASGI each worker is one process running an event loop. The async
+views await their queries and cache reads, and the remaining sync code runs
+in a small thread pool per request. Fewer workers are needed than sync
+ones for the same concurrency. Keep CONN_MAX_AGE at 0 under ASGI, as
+Django advises; put a pooler such as PgBouncer in front of PostgreSQL
+instead of relying on persistent connections. Before switching, compare both paths with
+`manage.py benchmark_views` against a copy of production data.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+
+if worker_class == 'sync':
+    # Each request holds a worker until it finishes
+    workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+else:
+    # One event loop per core is enough; it interleaves requests while they wait
+    workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+# Recycle workers now and then so slow leaks in dependencies can't build up
+max_requests = 1000
+max_requests_jitter = 100
+accesslog = '-'
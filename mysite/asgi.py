@@ -3,6 +3,9 @@ ASGI config for mysite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Set ASYNC_VIEWS=1 when serving it so the public pages use core.async_views;
+gunicorn.conf.py has the uvicorn worker setup.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -55,6 +55,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -95,6 +96,74 @@ DATABASES = {
 }
 
 
+# Route the public read pages to core.async_views; turn on when serving mysite.asgi (see gunicorn.conf.py)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+
+
+# Cache
+# Swap for Redis or Memcached in production so workers share cached values
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mindcraft',
+        # Per-user keys (throttle buckets, attendance, registered webinars) outgrow the default 300
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+DASHBOARD_STATS_TIMEOUT = 60 * 60 * 24
+
+# 'cloudinary' or 'local' (Pillow derivatives under MEDIA_ROOT, for offline dev and tests)
+IMAGE_RENDERER = os.environ.get('IMAGE_RENDERER') or ('cloudinary' if os.environ.get('CLOUDINARY_URL') else 'local')
+
+# Where uploads wait for the worker (core.uploads.detach_uploads); the web and worker
+# processes must both reach it, so it is the media storage rather than local disk
+UPLOAD_STASH_STORAGE = 'cloudinary_storage.storage.RawMediaCloudinaryStorage' if os.environ.get('CLOUDINARY_URL') else None
+
+# Public pages and fragments; writes purge them through core.cache.register
+PAGE_CACHE_TIMEOUT = 60 * 15
+
+# Background tasks (core.taskqueue), run by `manage.py runworker`
+TASKS_ALWAYS_EAGER = os.environ.get('TASKS_ALWAYS_EAGER') == '1'
+TASK_MAX_ATTEMPTS = 5
+TASK_TIMEOUT = 300
+TASK_RETRY_BACKOFF = 30
+
+# Registration emails (core.notifications); use the locmem or file backend in tests
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS') == '1'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'MindCraft ThinkSpace <no-reply@mindcraft.local>')
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+NOTIFICATION_BATCH_SIZE = 100
+EMAIL_RATE_LIMIT = 10
+WEBINAR_REMINDER_HOURS = 24
+# Per-user cache of registered webinar IDs, dropped whenever a registration changes
+REGISTERED_WEBINARS_TIMEOUT = 60 * 60
+
+# Write throttling (core.throttle): token buckets per IP and per user, kept in the cache
+THROTTLE_RATES = {
+    'comment': '5/min',
+    'registration': '10/hour',
+    'login': '10/min',
+    'signup': '5/hour',
+}
+THROTTLE_DUPLICATE_WINDOW = 60
+# Reverse proxies that append to X-Forwarded-For in front of the app. THIS MUST MATCH THE DEPLOYMENT:
+# at 0 behind a proxy every client shares the proxy's address and therefore one IP bucket, so the whole
+# site gets 10 logins a minute; set too high and clients can spoof their address. Render (RENDER=true in
+# its environment) runs one proxy layer; override with THROTTLE_PROXY_COUNT elsewhere.
+THROTTLE_PROXY_COUNT = int(os.environ.get('THROTTLE_PROXY_COUNT', 1 if os.environ.get('RENDER') else 0))
+
+# Live attendance (core.attendance): browsers ping every heartbeat, the buffer is written every flush interval
+ATTENDANCE_HEARTBEAT_INTERVAL = 30
+ATTENDANCE_FLUSH_INTERVAL = 15
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -154,6 +223,12 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'user.User'
 
+# Query budgets (see core.middleware.QueryBudgetMiddleware)
+QUERY_BUDGET_ENABLED = True
+QUERY_BUDGET_RAISE = False  # Set True in tests to fail over-budget views
+QUERY_BUDGET_N_PLUS_ONE_THRESHOLD = 3
+QUERY_BUDGET_TRACK_TEMPLATES = DEBUG
+
 CSRF_TRUSTED_ORIGINS = [
     'https://thinkspace-sgv3.onrender.com/',
     'https://*.yourdomain.com',
@@ -3,6 +3,7 @@ from django.contrib.auth.models import AbstractUser
 from django.core.validators import RegexValidator
 from datetime import date
 from django_countries.fields import CountryField
+from core.uploads import UploadValidator
 
 # Create your models here.
 class User(AbstractUser):
@@ -24,7 +25,7 @@ class User(AbstractUser):
         validators=[RegexValidator(regex=r'^\+?1?\d{9,15}$', message="Phone number must be entered in the format: '+999999999'. Up to 15 digits allowed.")],
         blank=True, null=True
     )
-    profile_picture = models.ImageField(upload_to='profile_pictures', blank=True)
+    profile_picture = models.ImageField(upload_to='profile_pictures', blank=True, validators=[UploadValidator()])
     gender = models.CharField(max_length=20, choices=gender_choices)
     instagram = models.URLField(blank=True, null=True)
     twitter = models.URLField(blank=True, null=True)
@@ -35,6 +36,12 @@ class User(AbstractUser):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['date_joined', 'id']),
+            models.Index(fields=['is_staff', 'date_joined']),
+        ]
+
     def __str__(self):
         return self.username
     
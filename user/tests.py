@@ -1,3 +1,28 @@
-from django.test import TestCase
+import tempfile
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.testing import QueryBudgetTestMixin
+from core.tests import make_user
+
+
+@override_settings(IMAGE_RENDERER='local', MEDIA_ROOT=tempfile.mkdtemp())
+class ViewBudgetTests(QueryBudgetTestMixin, TestCase):
+    def assertWithinBudget(self, path):
+        response, _ = self.assertViewWithinBudget(path)
+        self.assertEqual(response.status_code, 200)
+
+    def test_account_forms(self):
+        for name in ('login', 'register', 'staff_register'):
+            self.assertWithinBudget(reverse(name))
+
+    def test_profile_pages(self):
+        user = make_user()
+        for n in range(3):
+            make_user(f'member{n}')
+        self.client.force_login(user)
+        self.assertWithinBudget(reverse('profile'))
+        self.assertWithinBudget(reverse('update_profile'))
+        self.assertWithinBudget('/user/list/')
+        self.assertWithinBudget(reverse('user_profile', args=[user.pk]))
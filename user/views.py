@@ -7,8 +7,12 @@ from .models import *
 from django.views.generic import ListView, DetailView
 from .forms import UserForm, UserProfileForm
 from core.models import WebinarRegistration
+from core.decorators import query_budget
+from core.throttle import throttle
 
 # Create your views here.
+@query_budget(8)
+@throttle('signup')
 def register(response):
 
     if response.method == 'POST':
@@ -41,6 +45,8 @@ def register(response):
     else:
         return render(response, 'registration/register.html')
 
+@query_budget(8)
+@throttle('signup')
 def staff_register(response):
 
     if response.method == 'POST':
@@ -81,6 +87,8 @@ def staff_register(response):
     else:
         return render(response, 'registration/staff_reg.html')
 
+@query_budget(6)
+@throttle('login')
 def login(response):
     if response.method == 'POST':
         username = response.POST['username']
@@ -100,16 +108,18 @@ def login(response):
     
     return render(response, 'registration/login.html')
 
+@query_budget(4)
 @login_required(login_url='login')
 def logout(response):
     auth.logout(response)
     return redirect('login')
 
+@query_budget(4)
 @login_required(login_url='login')
 def profile(response):
     user = response.user
     # Get user's registered webinars
-    registered_webinars = WebinarRegistration.objects.filter(email=user.email).select_related('webinar')
+    registered_webinars = WebinarRegistration.objects.filter(user=user).select_related('webinar')
     
     context = {
         'user': user,
@@ -118,6 +128,7 @@ def profile(response):
     }
     return render(response, 'user/profile.html', context)
 
+@query_budget(6)
 @login_required(login_url='login')
 def edit_profile(response):
     if response.method == 'POST':
@@ -139,7 +150,9 @@ class UserListView(ListView):
     model = User
     template_name = 'user/user_list.html'
     ordering = ['-date_joined']
+    query_budget = 4
 
+@query_budget(4)
 def user_profile(response, pk):
     user = User.objects.get(id=pk)
     